@@ -0,0 +1,40 @@
+"""Add analytics rollup table
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'email_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('grain', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('main_category', sa.String(), nullable=False, server_default=''),
+        sa.Column('sub_category', sa.String(), nullable=False, server_default=''),
+        sa.Column('urgency', sa.String(), nullable=False, server_default=''),
+        sa.Column('sentiment_bucket', sa.String(), nullable=False),
+        sa.Column('email_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sentiment_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('sentiment_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('response_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('response_time_sum', sa.Float(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('grain', 'bucket_start', 'main_category', 'sub_category',
+                            'urgency', 'sentiment_bucket', name='uq_email_rollups_key')
+    )
+    op.create_index('ix_email_rollups_grain_bucket', 'email_rollups', ['grain', 'bucket_start'])
+
+def downgrade():
+    op.drop_index('ix_email_rollups_grain_bucket', table_name='email_rollups')
+    op.drop_table('email_rollups')
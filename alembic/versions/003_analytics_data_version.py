@@ -0,0 +1,27 @@
+"""Add analytics data-version counter
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    version_table = op.create_table(
+        'analytics_data_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(version_table, [{'id': 1, 'version': 0}])
+
+def downgrade():
+    op.drop_table('analytics_data_version')
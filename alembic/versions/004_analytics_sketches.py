@@ -0,0 +1,30 @@
+"""Add analytics sketch table
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'analytics_sketches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('grain', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('grain', 'bucket_start', 'kind', name='uq_analytics_sketches_key')
+    )
+
+def downgrade():
+    op.drop_table('analytics_sketches')
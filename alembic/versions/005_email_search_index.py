@@ -0,0 +1,71 @@
+"""Add full-text search index on emails
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+SQLITE_UPGRADE = [
+    """CREATE VIRTUAL TABLE emails_fts USING fts5(
+        subject, body, sender_email,
+        content='emails', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, new.body, new.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, old.body, old.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_au AFTER UPDATE OF subject, body, sender_email ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, old.body, old.sender_email);
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, new.body, new.sender_email);
+    END""",
+    "INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS emails_fts_au",
+    "DROP TRIGGER IF EXISTS emails_fts_ad",
+    "DROP TRIGGER IF EXISTS emails_fts_ai",
+    "DROP TABLE IF EXISTS emails_fts",
+]
+
+POSTGRES_UPGRADE = [
+    """ALTER TABLE emails ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(sender_email, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX ix_emails_search_vector ON emails USING gin (search_vector)",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_emails_search_vector",
+    "ALTER TABLE emails DROP COLUMN IF EXISTS search_vector",
+]
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    statements = {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE}.get(dialect, [])
+    for statement in statements:
+        op.execute(statement)
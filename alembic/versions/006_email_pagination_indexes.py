@@ -0,0 +1,22 @@
+"""Add keyset pagination indexes on emails
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_emails_status_received_at_id', 'emails', ['status', 'received_at', 'id'])
+    op.create_index('ix_emails_received_at_id', 'emails', ['received_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_emails_received_at_id', table_name='emails')
+    op.drop_index('ix_emails_status_received_at_id', table_name='emails')
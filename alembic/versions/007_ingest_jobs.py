@@ -0,0 +1,34 @@
+"""Add ingest job table
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('accepted', sa.Integer(), nullable=True),
+        sa.Column('rejected', sa.Integer(), nullable=True),
+        sa.Column('items', sa.JSON(), nullable=True),
+        sa.Column('email_ids', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+def downgrade():
+    op.drop_table('ingest_jobs')
@@ -0,0 +1,34 @@
+"""Add work-claim lease columns to emails
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # ADD VALUE cannot run inside a transaction block on older Postgres
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE email_status ADD VALUE IF NOT EXISTS 'processing'")
+
+    op.add_column('emails', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('emails', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.add_column('emails', sa.Column('claim_count', sa.Integer(), nullable=True, server_default='0'))
+    op.create_index('ix_emails_status_lease_expires_at', 'emails', ['status', 'lease_expires_at'])
+
+def downgrade():
+    op.execute("UPDATE emails SET status = 'new' WHERE status = 'processing'")
+    op.drop_index('ix_emails_status_lease_expires_at', table_name='emails')
+    op.drop_column('emails', 'claim_count')
+    op.drop_column('emails', 'lease_expires_at')
+    op.drop_column('emails', 'lease_owner')
+    # Postgres cannot drop an enum value; 'processing' stays in email_status
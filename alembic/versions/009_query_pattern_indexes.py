@@ -0,0 +1,39 @@
+"""Add composite and partial indexes for analytics, pending and responses queries
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_emails_received_at_main_category', 'emails', ['received_at', 'main_category'])
+    op.create_index('ix_emails_main_category_sub_category_received_at', 'emails',
+                    ['main_category', 'sub_category', 'received_at'])
+    op.create_index('ix_responses_email_id_created_at', 'responses', ['email_id', 'created_at'])
+
+    # The literals status_literal(EmailStatus.NEW) renders for the model's status type:
+    # Postgres email_status labels are lowercase (see 001); SQLite stores enum names
+    if op.get_bind().dialect.name == 'postgresql':
+        new_status, not_archived = "status = 'new'", "archived = false"
+    else:
+        new_status, not_archived = "status = 'NEW'", "archived = 0"
+    op.create_index('ix_emails_new_received_at_id', 'emails', ['received_at', 'id'],
+                    postgresql_where=sa.text(new_status), sqlite_where=sa.text(new_status))
+    op.create_index('ix_emails_hot_received_at', 'emails', ['received_at'],
+                    postgresql_where=sa.text(not_archived), sqlite_where=sa.text(not_archived))
+
+def downgrade():
+    op.drop_index('ix_emails_hot_received_at', table_name='emails')
+    op.drop_index('ix_emails_new_received_at_id', table_name='emails')
+    op.drop_index('ix_responses_email_id_created_at', table_name='responses')
+    op.drop_index('ix_emails_main_category_sub_category_received_at', table_name='emails')
+    op.drop_index('ix_emails_received_at_main_category', table_name='emails')
@@ -0,0 +1,157 @@
+"""Add email previews and read FTS bodies through a decoding view
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import re
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+PREVIEW_CHARS = 160
+
+# Compressed SQLite bodies start with a two-byte codec header (app/services/body_storage.py)
+ZLIB_HEADER = b"\x00z"
+ZSTD_HEADER = b"\x00s"
+
+FTS_TRIGGERS_DOWN = [
+    "DROP TRIGGER IF EXISTS emails_fts_au",
+    "DROP TRIGGER IF EXISTS emails_fts_ad",
+    "DROP TRIGGER IF EXISTS emails_fts_ai",
+    "DROP TABLE IF EXISTS emails_fts",
+]
+
+SQLITE_UPGRADE = FTS_TRIGGERS_DOWN + [
+    """CREATE VIEW emails_fts_content AS
+        SELECT id, subject, email_body(body) AS body, sender_email FROM emails""",
+    """CREATE VIRTUAL TABLE emails_fts USING fts5(
+        subject, body, sender_email,
+        content='emails_fts_content', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, email_body(new.body), new.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, email_body(old.body), old.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_au AFTER UPDATE OF subject, body, sender_email ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, email_body(old.body), old.sender_email);
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, email_body(new.body), new.sender_email);
+    END""",
+    "INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')",
+]
+
+# The 005 objects, over the plain emails table
+SQLITE_DOWNGRADE = FTS_TRIGGERS_DOWN + [
+    "DROP VIEW IF EXISTS emails_fts_content",
+    """CREATE VIRTUAL TABLE emails_fts USING fts5(
+        subject, body, sender_email,
+        content='emails', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, new.body, new.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, old.body, old.sender_email);
+    END""",
+    """CREATE TRIGGER emails_fts_au AFTER UPDATE OF subject, body, sender_email ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, old.body, old.sender_email);
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, new.body, new.sender_email);
+    END""",
+    "INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_PREVIEW_BACKFILL = f"""UPDATE emails SET preview = CASE
+        WHEN length(btrim(regexp_replace(body, '\\s+', ' ', 'g'))) <= {PREVIEW_CHARS}
+        THEN btrim(regexp_replace(body, '\\s+', ' ', 'g'))
+        ELSE rtrim(left(btrim(regexp_replace(body, '\\s+', ' ', 'g')), {PREVIEW_CHARS})) || '…'
+    END
+    WHERE body IS NOT NULL"""
+
+# lz4 TOAST compression (Postgres 14+) is faster to read than the default pglz
+POSTGRES_LZ4 = """DO $$ BEGIN
+    IF current_setting('server_version_num')::int >= 140000 THEN
+        ALTER TABLE emails ALTER COLUMN body SET COMPRESSION lz4;
+    END IF;
+EXCEPTION WHEN others THEN NULL;
+END $$"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+def _decode(value):
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value.startswith(ZLIB_HEADER):
+        return zlib.decompress(value[2:]).decode("utf-8")
+    if value.startswith(ZSTD_HEADER):
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(value[2:]).decode("utf-8")
+    return value.decode("utf-8", errors="replace")
+
+def _preview(body):
+    collapsed = _WHITESPACE.sub(" ", body).strip()
+    if len(collapsed) <= PREVIEW_CHARS:
+        return collapsed
+    return collapsed[:PREVIEW_CHARS].rstrip() + "…"
+
+def _register_email_body(bind):
+    # The app registers this on every connection; the migration's connection needs it too
+    bind.connection.create_function("email_body", 1, _decode, deterministic=True)
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('emails', sa.Column('preview', sa.String(), nullable=True))
+    if bind.dialect.name == 'sqlite':
+        _register_email_body(bind)
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+        emails = sa.table('emails', sa.column('id'), sa.column('body'), sa.column('preview'))
+        rows = bind.execute(sa.select(emails.c.id, emails.c.body).where(emails.c.body.isnot(None))).all()
+        if rows:
+            bind.execute(
+                emails.update().where(emails.c.id == sa.bindparam('row_id'))
+                .values(preview=sa.bindparam('new_preview')),
+                [{'row_id': row_id, 'new_preview': _preview(_decode(body))} for row_id, body in rows],
+            )
+    elif bind.dialect.name == 'postgresql':
+        op.execute(POSTGRES_PREVIEW_BACKFILL)
+        op.execute(POSTGRES_LZ4)
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # Bodies go back to plain text before the old triggers, which read them as-is
+        emails = sa.table('emails', sa.column('id'), sa.column('body'))
+        rows = bind.execute(
+            sa.select(emails.c.id, emails.c.body).where(sa.text("typeof(body) = 'blob'"))
+        ).all()
+        if rows:
+            bind.execute(sa.text("DROP TRIGGER IF EXISTS emails_fts_au"))
+            bind.execute(
+                emails.update().where(emails.c.id == sa.bindparam('row_id'))
+                .values(body=sa.bindparam('new_body')),
+                [{'row_id': row_id, 'new_body': _decode(body)} for row_id, body in rows],
+            )
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    op.drop_column('emails', 'preview')
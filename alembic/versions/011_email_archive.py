@@ -0,0 +1,114 @@
+"""Add archive tables for emails and responses
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+POSTGRES_UPGRADE = [
+    # Same columns, types and defaults as the hot tables; ids are copied, never generated
+    "CREATE TABLE emails_archive (LIKE emails INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+    "ALTER TABLE emails_archive DROP COLUMN IF EXISTS search_vector",
+    "ALTER TABLE emails_archive ALTER COLUMN id DROP DEFAULT",
+    "ALTER TABLE emails_archive ADD PRIMARY KEY (id)",
+    "CREATE TABLE responses_archive (LIKE responses INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+    "ALTER TABLE responses_archive ALTER COLUMN id DROP DEFAULT",
+    "ALTER TABLE responses_archive ADD PRIMARY KEY (id)",
+]
+
+def _create_sqlite_tables():
+    op.create_table(
+        'emails_archive',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=False),
+        sa.Column('message_id', sa.String(), nullable=True),
+        sa.Column('thread_id', sa.String(), nullable=True),
+        sa.Column('sender_email', sa.String(), nullable=True),
+        sa.Column('sender_name', sa.String(), nullable=True),
+        sa.Column('recipient_email', sa.String(), nullable=True),
+        sa.Column('subject', sa.String(), nullable=True),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('preview', sa.String(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('main_category', sa.String(), nullable=True),
+        sa.Column('sub_category', sa.String(), nullable=True),
+        sa.Column('classification_confidence', sa.Float(), nullable=True),
+        sa.Column('keywords', sa.JSON(), nullable=True),
+        sa.Column('sentiment_score', sa.Float(), nullable=True),
+        sa.Column('urgency', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('lease_owner', sa.String(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('claim_count', sa.Integer(), nullable=True),
+        sa.Column('customer_id', sa.Integer(), nullable=True),
+        sa.Column('is_reply', sa.Boolean(), nullable=True),
+        sa.Column('additional_data', sa.JSON(), nullable=True),
+        sa.Column('archived', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'responses_archive',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=False),
+        sa.Column('email_id', sa.Integer(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('model_version', sa.String(), nullable=True),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+        sa.Column('completion_tokens', sa.Integer(), nullable=True),
+        sa.Column('total_tokens', sa.Integer(), nullable=True),
+        sa.Column('response_time_ms', sa.Integer(), nullable=True),
+        sa.Column('is_sent', sa.Boolean(), nullable=True),
+        sa.Column('send_attempts', sa.Integer(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('was_helpful', sa.Boolean(), nullable=True),
+        sa.Column('customer_replied', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for statement in POSTGRES_UPGRADE:
+            op.execute(statement)
+    else:
+        _create_sqlite_tables()
+    op.create_index('ix_emails_archive_received_at', 'emails_archive', ['received_at'])
+    op.create_index('ix_emails_archive_sender_email', 'emails_archive', ['sender_email'])
+    op.create_index('ix_emails_archive_thread_id', 'emails_archive', ['thread_id'])
+    op.create_index('ix_responses_archive_email_id', 'responses_archive', ['email_id'])
+
+def downgrade():
+    # Archived rows go back to the hot tables first, so nothing is lost
+    op.execute("UPDATE emails SET archived = false WHERE archived")
+    op.execute("""INSERT INTO emails (id, message_id, thread_id, sender_email, sender_name,
+        recipient_email, subject, body, preview, received_at, processed_at, main_category,
+        sub_category, classification_confidence, keywords, sentiment_score, urgency, status,
+        error_message, lease_owner, lease_expires_at, claim_count, customer_id, is_reply,
+        additional_data, archived)
+        SELECT id, message_id, thread_id, sender_email, sender_name,
+        recipient_email, subject, body, preview, received_at, processed_at, main_category,
+        sub_category, classification_confidence, keywords, sentiment_score, urgency, status,
+        error_message, lease_owner, lease_expires_at, claim_count, customer_id, is_reply,
+        additional_data, false FROM emails_archive""")
+    op.execute("""INSERT INTO responses (id, email_id, content, created_at, sent_at, model_version,
+        prompt_tokens, completion_tokens, total_tokens, response_time_ms, is_sent, send_attempts,
+        error_message, was_helpful, customer_replied)
+        SELECT id, email_id, content, created_at, sent_at, model_version,
+        prompt_tokens, completion_tokens, total_tokens, response_time_ms, is_sent, send_attempts,
+        error_message, was_helpful, customer_replied FROM responses_archive""")
+    op.drop_index('ix_responses_archive_email_id', table_name='responses_archive')
+    op.drop_index('ix_emails_archive_thread_id', table_name='emails_archive')
+    op.drop_index('ix_emails_archive_sender_email', table_name='emails_archive')
+    op.drop_index('ix_emails_archive_received_at', table_name='emails_archive')
+    op.drop_table('responses_archive')
+    op.drop_table('emails_archive')
@@ -0,0 +1,50 @@
+"""Index emails by thread and backfill thread ids
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+# Passes over reply chains; each pass moves replies one level closer to their root
+MAX_PASSES = 10
+PARENTS = "SELECT message_id, thread_id FROM emails UNION ALL SELECT message_id, thread_id FROM emails_archive"
+
+def upgrade():
+    op.drop_index('ix_emails_thread_id', table_name='emails')
+    op.create_index('ix_emails_thread_id_received_at', 'emails', ['thread_id', 'received_at'])
+
+    bind = op.get_bind()
+    # Emails without a thread start their own
+    for table in ('emails', 'emails_archive'):
+        bind.execute(sa.text(f"UPDATE {table} SET thread_id = message_id WHERE thread_id IS NULL"))
+    # thread_id used to hold In-Reply-To (the parent); replace it with the parent's thread.
+    # Archived emails keep their thread ids too, and a parent may sit in either table.
+    for _ in range(MAX_PASSES):
+        moved = 0
+        for table in ('emails', 'emails_archive'):
+            moved += bind.execute(sa.text(f"""
+                UPDATE {table} SET thread_id = (
+                    SELECT parent.thread_id FROM ({PARENTS}) parent
+                    WHERE parent.message_id = {table}.thread_id LIMIT 1
+                )
+                WHERE EXISTS (
+                    SELECT 1 FROM ({PARENTS}) parent
+                    WHERE parent.message_id = {table}.thread_id AND parent.thread_id <> {table}.thread_id
+                )
+            """)).rowcount
+        if not moved:
+            break
+
+def downgrade():
+    # Backfilled thread ids are left in place
+    op.drop_index('ix_emails_thread_id_received_at', table_name='emails')
+    op.create_index('ix_emails_thread_id', 'emails', ['thread_id'])
@@ -0,0 +1,30 @@
+"""Add cleaned email bodies and token counts
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+TABLES = ('emails', 'emails_archive')
+
+def upgrade():
+    # Filled on write; older rows with `python -m app.services.body_extraction clean`
+    for table in TABLES:
+        op.add_column(table, sa.Column('clean_body', sa.Text(), nullable=True))
+        op.add_column(table, sa.Column('body_tokens', sa.Integer(), nullable=True))
+        op.add_column(table, sa.Column('clean_body_tokens', sa.Integer(), nullable=True))
+
+def downgrade():
+    for table in TABLES:
+        op.drop_column(table, 'clean_body_tokens')
+        op.drop_column(table, 'body_tokens')
+        op.drop_column(table, 'clean_body')
@@ -0,0 +1,22 @@
+"""Drop the status/received_at index superseded by the pending-queue partial index
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # ix_emails_new_received_at_id (009) serves the pending queue and claims; with
+    # both present the planner could keep using this one and leave the partial index idle
+    op.drop_index('ix_emails_status_received_at_id', table_name='emails')
+
+def downgrade():
+    op.create_index('ix_emails_status_received_at_id', 'emails', ['status', 'received_at', 'id'])
@@ -1,158 +1,329 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case, extract
+from sqlalchemy import func, case, extract, select
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 
-from ...database import get_db
+from ...database import AsyncSessionLocal
 from ...models.email import Email, Response, EmailStatus, UrgencyLevel
 from ...schemas.email import EmailAnalytics, DateRange
+from ...services import analytics_cache, archive, export, rollups, sketch_rollups, time_buckets
+from ...services.live_metrics import live_metrics
+from ...services.read_routing import get_read_db
 
 router = APIRouter()
 
+def _default_range(start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Fill in the last 30 days, snapped to whole hours so rollups can serve it."""
+    if not end_date:
+        end_date = rollups.bucket_start(datetime.utcnow(), "hour") + timedelta(hours=1)
+    if not start_date:
+        start_date = end_date - timedelta(days=30)
+    return start_date, end_date
+
+def _use_rollups(start_date: datetime, end_date: datetime, include_archived: bool) -> bool:
+    # Rollups cover both tiers; hot-only reads may use them only where nothing is archived yet
+    return (
+        rollups.rollups_enabled()
+        and rollups.is_hour_aligned(start_date)
+        and rollups.is_hour_aligned(end_date)
+        and (include_archived or start_date >= archive.horizon())
+    )
+
+INCLUDE_ARCHIVED = Query(default=False, description="Also cover emails moved to the archive")
+
+def _hot_sketch_range(start_date: datetime, end_date: datetime, include_archived: bool):
+    """Sketches cover both tiers; a hot-only read starts at the archive horizon."""
+    if not include_archived:
+        start_date = max(start_date, rollups.bucket_start(archive.horizon(), "hour") + timedelta(hours=1))
+    return start_date, end_date
+
 @router.get("/summary", response_model=Dict)
 async def get_analytics_summary(
+    request: Request,
     start_date: Optional[datetime] = Query(default=None),
     end_date: Optional[datetime] = Query(default=None),
-    db: Session = Depends(get_db)
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get summary analytics for the specified date range."""
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.utcnow()
+    start_date, end_date = _default_range(start_date, end_date)
+    params = analytics_cache.normalize_params({
+        "start_date": start_date,
+        "end_date": end_date,
+        "include_archived": include_archived,
+    })
+    return await analytics_cache.cached_response(
+        request, db, "summary", params, lambda session: _summary(session, **params)
+    )
+
+def _summary(db: Session, start_date: datetime, end_date: datetime,
+             include_archived: bool = False) -> Dict:
+    if _use_rollups(start_date, end_date, include_archived):
+        return rollups.summary_from_rollups(db, start_date, end_date)
+
+    emails, responses, tier = archive.sources(include_archived)
+    in_range = [emails.received_at.between(start_date, end_date), *tier]
 
     # Get basic metrics
-    total_emails = db.query(func.count(Email.id)).filter(
-        Email.received_at.between(start_date, end_date)
-    ).scalar()
+    total_emails = db.query(func.count(emails.id)).filter(*in_range).scalar()
 
+    elapsed = time_buckets.seconds_between(emails.received_at, responses.created_at,
+                                           db.get_bind().dialect.name)
     avg_response_time = db.query(
-        func.avg(Response.created_at - Email.received_at)
-    ).join(Email).filter(
-        Email.received_at.between(start_date, end_date)
+        func.avg(elapsed)
+    ).select_from(responses).join(emails, responses.email_id == emails.id).filter(
+        *in_range
     ).scalar()
 
     # Get category distribution
     category_dist = db.query(
-        Email.main_category,
-        func.count(Email.id).label('count')
-    ).filter(
-        Email.received_at.between(start_date, end_date)
-    ).group_by(Email.main_category).all()
+        emails.main_category,
+        func.count(emails.id).label('count')
+    ).filter(*in_range).group_by(emails.main_category).all()
 
     # Get sentiment distribution
     sentiment_dist = db.query(
         case(
-            (Email.sentiment_score > 0.3, 'positive'),
-            (Email.sentiment_score < -0.3, 'negative'),
+            (emails.sentiment_score > 0.3, 'positive'),
+            (emails.sentiment_score < -0.3, 'negative'),
             else_='neutral'
         ).label('sentiment'),
-        func.count(Email.id).label('count')
-    ).filter(
-        Email.received_at.between(start_date, end_date)
-    ).group_by('sentiment').all()
+        func.count(emails.id).label('count')
+    ).filter(*in_range).group_by('sentiment').all()
 
     return {
         "total_emails": total_emails,
-        "avg_response_time_hours": avg_response_time.total_seconds() / 3600 if avg_response_time else None,
+        "avg_response_time_hours": float(avg_response_time) / 3600 if avg_response_time is not None else None,
         "category_distribution": {cat: count for cat, count in category_dist},
         "sentiment_distribution": {sent: count for sent, count in sentiment_dist}
     }
 
 @router.get("/trends")
 async def get_trends(
+    request: Request,
     metric: str = Query(..., enum=["volume", "response_time", "sentiment"]),
-    interval: str = Query(..., enum=["day", "week", "month"]),
+    interval: str = Query(..., enum=["hour", "day", "week", "month"]),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    tz: Optional[str] = Query(default=None, description="IANA timezone for bucket boundaries"),
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get trend data for specified metric and time interval."""
-    if not start_date:
-        start_date = datetime.utcnow() - timedelta(days=30)
-    if not end_date:
-        end_date = datetime.utcnow()
+    start_date, end_date = _default_range(start_date, end_date)
+    try:
+        time_buckets.get_zone(tz)
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
 
-    if interval == "day":
-        date_trunc = func.date_trunc('day', Email.received_at)
-    elif interval == "week":
-        date_trunc = func.date_trunc('week', Email.received_at)
+    params = analytics_cache.normalize_params({
+        "metric": metric,
+        "interval": interval,
+        "start_date": time_buckets.to_utc_naive(start_date),
+        "end_date": time_buckets.to_utc_naive(end_date),
+        "tz": tz,
+        "include_archived": include_archived,
+    })
+    return await analytics_cache.cached_response(
+        request, db, "trends", params, lambda session: _trends(session, **params)
+    )
+
+def _trends(db: Session, metric: str, interval: str, start_date: datetime, end_date: datetime,
+            tz: Optional[str], include_archived: bool = False) -> Dict:
+    if time_buckets.get_zone(tz) is None and _use_rollups(start_date, end_date, include_archived):
+        totals = rollups.trend_totals_from_rollups(db, metric, interval, start_date, end_date)
     else:
-        date_trunc = func.date_trunc('month', Email.received_at)
-
-    if metric == "volume":
-        data = db.query(
-            date_trunc.label('date'),
-            func.count(Email.id).label('value')
-        ).filter(
-            Email.received_at.between(start_date, end_date)
-        ).group_by('date').order_by('date').all()
-
-    elif metric == "response_time":
-        data = db.query(
-            date_trunc.label('date'),
-            func.avg(Response.created_at - Email.received_at).label('value')
-        ).join(Response).filter(
-            Email.received_at.between(start_date, end_date)
-        ).group_by('date').order_by('date').all()
-
-    else:  # sentiment
-        data = db.query(
-            date_trunc.label('date'),
-            func.avg(Email.sentiment_score).label('value')
-        ).filter(
-            Email.received_at.between(start_date, end_date)
-        ).group_by('date').order_by('date').all()
+        totals = time_buckets.trend_totals(db, metric, interval, start_date, end_date, tz,
+                                           include_archived)
 
     return {
         "metric": metric,
         "interval": interval,
-        "data": [{"date": d.date, "value": float(d.value) if d.value else 0} for d in data]
+        "data": time_buckets.dense_series(totals, metric, interval, start_date, end_date, tz)
     }
 
+@router.get("/percentiles")
+async def get_percentiles(
+    request: Request,
+    metric: str = Query(..., enum=["response_time", "sentiment"]),
+    quantiles: str = Query(default="0.5,0.9,0.99", description="Comma-separated quantiles in [0, 1]"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Approximate percentiles (t-digest) of response time in hours or sentiment."""
+    try:
+        qs = sorted({float(q) for q in quantiles.split(",") if q.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="quantiles must be numbers")
+    if not qs or any(q < 0 or q > 1 for q in qs):
+        raise HTTPException(status_code=400, detail="quantiles must be between 0 and 1")
+
+    start_date, end_date = _hot_sketch_range(
+        *sketch_rollups.snap_to_hours(*_default_range(start_date, end_date)), include_archived
+    )
+    params = {"metric": metric, "quantiles": qs, "start_date": start_date, "end_date": end_date}
+    return await analytics_cache.cached_response(
+        request, db, "percentiles", params, lambda session: {
+            "metric": metric,
+            "unit": "hours" if metric == "response_time" else None,
+            "start_date": start_date,
+            "end_date": end_date,
+            **sketch_rollups.percentiles(session, metric, start_date, end_date, qs)
+        }
+    )
+
+@router.get("/unique-customers")
+async def get_unique_customers(
+    request: Request,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Approximate count (HyperLogLog) of distinct sender addresses."""
+    start_date, end_date = _hot_sketch_range(
+        *sketch_rollups.snap_to_hours(*_default_range(start_date, end_date)), include_archived
+    )
+    params = {"start_date": start_date, "end_date": end_date}
+    return await analytics_cache.cached_response(
+        request, db, "unique-customers", params, lambda session: {
+            "start_date": start_date,
+            "end_date": end_date,
+            **sketch_rollups.unique_senders(session, start_date, end_date)
+        }
+    )
+
+@router.get("/live")
+async def stream_live_metrics(request: Request):
+    """Stream metric deltas as Server-Sent Events (snapshot first, then deltas)."""
+    if not live_metrics.queue_depth_initialized:
+        # Not a dependency: those stay open until the stream ends, holding a connection
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(live_metrics.initialize_queue_depth)
+    subscriber = live_metrics.subscribe()
+    return StreamingResponse(
+        live_metrics.stream(subscriber, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/category-analysis")
 async def get_category_analysis(
+    request: Request,
     category: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get detailed analysis for specific category or all categories."""
-    query = db.query(Email)
+    params = analytics_cache.normalize_params({
+        "category": category,
+        "start_date": start_date,
+        "end_date": end_date,
+        "include_archived": include_archived,
+    })
+    return await analytics_cache.cached_response(
+        request, db, "category-analysis", params,
+        lambda session: _category_analysis(session, **params)
+    )
+
+def _category_analysis(db: Session, category: Optional[str],
+                       start_date: Optional[datetime], end_date: Optional[datetime],
+                       include_archived: bool = False) -> Dict:
+    emails, _, filters = archive.sources(include_archived)
     if category:
-        query = query.filter(Email.main_category == category)
+        filters.append(emails.main_category == category)
     if start_date:
-        query = query.filter(Email.received_at >= start_date)
+        filters.append(emails.received_at >= start_date)
     if end_date:
-        query = query.filter(Email.received_at <= end_date)
+        filters.append(emails.received_at <= end_date)
 
-    emails = query.all()
+    stats = db.query(
+        func.count(emails.id).label('total_count'),
+        func.avg(emails.sentiment_score).label('avg_sentiment'),
+        func.sum(case(
+            (emails.urgency.in_([UrgencyLevel.HIGH, UrgencyLevel.CRITICAL]), 1),
+            else_=0
+        )).label('urgent_count')
+    ).filter(*filters).one()
 
     return {
-        "total_count": len(emails),
-        "avg_sentiment": sum(e.sentiment_score for e in emails) / len(emails) if emails else 0,
-        "urgent_count": sum(1 for e in emails if e.urgency in [UrgencyLevel.HIGH, UrgencyLevel.CRITICAL]),
-        "sub_categories": db.query(
-            Email.sub_category,
-            func.count(Email.id).label('count')
-        ).filter(Email.main_category == category).group_by(Email.sub_category).all() if category else None
+        "total_count": stats.total_count,
+        "avg_sentiment": float(stats.avg_sentiment) if stats.avg_sentiment is not None else 0,
+        "urgent_count": int(stats.urgent_count or 0),
+        "sub_categories": [
+            {"sub_category": sub_category, "count": count}
+            for sub_category, count in db.query(
+                emails.sub_category,
+                func.count(emails.id).label('count')
+            ).filter(*filters).group_by(emails.sub_category).all()
+        ] if category else None
     }
 
 @router.get("/response-effectiveness")
 async def get_response_effectiveness(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    include_archived: bool = INCLUDE_ARCHIVED,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Analyze effectiveness of responses based on customer feedback and follow-ups."""
-    responses = db.query(Response).join(Email).filter(
-        Email.received_at.between(start_date, end_date) if start_date and end_date else True
-    ).all()
+    emails, responses, filters = archive.sources(include_archived)
+    if start_date and end_date:
+        filters.append(emails.received_at.between(start_date, end_date))
+
+    stats = (await db.execute(
+        select(
+            func.count(responses.id).label('total_responses'),
+            func.sum(case((responses.was_helpful == True, 1), else_=0)).label('helpful_count'),
+            func.sum(case((responses.customer_replied == True, 1), else_=0)).label('replied_count'),
+            func.avg(func.coalesce(func.length(responses.content), 0)).label('avg_length')
+        ).select_from(responses).join(emails, responses.email_id == emails.id).where(*filters)
+    )).one()
+
+    total = stats.total_responses
 
     return {
-        "total_responses": len(responses),
-        "helpful_rate": sum(1 for r in responses if r.was_helpful) / len(responses) if responses else 0,
-        "reply_rate": sum(1 for r in responses if r.customer_replied) / len(responses) if responses else 0,
-        "avg_response_length": sum(len(r.content) for r in responses) / len(responses) if responses else 0
-    }
\ No newline at end of file
+        "total_responses": total,
+        "helpful_rate": (stats.helpful_count or 0) / total if total else 0,
+        "reply_rate": (stats.replied_count or 0) / total if total else 0,
+        "avg_response_length": float(stats.avg_length) if total else 0
+    }
+
+@router.get("/export/emails")
+def export_emails(
+    format: str = Query(default=export.ARROW, enum=list(export.FORMATS)),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category: Optional[str] = None,
+    sub_category: Optional[str] = None,
+    status: Optional[EmailStatus] = None,
+    include_body: bool = False,
+    include_archived: bool = INCLUDE_ARCHIVED,
+    batch_size: int = Query(default=export.BATCH_SIZE, ge=1, le=1000000)
+):
+    """Stream emails in [start_date, end_date) as an Arrow IPC stream or Parquet file."""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if not export.available():
+        raise HTTPException(status_code=501, detail="Export requires pyarrow")
+    filename = "emails"
+    if start_date:
+        filename += f"-{start_date:%Y%m%d}"
+    if end_date:
+        filename += f"-{end_date:%Y%m%d}"
+    return StreamingResponse(
+        export.stream_emails(
+            format, batch_size, start_date=start_date, end_date=end_date, category=category,
+            sub_category=sub_category, status=status, include_body=include_body,
+            include_archived=include_archived
+        ),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
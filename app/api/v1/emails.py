@@ -1,25 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request
+from fastapi import Response as HTTPResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from ...database import get_db
-from ...models.email import Email, Response, EmailStatus
-from ...schemas.email import EmailCreate, EmailResponse, ResponseOut
-from ...services.email_processor import EmailProcessor
+from ...database import get_async_db
+from ...models.email import Email, Response, EmailStatus, status_literal
+from ...models.ingest import IngestJob
+from ...schemas.email import (
+    BatchIngestResponse, EmailCreate, EmailListItem, EmailResponse, EmailSearchResult, EmailSummary,
+    IngestJobStatus, ResponseOut
+)
+from ...services.email_processor import process_email_async, process_stored_async
 from ...services.email_sender import EmailSender
+from ...services import archive, email_search, ingest, work_claims
+from ...services.read_routing import get_read_db, mark_write
+from ...services.pagination import InvalidCursor, Page, estimate_count, paginate
+from ...services import analytics_cache, live_metrics, rollups, sketch_rollups  # noqa: F401  (flush listeners keep analytics current)
 
 router = APIRouter()
 
-@router.post("/process", response_model=EmailResponse)
+def _page_headers(http_response: HTTPResponse, page: Page):
+    """Expose cursors and the optional total as headers so list bodies stay unchanged."""
+    if page.next_cursor:
+        http_response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.prev_cursor:
+        http_response.headers["X-Prev-Cursor"] = page.prev_cursor
+    if page.total is not None:
+        http_response.headers["X-Total-Count"] = str(page.total)
+        http_response.headers["X-Total-Count-Exact"] = "true" if page.total_exact else "false"
+
+def _list_item(email: Email, include_body: bool, model=EmailListItem, **extra):
+    """A list row, with the body only if asked for; unset, it is left out of the response."""
+    fields = EmailSummary.from_orm(email).dict()
+    if include_body:
+        fields["body"] = email.body
+    return model(**fields, **extra)
+
+@router.post("/process", response_model=EmailResponse, dependencies=[Depends(mark_write)])
 async def process_new_email(
     email_data: EmailCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Process a new incoming email."""
-    processor = EmailProcessor(db)
-    result = await processor.process_email(email_data.dict())
+    result = await process_email_async(db, email_data.dict())
     
     if not result:
         raise HTTPException(status_code=400, detail="Could not process email")
@@ -34,25 +62,137 @@ async def process_new_email(
     
     return result['email']
 
-@router.get("/pending", response_model=List[EmailResponse])
+@router.post("/batch", response_model=BatchIngestResponse, status_code=202,
+             dependencies=[Depends(mark_write)])
+async def ingest_email_batch(
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """Ingest a JSON array or NDJSON stream of emails and queue them for classification.
+
+    Parsing, validation and body extraction run in the threadpool, off the event loop.
+    """
+    body = await request.body()
+    try:
+        raw_items = await run_in_threadpool(
+            ingest.parse_payload, body, request.headers.get("content-type", "")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(raw_items) > ingest.MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(raw_items)} exceeds the limit of {ingest.MAX_BATCH}"
+        )
+    
+    summary = await run_in_threadpool(ingest.ingest_summary, raw_items)
+    if summary["status"] == "queued":
+        background_tasks.add_task(ingest.run_job, summary["job_id"])
+    return summary
+
+@router.get("/batch/{job_id}", response_model=IngestJobStatus)
+async def get_ingest_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the status of a batch ingest job."""
+    job = await db.get(IngestJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return await db.run_sync(ingest.job_status, job)
+
+@router.post("/claim", response_model=List[EmailResponse], dependencies=[Depends(mark_write)])
+async def claim_emails(
+    worker_id: str,
+    limit: int = Query(default=work_claims.BATCH_SIZE, ge=1, le=500),
+    lease_seconds: int = Query(default=work_claims.LEASE_SECONDS, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lease a batch of NEW emails to a worker, oldest first."""
+    return await db.run_sync(work_claims.claim_emails, worker_id, limit, lease_seconds)
+
+@router.get("/pending", response_model=List[EmailListItem], response_model_exclude_unset=True)
 async def get_pending_emails(
+    http_response: HTTPResponse,
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor or X-Prev-Cursor of a previous page"),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    with_total: bool = False,
+    include_body: bool = Query(default=False, description="Also return the full body of each email"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all pending emails."""
-    emails = db.query(Email).filter(
-        Email.status == EmailStatus.NEW
-    ).offset(skip).limit(limit).all()
-    return emails
+    """Get pending emails, oldest first, one keyset page at a time."""
+    def pending_page(session):
+        pending = session.query(Email).filter(Email.status == status_literal(EmailStatus.NEW))
+        if include_body:
+            pending = pending.options(undefer(Email.body))
+        page = paginate(pending, [Email.received_at, Email.id],
+                        lambda email: (email.received_at, email.id),
+                        limit, cursor, offset=skip)
+        if with_total:
+            page.total, page.total_exact = estimate_count(pending)
+        return page
+
+    try:
+        page = await db.run_sync(pending_page)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _page_headers(http_response, page)
+    return [_list_item(email, include_body) for email in page.items]
+
+@router.get("/search", response_model=List[EmailSearchResult], response_model_exclude_unset=True)
+async def search_emails(
+    http_response: HTTPResponse,
+    query: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category: Optional[str] = None,
+    order: str = Query(default=email_search.RELEVANCE, enum=list(email_search.ORDERS)),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor or X-Prev-Cursor of a previous page"),
+    skip: int = 0,
+    limit: int = 100,
+    with_total: bool = False,
+    include_archived: bool = Query(default=False, description="Also search archived emails (unranked)"),
+    include_body: bool = Query(default=False, description="Also return the full body of each email"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Full-text search emails with highlighted snippets, paged by cursor."""
+    if order not in email_search.ORDERS:
+        raise HTTPException(status_code=400, detail=f"Unknown order: {order}")
+    emails, _, _ = archive.sources(include_archived)
+    filters = []
+    if start_date:
+        filters.append(emails.received_at >= start_date)
+    if end_date:
+        filters.append(emails.received_at <= end_date)
+    if category:
+        filters.append(emails.main_category == category)
+    
+    try:
+        page = await db.run_sync(
+            lambda session: email_search.search_emails(
+                session, query, filters, limit=limit, cursor=cursor,
+                order=order, skip=skip, count=with_total, include_archived=include_archived,
+                include_body=include_body
+            )
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _page_headers(http_response, page)
+    return [
+        _list_item(email, include_body, EmailSearchResult, score=score, snippet=snippet)
+        for email, score, snippet in page.items
+    ]
 
 @router.get("/{email_id}", response_model=EmailResponse)
 async def get_email(
     email_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get specific email by ID."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    """Get specific email by ID, from the archive if it has been moved there."""
+    email = await db.get(Email, email_id, options=[undefer(Email.body), undefer(Email.clean_body)])
+    if not email:
+        email = await db.run_sync(archive.get_archived, email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     return email
@@ -60,47 +200,46 @@ async def get_email(
 @router.get("/{email_id}/responses", response_model=List[ResponseOut])
 async def get_email_responses(
     email_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all responses for an email."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = await db.get(Email, email_id)
     if not email:
+        if await db.run_sync(archive.get_archived, email_id):
+            return await db.run_sync(archive.archived_responses_for, email_id)
         raise HTTPException(status_code=404, detail="Email not found")
-    return email.responses
+    result = await db.execute(
+        select(Response).where(Response.email_id == email_id).order_by(Response.created_at)
+    )
+    return result.scalars().all()
 
-@router.post("/{email_id}/retry")
+@router.post("/{email_id}/retry", dependencies=[Depends(mark_write)])
 async def retry_email_processing(
     email_id: int,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Retry processing a failed email."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = await db.get(Email, email_id, options=[undefer(Email.body), undefer(Email.clean_body)])
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
-    processor = EmailProcessor(db)
-    result = await processor.process_email({
-        'subject': email.subject,
-        'body': email.body,
-        'sender_email': email.sender_email,
-        'sender_name': email.sender_name
-    })
+    result = await process_stored_async(db, email)
     
     if not result:
         raise HTTPException(status_code=400, detail="Retry processing failed")
     
     return {"status": "success", "message": "Email reprocessing queued"}
 
-@router.post("/{email_id}/manual-response")
+@router.post("/{email_id}/manual-response", dependencies=[Depends(mark_write)])
 async def add_manual_response(
     email_id: int,
     response_content: str,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Add a manual response to an email."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = await db.get(Email, email_id, options=[undefer(Email.body), undefer(Email.clean_body)])
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
@@ -111,8 +250,8 @@ async def add_manual_response(
     )
     
     db.add(response)
-    db.commit()
-    db.refresh(response)
+    await db.commit()
+    await db.refresh(response)
     
     # Queue response sending
     background_tasks.add_task(
@@ -122,35 +261,3 @@ async def add_manual_response(
     )
     
     return {"status": "success", "response_id": response.id}
-
-@router.get("/search", response_model=List[EmailResponse])
-async def search_emails(
-    query: str,
-    start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None,
-    category: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
-):
-    """Search emails based on various criteria."""
-    filters = []
-    if query:
-        filters.append(
-            (Email.subject.ilike(f"%{query}%")) |
-            (Email.body.ilike(f"%{query}%")) |
-            (Email.sender_email.ilike(f"%{query}%"))
-        )
-    
-    if start_date:
-        filters.append(Email.received_at >= start_date)
-    if end_date:
-        filters.append(Email.received_at <= end_date)
-    if category:
-        filters.append(Email.main_category == category)
-    
-    emails = db.query(Email).filter(
-        *filters
-    ).offset(skip).limit(limit).all()
-    
-    return emails
\ No newline at end of file
@@ -0,0 +1,91 @@
+import time
+from os import getenv
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import Response
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ...models.email import Email, EmailStatus
+from ...services import telemetry
+from ...services.analytics_cache import cache as analytics_cache, data_version
+from ...services.customer_cache import customers, ticket_counters
+from ...services.live_metrics import live_metrics
+from ...services.read_routing import get_read_db
+from ...services.sketch_rollups import sketch_buffer
+from ...services.sql_profiler import profiler
+from ...services.threads import thread_index
+
+router = APIRouter()
+
+QUEUE_DEPTH_MAX_AGE = float(getenv("QUEUE_DEPTH_MAX_AGE_SECONDS", "60"))
+
+
+def _cache_counts(kind: str):
+    caches = {"analytics": analytics_cache, "customer": customers, "thread": thread_index}
+    return lambda: {(name,): cache.stats.get(kind, 0) for name, cache in caches.items()}
+
+
+telemetry.register_callback("cache_hits_total", "Cache hits, by cache.", ["cache"],
+                            _cache_counts("hits"), kind="counter")
+telemetry.register_callback("cache_misses_total", "Cache misses, by cache.", ["cache"],
+                            _cache_counts("misses"), kind="counter")
+telemetry.register_callback("cache_entries", "Entries held, by cache.", ["cache"], _cache_counts("entries"))
+telemetry.register_callback("send_queue_depth", "Drafted responses not yet sent.", [],
+                            lambda: {(): live_metrics.totals.queue_depth})
+telemetry.register_callback("customer_ticket_counts_pending", "Ticket counts not yet flushed to customers.", [],
+                            lambda: {(): ticket_counters.pending})
+telemetry.register_callback("sketch_values_pending", "Analytics sketch values not yet flushed.", [],
+                            lambda: {(): sketch_buffer.pending})
+telemetry.register_callback("sql_slow_queries_total", "Statements slower than the slow query threshold.", [],
+                            lambda: {(): profiler.slow_queries}, kind="counter")
+
+
+# Status counts and the data version and time they were taken at
+_status_counts: Tuple[Optional[int], float, Dict] = (None, 0.0, {})
+
+
+def _queue_depths(db: Session):
+    """Recount emails by status only when the analytics data version has moved.
+
+    Every status change bumps the version. Moving rows to the archive does
+    not, so the counts are also retaken after ``QUEUE_DEPTH_MAX_AGE_SECONDS``.
+    """
+    global _status_counts
+    version = data_version.current(db)
+    counted_version, counted_at, counts = _status_counts
+    if version != counted_version or time.monotonic() - counted_at >= QUEUE_DEPTH_MAX_AGE:
+        counts = dict(db.query(Email.status, func.count(Email.id)).group_by(Email.status).all())
+        _status_counts = (version, time.monotonic(), counts)
+    for status in EmailStatus:
+        telemetry.email_queue.set(counts.get(status, 0), status.value)
+    live_metrics.initialize_queue_depth(db)
+
+
+@router.get("/metrics")
+async def metrics(db: AsyncSession = Depends(get_read_db)):
+    """Prometheus scrape endpoint."""
+    await db.run_sync(_queue_depths)
+    return Response(content=telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+
+@router.get("/profiling/sql")
+async def get_sql_profiling():
+    """Profiler settings and per-route query totals, heaviest routes first."""
+    return {**profiler.settings(), "slow_queries": profiler.slow_queries, "routes": profiler.route_stats()}
+
+
+@router.put("/profiling/sql")
+async def configure_sql_profiling(
+    enabled: Optional[bool] = Query(default=None, description="Switch profiling on or off in this process"),
+    slow_ms: Optional[float] = Query(default=None, ge=0, description="Slow query log threshold"),
+    explain_rate: Optional[float] = Query(default=None, ge=0, le=1, description="Share of slow SELECTs explained"),
+    reset: bool = Query(default=False, description="Clear the per-route totals")
+):
+    """Change SQL profiling at runtime, without a restart."""
+    profiler.configure(enabled=enabled, slow_ms=slow_ms, explain_rate=explain_rate)
+    if reset:
+        profiler.reset()
+    return profiler.settings()
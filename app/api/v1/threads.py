@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...schemas.email import EmailResponse, ResponseOut, ThreadEmail, ThreadOut
+from ...services import threads
+from ...services.read_routing import get_read_db
+
+router = APIRouter()
+
+@router.get("/{thread_id:path}", response_model=ThreadOut)
+async def get_thread(
+    thread_id: str,
+    include_archived: bool = Query(default=False, description="Also include archived emails of the thread"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get a conversation: every email in the thread with its responses, oldest first."""
+    thread = await db.run_sync(threads.get_thread, thread_id, include_archived)
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    return ThreadOut(
+        thread_id=thread_id,
+        subject=thread[0][0].subject,
+        email_count=len(thread),
+        emails=[
+            ThreadEmail(**EmailResponse.from_orm(email).dict(),
+                        responses=[ResponseOut.from_orm(response) for response in responses])
+            for email, responses in thread
+        ],
+    )
@@ -0,0 +1,50 @@
+from os import getenv
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Settings:
+    """Application settings, read from the environment (and .env)."""
+
+    def __init__(self):
+        self.DATABASE_URL = getenv('DATABASE_URL', 'sqlite:///./support_analytics.db')
+        self.SECRET_KEY = getenv('SECRET_KEY', '')
+        self.CORS_ORIGINS = [origin.strip() for origin in getenv('CORS_ORIGINS', '').split(',') if origin.strip()]
+
+        self.ANTHROPIC_API_KEY = getenv('ANTHROPIC_API_KEY', '')
+
+        self.SMTP_SERVER = getenv('SMTP_SERVER', '')
+        self.SMTP_PORT = int(getenv('SMTP_PORT', '587'))
+        self.SMTP_USER = getenv('SMTP_USER', '')
+        self.SMTP_PASSWORD = getenv('SMTP_PASSWORD', '')
+        self.SMTP_USE_TLS = getenv('SMTP_USE_TLS', 'true').lower() in ('1', 'true', 'yes')
+        # The From address of our replies; mail from it is never processed
+        self.SUPPORT_EMAIL = getenv('SUPPORT_EMAIL', 'support@slyfone.com')
+        # The mailbox polled for support mail; the SMTP host unless set
+        self.IMAP_SERVER = getenv('IMAP_SERVER', '') or self.SMTP_SERVER
+        self.IMAP_PORT = int(getenv('IMAP_PORT', '993'))
+        self.IMAP_USE_SSL = getenv('IMAP_USE_SSL', 'true').lower() in ('1', 'true', 'yes')
+        self.EMAIL_FETCH_INTERVAL = int(getenv('EMAIL_FETCH_INTERVAL', '60'))
+        self.MAX_EMAILS_PER_FETCH = int(getenv('MAX_EMAILS_PER_FETCH', '50'))
+
+        # Connection pools (server databases and file-backed SQLite)
+        self.DB_POOL_SIZE = int(getenv('DB_POOL_SIZE', '5'))
+        self.DB_MAX_OVERFLOW = int(getenv('DB_MAX_OVERFLOW', '10'))
+        self.DB_POOL_TIMEOUT = int(getenv('DB_POOL_TIMEOUT', '30'))
+        self.DB_POOL_RECYCLE = int(getenv('DB_POOL_RECYCLE', '1800'))
+        self.REPLICA_DB_POOL_SIZE = int(getenv('REPLICA_DB_POOL_SIZE', '5'))
+
+        # Read replica for analytics, list and search routes (empty: read-only pool on the primary)
+        self.REPLICA_DATABASE_URL = getenv('REPLICA_DATABASE_URL', '')
+        self.REPLICA_MAX_LAG_SECONDS = float(getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+        self.REPLICA_LAG_CHECK_SECONDS = float(getenv('REPLICA_LAG_CHECK_SECONDS', '1'))
+
+        # SQLite per-connection pragmas
+        self.SQLITE_SYNCHRONOUS = getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+        self.SQLITE_BUSY_TIMEOUT_MS = int(getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        self.SQLITE_CACHE_SIZE_KB = int(getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+        self.SQLITE_MMAP_SIZE = int(getenv('SQLITE_MMAP_SIZE', '268435456'))
+
+
+settings = Settings()
@@ -1,18 +1,140 @@
-from sqlalchemy import create_engine
+from functools import partial
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from os import getenv
-from dotenv import load_dotenv
+from sqlalchemy.pool import QueuePool
+from typing import Union
 
-load_dotenv()
+from .config import settings
 
-DATABASE_URL = getenv('DATABASE_URL', 'sqlite:///./support_analytics.db')
+DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    DATABASE_URL, connect_args={'check_same_thread': False}
-)
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def async_url(url: Union[str, URL]) -> URL:
+    """Swap a sync driver for its asyncio counterpart (aiosqlite / asyncpg)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend in ASYNC_DRIVERS and parsed.drivername != ASYNC_DRIVERS[backend]:
+        parsed = parsed.set(drivername=ASYNC_DRIVERS[backend])
+    return parsed
+
+def is_file_sqlite(url: Union[str, URL]) -> bool:
+    """True for an on-disk SQLite database (not :memory: or a shared-memory URI)."""
+    parsed = make_url(url)
+    database = parsed.database or ''
+    return (parsed.get_backend_name() == 'sqlite' and database not in ('', ':memory:')
+            and 'mode=memory' not in database and parsed.query.get('mode') != 'memory')
+
+def _sqlite_pragmas(dbapi_connection, connection_record, read_only: bool = False):
+    """Production profile for SQLite, applied to every new connection.
+
+    WAL lets readers run alongside the single writer, so the poller no
+    longer blocks dashboards; busy_timeout makes a second writer wait
+    instead of failing with "database is locked".
+    """
+    synchronous = settings.SQLITE_SYNCHRONOUS
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        synchronous = 'NORMAL'
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def _engine_options(url: URL, read_only: bool, asynchronous: bool) -> dict:
+    backend = url.get_backend_name()
+    pool_size = settings.REPLICA_DB_POOL_SIZE if read_only else settings.DB_POOL_SIZE
+    if backend == 'sqlite':
+        options = {}
+        if not asynchronous:
+            # Sessions are opened in the threadpool and closed on the event loop
+            options['connect_args'] = {
+                'check_same_thread': False,
+                'timeout': settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            }
+        # Keep connections (and their page cache and mmap) instead of reopening
+        # per checkout. Not for aiosqlite: each pooled connection owns a
+        # non-daemon thread that would keep the process alive after asyncio.run.
+        if is_file_sqlite(url) and not asynchronous:
+            options.update(
+                poolclass=QueuePool,
+                pool_size=pool_size,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+            )
+        return options
+
+    options = {
+        'pool_pre_ping': True,
+        'pool_size': pool_size,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+    }
+    if read_only and backend == 'postgresql':
+        if asynchronous:
+            options['connect_args'] = {'server_settings': {'default_transaction_read_only': 'on'}}
+        else:
+            options['connect_args'] = {'options': '-c default_transaction_read_only=on'}
+    return options
+
+def create_db_engine(url: Union[str, URL, None] = None, read_only: bool = False,
+                     asynchronous: bool = False):
+    """Build a sync or async engine tuned for the database behind ``url``.
+
+    Pool sizing comes from settings per dialect. ``read_only`` engines
+    refuse writes: ``query_only`` on SQLite, read-only transactions on
+    Postgres.
+    """
+    parsed = make_url(url or DATABASE_URL)
+    if asynchronous:
+        parsed = async_url(parsed)
+    options = _engine_options(parsed, read_only, asynchronous)
+    if asynchronous:
+        built = create_async_engine(parsed, **options)
+        sync_engine = built.sync_engine
+    else:
+        built = sync_engine = create_engine(parsed, **options)
+    if parsed.get_backend_name() == 'sqlite':
+        event.listen(sync_engine, 'connect', partial(_sqlite_pragmas, read_only=read_only))
+    return built
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_db_engine(asynchronous=True)
+# Objects stay readable after commit; lazy loads would need an await
+AsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False
+)
+
+# Read-only traffic (analytics, lists, search) goes to the replica: a
+# separate read-only pool on REPLICA_DATABASE_URL, or on the primary when
+# none is configured, so dashboards never queue behind (or take
+# connections from) ingest writes. An in-memory SQLite database exists
+# only on its own connections, so it shares the primary.
+REPLICA_DATABASE_URL = settings.REPLICA_DATABASE_URL or DATABASE_URL
+if make_url(REPLICA_DATABASE_URL).get_backend_name() != 'sqlite' or is_file_sqlite(REPLICA_DATABASE_URL):
+    replica_engine = create_db_engine(REPLICA_DATABASE_URL, read_only=True)
+    async_replica_engine = create_db_engine(REPLICA_DATABASE_URL, read_only=True, asynchronous=True)
+else:
+    replica_engine, async_replica_engine = engine, async_engine
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+AsyncReplicaSessionLocal = sessionmaker(
+    async_replica_engine, class_=AsyncSession, autocommit=False, autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -20,4 +142,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -8,22 +8,27 @@ import email
 from email.header import decode_header
 import traceback
 
-from ..config import settings
-from ..database import SessionLocal
-from ..services.email_processor import EmailProcessor
-from ..models.email import Email, EmailStatus, EmailAnalytics
+from .config import settings
+from .database import AsyncSessionLocal
+from .services.email_processor import EmailProcessor, process_email_async
+from .services import analytics_cache, live_metrics, rollups, sketch_rollups  # noqa: F401  (flush listeners keep analytics current)
+from .services import telemetry
 
 class EmailPoller:
     def __init__(self):
-        self.imap_server = settings.SMTP_SERVER
-        self.imap_port = 993  # Standard IMAPS port
+        self.imap_server = settings.IMAP_SERVER
+        self.imap_port = settings.IMAP_PORT
+        self.imap_ssl = settings.IMAP_USE_SSL
         self.email_user = settings.SMTP_USER
         self.email_password = settings.SMTP_PASSWORD
         self.fetch_interval = settings.EMAIL_FETCH_INTERVAL  # in seconds
         self.max_emails = settings.MAX_EMAILS_PER_FETCH
+        self.support_address = settings.SUPPORT_EMAIL.strip().lower()
         self._running = False
         self._last_error = None
         self._processed_count = 0
+        self._last_check = None
+        self.processor = EmailProcessor(None)
 
     async def start_polling(self):
         """Start the email polling loop."""
@@ -53,9 +58,11 @@ class EmailPoller:
 
     async def poll_emails(self):
         """Poll for new emails and process them."""
+        self._last_check = datetime.utcnow()
         try:
             # Connect to IMAP server
-            imap_client = aioimaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            imap_class = aioimaplib.IMAP4_SSL if self.imap_ssl else aioimaplib.IMAP4
+            imap_client = imap_class(self.imap_server, self.imap_port)
             await imap_client.wait_hello_from_server()
             
             # Login
@@ -66,7 +73,7 @@ class EmailPoller:
             
             # Search for unread emails
             _, messages = await imap_client.search('UNSEEN')
-            message_numbers = messages[0].split()
+            message_numbers = messages[0].decode().split()
             
             if not message_numbers:
                 print("No new emails found.")
@@ -76,20 +83,23 @@ class EmailPoller:
             
             # Process emails
             for msg_num in message_numbers[:self.max_emails]:
-                try:
-                    success = await self._process_single_email(msg_num, imap_client)
-                    if success:
-                        self._processed_count += 1
-                        # Mark as read if processed successfully
-                        await imap_client.store(msg_num, '+FLAGS', '(\Seen)')
-                        print(f"Successfully processed email {msg_num.decode()}")
-                    else:
-                        print(f"Failed to process email {msg_num.decode()}")
+                # One trace per email, carried through processing in a context variable
+                with telemetry.tracing():
+                    try:
+                        success = await self._process_single_email(msg_num, imap_client)
+                        telemetry.emails_processed.inc(1, "imap", "processed" if success else "failed")
+                        if success:
+                            self._processed_count += 1
+                            # Mark as read if processed successfully
+                            await imap_client.store(msg_num, '+FLAGS', '(\Seen)')
+                            telemetry.log(f"Successfully processed email {msg_num}")
+                        else:
+                            telemetry.log(f"Failed to process email {msg_num}")
 
-                except Exception as e:
-                    print(f"Error processing email {msg_num.decode()}: {str(e)}")
-                    print(traceback.format_exc())
-                    continue
+                    except Exception as e:
+                        telemetry.log(f"Error processing email {msg_num}: {str(e)}")
+                        print(traceback.format_exc())
+                        continue
 
             await imap_client.close()
             await imap_client.logout()
@@ -99,53 +109,49 @@ class EmailPoller:
             print(traceback.format_exc())
             raise
 
-    async def _process_single_email(self, msg_num: bytes, imap_client) -> bool:
+    async def _process_single_email(self, msg_num: str, imap_client) -> bool:
         """Process a single email message."""
         try:
             # Fetch the email
-            _, msg_data = await imap_client.fetch(msg_num, '(RFC822)')
-            if not msg_data:
+            with telemetry.timed("imap_fetch"):
+                _, msg_data = await imap_client.fetch(msg_num, '(RFC822)')
+            # aioimaplib returns the message as the one bytearray among the response lines
+            email_body = next((bytes(line) for line in msg_data if isinstance(line, bytearray)), None)
+            if email_body is None:
                 return False
-
-            email_body = msg_data[0][1]
             
             # Parse email message
             email_message = email.message_from_bytes(email_body)
             
-            # Skip if it's a reply to avoid processing loops
-            if email_message.get('In-Reply-To'):
-                print(f"Skipping reply email: {msg_num.decode()}")
+            # Replies are threaded and processed; only automated mail is skipped,
+            # so auto-responders cannot bounce our responses back and forth
+            if self._is_automated(email_message):
+                telemetry.log(f"Skipping automated email: {msg_num}")
                 return True
             
             # Extract basic headers
             subject = self._decode_header(email_message.get('Subject', ''))
             from_addr = self._decode_header(email_message.get('From', ''))
-            print(f"Processing email - From: {from_addr}, Subject: {subject}")
+            telemetry.log(f"Processing email - From: {from_addr}, Subject: {subject}")
 
             # Process with database session
-            db = SessionLocal()
-            try:
-                processor = EmailProcessor(db)
-                result = await processor.process_email(email_body)
-                
-                if result:
-                    db.commit()
-                    return True
-                else:
-                    db.rollback()
-                    return False
-                    
-            except Exception as e:
-                db.rollback()
-                raise e
-            finally:
-                db.close()
+            async with AsyncSessionLocal() as db:
+                result = await process_email_async(db, email_body, self.processor)
+                return result is not None
                 
         except Exception as e:
-            print(f"Error processing single email: {str(e)}")
+            telemetry.log(f"Error processing single email: {str(e)}")
             print(traceback.format_exc())
             return False
 
+    def _is_automated(self, message) -> bool:
+        """Auto-replies, bulk mail and our own outgoing messages (RFC 3834)."""
+        auto_submitted = message.get('Auto-Submitted', 'no').strip().lower()
+        precedence = message.get('Precedence', '').strip().lower()
+        return (auto_submitted != 'no'
+                or precedence in ('bulk', 'junk', 'list', 'auto_reply')
+                or self.support_address in message.get('From', '').lower())
+
     def _decode_header(self, header: str) -> str:
         """Decode email header."""
         if not header:
@@ -167,7 +173,7 @@ class EmailPoller:
             "running": self._running,
             "last_error": self._last_error,
             "processed_count": self._processed_count,
-            "last_check": datetime.utcnow().isoformat(),
+            "last_check": self._last_check.isoformat() if self._last_check else None,
             "configuration": {
                 "server": self.imap_server,
                 "user": self.email_user,
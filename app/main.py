@@ -1,30 +1,30 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import settings
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,  # Enable automatic reconnection
-    pool_size=5,
-    max_overflow=10
-)
+from .api.v1 import analytics, emails, metrics, threads
+from .config import settings
+from .database import Base, SessionLocal, engine, get_db  # noqa: F401  (one engine, built by app.database)
+from .services import telemetry
+from .services.sql_profiler import profile_requests
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Initialize database
+def init_db():
+    Base.metadata.create_all(bind=engine)
 
-# Create Base class
-Base = declarative_base()
+def create_app() -> FastAPI:
+    """Build the API: routers plus the tracing and SQL profiling middleware."""
+    app = FastAPI(title="Support Analytics")
+    if settings.CORS_ORIGINS:
+        app.add_middleware(CORSMiddleware, allow_origins=settings.CORS_ORIGINS,
+                           allow_methods=["*"], allow_headers=["*"])
+    app.middleware("http")(profile_requests)
+    # Registered last, so it runs first: every log line of the request carries its trace id
+    app.middleware("http")(telemetry.trace_requests)
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    app.include_router(emails.router, prefix="/emails", tags=["emails"])
+    app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+    app.include_router(threads.router, prefix="/threads", tags=["threads"])
+    app.include_router(metrics.router, tags=["metrics"])
+    return app
 
-# Initialize database
-def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+app = create_app()
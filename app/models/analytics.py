@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, LargeBinary, UniqueConstraint, Index
+from ..database import Base
+
+class EmailRollup(Base):
+    """Pre-aggregated email and response stats per time bucket."""
+    __tablename__ = "email_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "grain", "bucket_start", "main_category", "sub_category",
+            "urgency", "sentiment_bucket",
+            name="uq_email_rollups_key"
+        ),
+        Index("ix_email_rollups_grain_bucket", "grain", "bucket_start"),
+    )
+
+    id = Column(Integer, primary_key=True)
+
+    # Bucket key
+    grain = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    main_category = Column(String, nullable=False, default="")
+    sub_category = Column(String, nullable=False, default="")
+    urgency = Column(String, nullable=False, default="")
+    sentiment_bucket = Column(String, nullable=False)
+
+    # Email aggregates
+    email_count = Column(Integer, nullable=False, default=0)
+    sentiment_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+
+    # Response aggregates (response time = Response.created_at - Email.received_at)
+    response_count = Column(Integer, nullable=False, default=0)
+    response_time_sum = Column(Float, nullable=False, default=0.0)  # seconds
+
+class AnalyticsDataVersion(Base):
+    """Single-row counter bumped whenever emails or responses change."""
+    __tablename__ = "analytics_data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class AnalyticsSketch(Base):
+    """Serialized t-digest / HyperLogLog per time bucket, merged at query time."""
+    __tablename__ = "analytics_sketches"
+    __table_args__ = (
+        UniqueConstraint("grain", "bucket_start", "kind", name="uq_analytics_sketches_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    grain = Column(String, nullable=False)  # "hour" or "day"
+    bucket_start = Column(DateTime, nullable=False)
+    kind = Column(String, nullable=False)  # "response_time", "sentiment" or "senders"
+    data = Column(LargeBinary, nullable=False)
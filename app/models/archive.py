@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Index, Table
+from ..database import Base
+from .email import Email, Response
+
+def _archive_table(source: Table, name: str, *indexes: Index) -> Table:
+    """Same columns as ``source``; no defaults, foreign keys or hot-path indexes."""
+    columns = [
+        Column(column.name, column.type, primary_key=column.primary_key,
+               autoincrement=False, nullable=column.nullable)
+        for column in source.columns
+    ]
+    return Table(name, Base.metadata, *columns, *indexes)
+
+# Cold tier: emails and responses moved out by services/archive.py
+emails_archive = _archive_table(
+    Email.__table__, "emails_archive",
+    Index("ix_emails_archive_received_at", "received_at"),
+    Index("ix_emails_archive_sender_email", "sender_email"),
+    Index("ix_emails_archive_thread_id", "thread_id"),
+)
+
+responses_archive = _archive_table(
+    Response.__table__, "responses_archive",
+    Index("ix_responses_archive_email_id", "email_id"),
+)
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float, Enum as SQLAlchemyEnum, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float, Enum as SQLAlchemyEnum, Boolean, ForeignKey, Index, bindparam, false, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 import enum
 from ..database import Base
+from ..services.body_storage import CompressedText
 
 class UrgencyLevel(str, enum.Enum):
     LOW = "low"
@@ -12,23 +14,46 @@ class UrgencyLevel(str, enum.Enum):
 
 class EmailStatus(str, enum.Enum):
     NEW = "new"
+    PROCESSING = "processing"
     PROCESSED = "processed"
     RESPONDED = "responded"
     FAILED = "failed"
 
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # Keyset pagination key for newest-first listings; the pending queue's is the partial index below
+        Index("ix_emails_received_at_id", "received_at", "id"),
+        # Expired-lease reclaim
+        Index("ix_emails_status_lease_expires_at", "status", "lease_expires_at"),
+        # Analytics: date-range scans grouped by category, and per-category drill-down
+        Index("ix_emails_received_at_main_category", "received_at", "main_category"),
+        Index("ix_emails_main_category_sub_category_received_at",
+              "main_category", "sub_category", "received_at"),
+        # Thread view and customer_replied marking
+        Index("ix_emails_thread_id_received_at", "thread_id", "received_at"),
+        # Partial index on the unarchived hot set; the pending queue's one is below status_literal
+        Index("ix_emails_hot_received_at", "received_at",
+              postgresql_where=text("archived = false"), sqlite_where=text("archived = 0")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     message_id = Column(String, unique=True, index=True)
-    thread_id = Column(String, index=True)
+    # Message-ID of the first email in the conversation (services/threads.py)
+    thread_id = Column(String)
     
     # Sender information
     sender_email = Column(String, index=True)
     sender_name = Column(String)
     recipient_email = Column(String)
     subject = Column(String)
-    body = Column(Text)
+    # Loaded only on request (undefer); list views use preview
+    body = deferred(Column(CompressedText))
+    # Prompt text: body without markup, quotes and signature (services/body_extraction.py)
+    clean_body = deferred(Column(CompressedText))
+    preview = Column(String)
+    body_tokens = Column(Integer)
+    clean_body_tokens = Column(Integer)
     
     # Timestamps
     received_at = Column(DateTime, default=datetime.utcnow)
@@ -43,19 +68,33 @@ class Email(Base):
     urgency = Column(SQLAlchemyEnum(UrgencyLevel))
     
     # Status
-    status = Column(SQLAlchemyEnum(EmailStatus), default=EmailStatus.NEW)
+    # Postgres stores the lowercase email_status labels created by migration 001
+    status = Column(SQLAlchemyEnum(EmailStatus).with_variant(
+        postgresql.ENUM(EmailStatus, name="email_status",
+                        values_callable=lambda statuses: [status.value for status in statuses]),
+        "postgresql"
+    ), default=EmailStatus.NEW)
     error_message = Column(Text, nullable=True)
     
+    # Work claim (see services/work_claims.py)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    claim_count = Column(Integer, default=0)
+    
     # Metadata
     customer_id = Column(Integer, nullable=True)
     is_reply = Column(Boolean, default=False)
-    additional_data = Column(JSON, nullable=True)
+    additional_data = deferred(Column(JSON, nullable=True))
+    archived = Column(Boolean, default=False, server_default=false(), nullable=False)
     
     # Relationships
     responses = relationship("Response", back_populates="email")
 
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        Index("ix_responses_email_id_created_at", "email_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email_id = Column(Integer, ForeignKey("emails.id"))
@@ -82,6 +121,19 @@ class Response(Base):
     # Relationships
     email = relationship("Email", back_populates="responses")
 
+def status_literal(status: EmailStatus):
+    """``status`` inlined into the SQL, so the planner can match the partial
+    indexes above (a bound parameter hides it from Postgres generic plans)."""
+    return bindparam("status", status, type_=Email.__table__.c.status.type,
+                     unique=True, literal_execute=True)
+
+# Partial index on the pending queue. Its predicate is built from
+# status_literal, so it has the same literal as the queries it serves
+# ('new' on Postgres, 'NEW' on SQLite; migration 009 matches).
+Index("ix_emails_new_received_at_id", Email.received_at, Email.id,
+      postgresql_where=Email.status == status_literal(EmailStatus.NEW),
+      sqlite_where=Email.status == status_literal(EmailStatus.NEW))
+
 class Customer(Base):
     __tablename__ = "customers"
     
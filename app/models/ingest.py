@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from datetime import datetime
+from ..database import Base
+
+class IngestJob(Base):
+    """One accepted batch from POST /emails/batch."""
+    __tablename__ = "ingest_jobs"
+
+    id = Column(String(36), primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    status = Column(String, default="queued")  # queued, running, done
+
+    # Per-item outcome of the insert, in request order
+    total = Column(Integer, default=0)
+    accepted = Column(Integer, default=0)
+    rejected = Column(Integer, default=0)
+    items = Column(JSON)
+
+    # Emails queued for classification by this job
+    email_ids = Column(JSON)
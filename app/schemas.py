@@ -52,6 +52,7 @@ class MetricsResponse(BaseModel):
     timeDistribution: dict
     urgencyDistribution: dict
     averageSentiment: float
+    sentimentStats: Optional[dict] = None
 
 # File Upload Response
 class FileUploadResponse(BaseModel):
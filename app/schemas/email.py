@@ -33,10 +33,67 @@ class EmailResponse(EmailBase):
     status: EmailStatus
     classification: Optional[EmailClassification]
     error_message: Optional[str]
+    clean_body: Optional[str] = None
+    body_tokens: Optional[int] = None
+    clean_body_tokens: Optional[int] = None
 
     class Config:
         orm_mode = True
 
+class EmailSummary(BaseModel):
+    """List-view shape: metadata and a preview instead of the body."""
+    id: int
+    message_id: str
+    thread_id: Optional[str]
+    subject: str
+    preview: Optional[str]
+    sender_email: EmailStr
+    sender_name: Optional[str] = None
+    recipient_email: EmailStr
+    received_at: datetime
+    processed_at: Optional[datetime]
+    status: EmailStatus
+    classification: Optional[EmailClassification]
+    error_message: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+class EmailListItem(EmailSummary):
+    """A list row; ``body`` is set only when the request asks for it (``include_body``)."""
+    body: Optional[str] = None
+
+class EmailSearchResult(EmailListItem):
+    score: float
+    snippet: Optional[str]
+
+class BatchItemResult(BaseModel):
+    index: int
+    message_id: Optional[str]
+    status: str
+    email_id: Optional[int] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+class BatchIngestResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    accepted: int
+    rejected: int
+    items: List[BatchItemResult]
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    total: int
+    accepted: int
+    rejected: int
+    queued: int
+    progress: Dict[str, int]
+
 class ResponseBase(BaseModel):
     content: str
     model_version: str
@@ -64,6 +121,15 @@ class ResponseOut(ResponseBase):
     class Config:
         orm_mode = True
 
+class ThreadEmail(EmailResponse):
+    responses: List[ResponseOut]
+
+class ThreadOut(BaseModel):
+    thread_id: str
+    subject: Optional[str]
+    email_count: int
+    emails: List[ThreadEmail]
+
 class CustomerBase(BaseModel):
     email: EmailStr
     name: Optional[str]
@@ -0,0 +1,269 @@
+"""Versioned response cache for the analytics router.
+
+Every Email/Response write bumps a single-row data-version counter in the
+same transaction. Cached payloads remember the version they were computed
+at, so a poll against unchanged data is a dictionary lookup plus, at most
+once per ``ANALYTICS_CACHE_VERSION_TTL`` seconds, a primary-key read of the
+counter. Entries live in a bounded in-process LRU with an optional
+on-disk tier (``ANALYTICS_CACHE_DIR``). Outdated entries younger than
+``ANALYTICS_CACHE_STALE_SECONDS`` are served while a background refresh
+runs. Responses carry an ETag and answer ``If-None-Match`` with 304.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Any, Callable, Dict, Optional, Set
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.responses import Response as HTTPResponse
+
+from ..database import ReplicaSessionLocal
+from ..models.analytics import AnalyticsDataVersion
+from ..models.email import Email, Response
+
+CACHE_SIZE = int(getenv("ANALYTICS_CACHE_SIZE", "256"))
+CACHE_DIR = getenv("ANALYTICS_CACHE_DIR", "")
+STALE_SECONDS = float(getenv("ANALYTICS_CACHE_STALE_SECONDS", "30"))
+ROUND_SECONDS = int(getenv("ANALYTICS_CACHE_ROUND_SECONDS", "60"))
+VERSION_TTL = float(getenv("ANALYTICS_CACHE_VERSION_TTL", "1.0"))
+
+Compute = Callable[[Session], Any]
+
+
+class CacheEntry:
+    __slots__ = ("version", "body", "etag", "stored_at")
+
+    def __init__(self, version: int, body: bytes, etag: str, stored_at: float):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.stored_at = stored_at
+
+
+class AnalyticsCache:
+    """Bounded LRU of serialized payloads with an optional local-file tier."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, cache_dir: str = CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                stored = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        entry = CacheEntry(stored["version"], stored["body"].encode(),
+                           stored["etag"], stored["stored_at"])
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        self._remember(key, entry)
+        if self.cache_dir:
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": entry.version, "body": entry.body.decode(),
+                           "etag": entry.etag, "stored_at": entry.stored_at}, f)
+            os.replace(tmp_path, self._path(key))
+
+    def _remember(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def claim_refresh(self, key: str) -> bool:
+        """Reserve a background refresh for a key; False if one is running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits,
+                "stale_hits": self.stale_hits, "misses": self.misses}
+
+
+class DataVersion:
+    """Process-local view of the shared data-version counter."""
+
+    def __init__(self, ttl: float = VERSION_TTL):
+        self.ttl = ttl
+        self._version = 0
+        self._checked_at = 0.0
+
+    def current(self, db: Session) -> int:
+        now = time.monotonic()
+        if now - self._checked_at >= self.ttl:
+            version = db.execute(
+                select(AnalyticsDataVersion.version).where(AnalyticsDataVersion.id == 1)
+            ).scalar()
+            self._version = max(self._version, version or 0)
+            self._checked_at = now
+        return self._version
+
+    def invalidate(self):
+        """Force the next read to go to the database (after a local write)."""
+        self._checked_at = 0.0
+
+
+cache = AnalyticsCache()
+data_version = DataVersion()
+
+
+def bump_data_version(connection):
+    """Increment the shared counter on the given connection/transaction."""
+    table = AnalyticsDataVersion.__table__
+    result = connection.execute(
+        update(table).where(table.c.id == 1).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(id=1, version=1))
+
+
+def bump_in_session(session: Session):
+    """Bump the version once per transaction; it is re-read locally after commit.
+
+    Bulk UPDATEs skip the flush listener below, so callers that change
+    emails or responses with one call this themselves.
+    """
+    if not session.info.get("analytics_version_bumped"):
+        bump_data_version(session.connection())
+        session.info["analytics_version_bumped"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_on_write(session: Session, flush_context):
+    if session.info.get("analytics_version_bumped"):
+        return
+    changed = (session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, (Email, Response)) for objs in changed for obj in objs):
+        bump_in_session(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    if session.info.pop("analytics_version_bumped", False):
+        data_version.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop("analytics_version_bumped", None)
+
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Round datetimes down to the cache granularity so nearby polls share a key."""
+    normalized = {}
+    for name, value in params.items():
+        if isinstance(value, datetime) and ROUND_SECONDS > 1:
+            midnight = value.replace(hour=0, minute=0, second=0, microsecond=0)
+            elapsed = int((value - midnight).total_seconds())
+            value = midnight + timedelta(seconds=elapsed - elapsed % ROUND_SECONDS)
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(endpoint: str, params: Dict[str, Any]) -> str:
+    return endpoint + "?" + json.dumps(jsonable_encoder(params), sort_keys=True)
+
+
+def _build_entry(version: int, payload: Any) -> CacheEntry:
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+    return CacheEntry(version, body, etag, time.time())
+
+
+def _respond(request: Request, entry: CacheEntry, state: str) -> HTTPResponse:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "private, no-cache",
+        "X-Data-Version": str(entry.version),
+        "X-Cache": state,
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return HTTPResponse(status_code=304, headers=headers)
+    return HTTPResponse(content=entry.body, media_type="application/json", headers=headers)
+
+
+def _refresh(key: str, compute: Compute):
+    db = ReplicaSessionLocal()
+    try:
+        version = data_version.current(db)
+        cache.set(key, _build_entry(version, compute(db)))
+    except Exception as e:
+        print(f"Analytics cache refresh failed for {key}: {str(e)}")
+    finally:
+        db.close()
+        cache.release_refresh(key)
+
+
+async def cached_response(request: Request, db: AsyncSession, endpoint: str,
+                          params: Dict[str, Any], compute: Compute) -> HTTPResponse:
+    """Serve ``compute(session)`` through the versioned cache.
+
+    ``compute`` takes a sync Session and runs via ``db.run_sync``, so it
+    does not block the event loop. ``params`` must already be normalized
+    with ``normalize_params`` and be the exact values ``compute`` uses.
+    """
+    key = cache_key(endpoint, params)
+    version = await db.run_sync(data_version.current)
+    entry = cache.get(key)
+
+    if entry is not None and entry.version >= version:
+        cache.hits += 1
+        return _respond(request, entry, "hit")
+
+    if entry is not None and time.time() - entry.stored_at <= STALE_SECONDS:
+        cache.stale_hits += 1
+        if cache.claim_refresh(key):
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, _refresh, key, compute)
+        return _respond(request, entry, "stale")
+
+    cache.misses += 1
+    entry = _build_entry(version, await db.run_sync(compute))
+    cache.set(key, entry)
+    return _respond(request, entry, "miss")
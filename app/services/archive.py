@@ -0,0 +1,168 @@
+"""Hot/cold archival of old emails.
+
+Settled emails (processed, responded or failed) received more than
+``ARCHIVE_AFTER_DAYS`` ago leave the hot tables in two steps. Each step
+runs in short batches of ``ARCHIVE_BATCH_SIZE``, committing after every
+batch, so no lock is held for long:
+
+1. mark: set ``emails.archived``. Hot reads filter on ``archived = false``
+   (served by the partial index ``ix_emails_hot_received_at``), so marked
+   emails drop out of them at once.
+2. move: copy marked emails and their responses into ``emails_archive``
+   and ``responses_archive`` and delete them from the hot tables, all in
+   one transaction per batch.
+
+Both steps pick up where an interrupted run stopped. Run the job from
+cron with ``python -m app.services.archive run``.
+
+Reads choose a tier with ``sources(include_archived)``. The archive keeps
+the original ids, so a union of both tiers needs no remapping. Range
+filters reach each tier's ``received_at`` index through the union. Joins
+do too on Postgres, but SQLite materializes the response union, so
+archive-inclusive response-time reads there scan ``responses``. Archival
+bypasses the ORM flush listeners, so rollups and sketches are left as
+they are and keep covering both tiers.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, false, insert, select, true, union_all, update
+from sqlalchemy.orm import Session, aliased, undefer
+
+from ..database import SessionLocal
+from ..models.archive import emails_archive, responses_archive
+from ..models.email import Email, EmailStatus, Response
+from .analytics_cache import bump_data_version, data_version
+
+ARCHIVE_AFTER_DAYS = int(getenv("ARCHIVE_AFTER_DAYS", "365"))
+BATCH_SIZE = int(getenv("ARCHIVE_BATCH_SIZE", "1000"))
+# Pause between batches so ingest and workers get the write lock in between
+PAUSE_SECONDS = float(getenv("ARCHIVE_PAUSE_SECONDS", "0.1"))
+
+SETTLED = (EmailStatus.PROCESSED, EmailStatus.RESPONDED, EmailStatus.FAILED)
+
+_emails = Email.__table__
+_responses = Response.__table__
+
+# Email/Response entities over both tiers, and over the archive alone
+all_emails = aliased(
+    Email, union_all(select(_emails), select(emails_archive)).subquery("all_emails"), name="all_emails"
+)
+all_responses = aliased(
+    Response, union_all(select(_responses), select(responses_archive)).subquery("all_responses"),
+    name="all_responses"
+)
+archived_emails = aliased(Email, emails_archive, adapt_on_names=True)
+archived_responses = aliased(Response, responses_archive, adapt_on_names=True)
+
+
+def horizon(now: Optional[datetime] = None) -> datetime:
+    """Emails received before this are due for the archive."""
+    return (now or datetime.utcnow()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def sources(include_archived: bool = False) -> Tuple:
+    """(email entity, response entity, filters) for a read of the hot tier or of both tiers."""
+    if include_archived:
+        return all_emails, all_responses, []
+    return Email, Response, [Email.archived == false()]
+
+
+def get_archived(db: Session, email_id: int) -> Optional[Email]:
+    """An archived email with its body loaded, or None."""
+    return db.query(archived_emails).options(
+        undefer(archived_emails.body), undefer(archived_emails.clean_body)
+    ).filter(archived_emails.id == email_id).one_or_none()
+
+
+def archived_responses_for(db: Session, email_id: int):
+    return db.query(archived_responses).filter(
+        archived_responses.email_id == email_id
+    ).order_by(archived_responses.created_at).all()
+
+
+def mark_batch(db: Session, cutoff: datetime, limit: int = BATCH_SIZE) -> int:
+    """Flag up to ``limit`` settled hot emails received before ``cutoff``. Caller commits."""
+    due = select(Email.id).where(
+        Email.archived == false(),
+        Email.received_at < cutoff,
+        Email.status.in_(SETTLED),
+    ).order_by(Email.received_at).limit(limit)
+    marked = db.execute(
+        update(Email).where(Email.id.in_(due.scalar_subquery())).values(archived=True)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if marked:
+        bump_data_version(db.connection())
+    return marked
+
+
+def move_batch(db: Session, limit: int = BATCH_SIZE) -> int:
+    """Move up to ``limit`` marked emails and their responses to the archive. Caller commits."""
+    # Marked emails are the oldest, so this reads the start of the received_at index
+    ids = db.execute(
+        select(Email.id).where(Email.archived == true())
+        .order_by(Email.received_at, Email.id).limit(limit)
+    ).scalars().all()
+    if not ids:
+        return 0
+    email_columns = [column.name for column in emails_archive.columns]
+    response_columns = [column.name for column in responses_archive.columns]
+    db.execute(insert(emails_archive).from_select(
+        email_columns, select(*(_emails.c[name] for name in email_columns)).where(_emails.c.id.in_(ids))
+    ))
+    db.execute(insert(responses_archive).from_select(
+        response_columns,
+        select(*(_responses.c[name] for name in response_columns)).where(_responses.c.email_id.in_(ids))
+    ))
+    db.execute(delete(_responses).where(_responses.c.email_id.in_(ids)))
+    db.execute(delete(_emails).where(_emails.c.id.in_(ids)))
+    return len(ids)
+
+
+def _in_batches(step, pause: float) -> int:
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            done = step(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if not done:
+            return total
+        total += done
+        data_version.invalidate()
+        time.sleep(pause)
+
+
+def archive_old_emails(cutoff: Optional[datetime] = None, batch_size: int = BATCH_SIZE,
+                       pause: float = PAUSE_SECONDS) -> Tuple[int, int]:
+    """Mark, then move, every settled email received before ``cutoff``. Returns (marked, moved)."""
+    cutoff = cutoff or horizon()
+    marked = _in_batches(lambda db: mark_batch(db, cutoff, batch_size), pause)
+    moved = _in_batches(lambda db: move_batch(db, batch_size), pause)
+    return marked, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old emails to the archive tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Archive settled emails older than ARCHIVE_AFTER_DAYS")
+    run.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    # Always the configured horizon: analytics relies on nothing newer being archived
+    cutoff = horizon()
+    marked, moved = archive_old_emails(cutoff, args.batch_size)
+    print(f"Marked {marked} and moved {moved} emails received before {cutoff:%Y-%m-%d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Plain-text extraction of email bodies for the LLM prompts.
+
+``best_part`` picks the body of a MIME message: the text/plain part,
+unless it is missing or a stub and an HTML part exists. ``clean_text``
+turns a stored body into what the classifier and response generator read:
+
+1. HTML is converted to text. lxml is used when installed
+   (``EMAIL_HTML_PARSER=lxml``, the default), which is several times
+   faster than BeautifulSoup's html.parser, the fallback. Scripts,
+   styles and quoted blocks (``<blockquote>``, Gmail and Yahoo quote
+   containers) are dropped before conversion.
+2. Quoted history is cut at the first reply header ("On ... wrote:",
+   "-----Original Message-----", an Outlook "From:/Sent:" block), and
+   ``>``-quoted lines are dropped.
+3. Signatures are cut at the "-- " delimiter, at mobile footers, or at a
+   standalone sign-off ("Thanks,", "Best regards") in the last few lines
+   that is followed only by a short name or contact block. Prose such as
+   "Thank you for your reply." is never taken for a sign-off.
+4. Whitespace is collapsed and the result capped at
+   ``EMAIL_CLEAN_MAX_CHARS``.
+
+The original body is stored unchanged next to the cleaned one.
+``estimate_tokens`` is the usual four-characters-per-token approximation,
+good enough to report savings without a tokenizer dependency.
+"""
+import argparse
+import re
+from email.message import Message
+from os import getenv
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+from sqlalchemy import bindparam, column, select, table, update
+
+from ..database import engine
+from .body_storage import compress_text, decompress_text, make_preview
+
+MAX_CHARS = int(getenv("EMAIL_CLEAN_MAX_CHARS", "4000"))
+HTML_PARSER = getenv("EMAIL_HTML_PARSER", "lxml").lower()
+# A text/plain part shorter than this is taken for a stub when HTML exists
+PLAIN_MIN_CHARS = 40
+SIGNOFF_LINES = 6
+# At most this many short lines (name, title, phone) may follow a sign-off
+SIGNOFF_TAIL_LINES = 3
+SIGNOFF_TAIL_CHARS = 50
+CHARS_PER_TOKEN = 4
+
+_HTML = re.compile(r"<\s*(html|body|div|p|br|table|span|font|a)\b[^>]*>", re.IGNORECASE)
+_REPLY_HEADER = re.compile(
+    r"^\s*(On\b.{0,200}\bwrote:\s*$"
+    r"|-{2,}\s*Original Message\s*-{2,}"
+    r"|-{2,}\s*Forwarded message\s*-{2,}"
+    r"|_{10,}\s*$"
+    r"|Le\b.{0,200}\ba écrit\s*:\s*$"
+    r"|Am\b.{0,200}\bschrieb\b.{0,100}:\s*$)",
+    re.IGNORECASE,
+)
+_OUTLOOK_FROM = re.compile(r"^\s*\**From:\**\s+\S", re.IGNORECASE)
+_OUTLOOK_FIELD = re.compile(r"^\s*\**(Sent|Date|To|Subject):\**\s", re.IGNORECASE)
+_QUOTED = re.compile(r"^\s*>")
+_SIGNATURE = re.compile(
+    r"^(--\s?|Sent from my \w.*|Sent from (Mail|Outlook|Yahoo Mail) for .*|Get Outlook for .*)$",
+    re.IGNORECASE,
+)
+_SIGNOFF = re.compile(
+    r"^((best|kind|warm|many)\s+)?(regards|thanks|thank you|cheers|sincerely|best wishes|br)"
+    r"(\s+(again|so much|very much|in advance|a lot|all))?\s*[,.!]?$",
+    re.IGNORECASE,
+)
+_CONTACT = re.compile(r"\d|@|\||www\.|https?:", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\u00a0\u200b]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+_BLOCK_TAGS = ("p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol", "pre")
+_DROPPED_TAGS = ("script", "style", "head", "title", "blockquote")
+# Outlook's reply header is left in place: the From:/Sent: cut below also drops what follows it
+_QUOTE_CONTAINERS = "//*[contains(@class, 'gmail_quote') or contains(@class, 'yahoo_quoted')]"
+
+_lxml = None
+
+
+def _lxml_modules():
+    global _lxml
+    if _lxml is None:
+        from lxml import etree
+        from lxml import html as lxml_html
+        _lxml = (etree, lxml_html, lxml_html.HTMLParser(encoding="utf-8", remove_comments=True))
+    return _lxml
+
+
+def is_html(text: str) -> bool:
+    return bool(_HTML.search(text[:4096]))
+
+
+def _html_to_text_lxml(html: str) -> str:
+    etree, lxml_html, parser = _lxml_modules()
+    try:
+        root = lxml_html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except (etree.ParserError, ValueError):
+        return ""
+    for element in root.xpath(_QUOTE_CONTAINERS):
+        element.drop_tree()
+    etree.strip_elements(root, *_DROPPED_TAGS, with_tail=False)
+    for element in root.iter("br", *_BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    return root.text_content()
+
+
+def _html_to_text_bs4(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(list(_DROPPED_TAGS)):
+        element.decompose()
+    for element in soup.select(".gmail_quote, .yahoo_quoted"):
+        element.decompose()
+    for element in soup(["br", *_BLOCK_TAGS]):
+        element.append("\n")
+    return soup.get_text()
+
+
+def html_to_text(html: str, parser: Optional[str] = None) -> str:
+    if (parser or HTML_PARSER) == "lxml":
+        try:
+            return _html_to_text_lxml(html)
+        except ImportError:
+            pass
+    return _html_to_text_bs4(html)
+
+
+def _decode_part(part: Message) -> str:
+    payload = part.get_payload(decode=True) or b""
+    return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+
+
+def best_part(message: Message) -> str:
+    """Body text of a message: text/plain, or text/html when plain is missing or a stub."""
+    plain = html = None
+    parts = message.walk() if message.is_multipart() else [message]
+    for part in parts:
+        if part.get_filename() or part.get_content_maintype() != "text":
+            continue
+        if part.get_content_subtype() == "plain" and plain is None:
+            plain = _decode_part(part)
+        elif part.get_content_subtype() == "html" and html is None:
+            html = _decode_part(part)
+    if plain is not None and (html is None or len(plain.strip()) >= PLAIN_MIN_CHARS):
+        return plain
+    return html if html is not None else (plain or "")
+
+
+def strip_quotes(lines: List[str]) -> List[str]:
+    """Lines before the first reply header, without ``>``-quoted lines."""
+    kept = []
+    for i, line in enumerate(lines):
+        following = lines[i + 1] if i + 1 < len(lines) else ""
+        if _REPLY_HEADER.match(line) or _REPLY_HEADER.match(line + " " + following):
+            break
+        if _OUTLOOK_FROM.match(line) and any(_OUTLOOK_FIELD.match(next_line) for next_line in lines[i + 1:i + 4]):
+            break
+        if not _QUOTED.match(line):
+            kept.append(line)
+    return kept
+
+
+def _is_signature_tail(lines: List[str]) -> bool:
+    """Whether the lines after a sign-off are a short name or contact block, not more message."""
+    tail = [line.strip() for line in lines if line.strip()]
+    if len(tail) > SIGNOFF_TAIL_LINES:
+        return False
+    for line in tail:
+        if len(line) > SIGNOFF_TAIL_CHARS or line.endswith((".", "!", "?", "…", ":")):
+            return False
+        if len(line.split()) > 4 and not _CONTACT.search(line):
+            return False
+    return True
+
+
+def strip_signature(lines: List[str]) -> List[str]:
+    """Lines before a signature delimiter or a closing sign-off, if any text remains."""
+    for i, line in enumerate(lines):
+        if _SIGNATURE.match(line.strip()) and any(earlier.strip() for earlier in lines[:i]):
+            return lines[:i]
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    for i in content[-SIGNOFF_LINES:]:
+        if (_SIGNOFF.match(lines[i].strip()) and any(lines[j].strip() for j in range(i))
+                and _is_signature_tail(lines[i + 1:])):
+            return lines[:i]
+    return lines
+
+
+def _cap(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " …"
+
+
+def clean_text(body: Optional[str], max_chars: int = MAX_CHARS) -> Optional[str]:
+    """The prompt-ready text of a stored body."""
+    if body is None:
+        return None
+    text = html_to_text(body) if is_html(body) else body
+    lines = [_SPACES.sub(" ", line).strip() for line in text.replace("\r\n", "\n").split("\n")]
+    lines = strip_signature(strip_quotes(lines))
+    text = _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+    return _cap(text, max_chars)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def extract(body: Optional[str]) -> Tuple[Optional[str], int, int]:
+    """(clean text, body tokens, clean tokens) for a stored body."""
+    clean = clean_text(body)
+    return clean, estimate_tokens(body), estimate_tokens(clean)
+
+
+def fill_derived(email) -> None:
+    """Set the cleaned body, token counts and preview of an email from its new body.
+
+    Called where a body is stored (``store_email``, batch ingest), not on
+    every attribute set, so loads and copies never re-run the extraction.
+    """
+    email.clean_body, email.body_tokens, email.clean_body_tokens = extract(email.body)
+    email.preview = make_preview(email.clean_body)
+
+
+_emails = table("emails", column("id"), column("body"), column("clean_body"), column("preview"),
+                column("body_tokens"), column("clean_body_tokens"))
+
+
+def clean_existing(bind=engine, batch_size: int = 500) -> int:
+    """Fill the cleaned body, token counts and preview of emails stored before extraction."""
+    sqlite = bind.dialect.name == "sqlite"
+    done, last_id = 0, 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(_emails.c.id, _emails.c.body).where(
+                    _emails.c.id > last_id,
+                    _emails.c.body.isnot(None),
+                    _emails.c.clean_body.is_(None),
+                ).order_by(_emails.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return done
+            params = []
+            for row_id, stored in rows:
+                body = decompress_text(stored)
+                clean, body_tokens, clean_tokens = extract(body)
+                params.append({
+                    "row_id": row_id,
+                    "new_clean_body": compress_text(clean) if sqlite else clean,
+                    "new_body_tokens": body_tokens,
+                    "new_clean_body_tokens": clean_tokens,
+                    "new_preview": make_preview(clean),
+                })
+            conn.execute(
+                update(_emails).where(_emails.c.id == bindparam("row_id")).values(
+                    clean_body=bindparam("new_clean_body"),
+                    body_tokens=bindparam("new_body_tokens"),
+                    clean_body_tokens=bindparam("new_clean_body_tokens"),
+                    preview=bindparam("new_preview"),
+                ),
+                params,
+            )
+        done += len(rows)
+        last_id = rows[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain cleaned email bodies")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("clean", help="Clean bodies of emails stored before extraction")
+    parser.parse_args()
+    print(f"Cleaned {clean_existing()} emails")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Compressed storage and previews for email bodies.
+
+``CompressedText`` compresses values on SQLite, with zlib by default or
+zstd when ``EMAIL_BODY_CODEC=zstd`` and the ``zstandard`` package is
+installed. Postgres already compresses large values through TOAST, so
+there the column is plain text. Compressed values start with a two-byte
+header that names the codec. Anything without one is read as UTF-8 text:
+rows written before compression, bodies too short to be worth it, or
+``EMAIL_BODY_CODEC=none``. Upgrading therefore needs no rewrite;
+``python -m app.services.body_storage compress`` recompresses old rows.
+
+Every SQLite connection of the app gets an ``email_body(value)`` SQL
+function that decodes a stored body. The full-text index triggers and
+search fallbacks use it. SQLite functions live only on the connection that
+registered them, so any other client that writes ``emails`` needs it
+too: ``register_functions`` adds it to a DB-API connection, and
+``python -m app.services.body_storage sql "..."`` runs a statement with
+it. Without it, as in the sqlite3 shell, an INSERT, UPDATE or DELETE on
+``emails`` fails with "no such function: email_body". That is on
+purpose. A trigger that indexed the stored bytes instead would disagree
+with the ``emails_fts_content`` view, and FTS5 external-content indexes
+are corrupted by deletes whose values do not match what was indexed.
+
+``make_preview`` builds the short ``emails.preview`` text that list views
+show instead of loading the body.
+"""
+import argparse
+import re
+import zlib
+from os import getenv
+from typing import Optional, Union
+
+from sqlalchemy import Text, bindparam, column, event, select, table, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import TypeDecorator
+
+from ..database import engine
+
+CODEC = getenv("EMAIL_BODY_CODEC", "zlib").lower()
+MIN_BYTES = int(getenv("EMAIL_BODY_COMPRESS_MIN_BYTES", "256"))
+PREVIEW_CHARS = int(getenv("EMAIL_PREVIEW_CHARS", "160"))
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+ZLIB_HEADER = b"\x00z"
+ZSTD_HEADER = b"\x00s"
+
+_WHITESPACE = re.compile(r"\s+")
+_zstd = None
+
+
+def _zstandard():
+    global _zstd
+    if _zstd is None:
+        import zstandard
+        _zstd = (zstandard.ZstdCompressor(level=ZSTD_LEVEL), zstandard.ZstdDecompressor())
+    return _zstd
+
+
+def compress_text(value: str, codec: Optional[str] = None) -> bytes:
+    """Encode ``value`` for storage: header plus compressed UTF-8, or raw UTF-8."""
+    raw = value.encode("utf-8")
+    codec = codec or CODEC
+    if len(raw) < MIN_BYTES or codec == "none":
+        return raw
+    if codec == "zstd":
+        return ZSTD_HEADER + _zstandard()[0].compress(raw)
+    return ZLIB_HEADER + zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value.startswith(ZLIB_HEADER):
+        return zlib.decompress(value[2:]).decode("utf-8")
+    if value.startswith(ZSTD_HEADER):
+        return _zstandard()[1].decompress(value[2:]).decode("utf-8")
+    return value.decode("utf-8", errors="replace")
+
+
+def make_preview(body: Optional[str], length: int = PREVIEW_CHARS) -> Optional[str]:
+    """First ``length`` characters of the body with whitespace collapsed."""
+    if body is None:
+        return None
+    collapsed = _WHITESPACE.sub(" ", body).strip()
+    if len(collapsed) <= length:
+        return collapsed
+    return collapsed[:length].rstrip() + "…"
+
+
+class CompressedText(TypeDecorator):
+    """Text compressed in the database on SQLite; plain text elsewhere."""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+    def coerce_compared_value(self, op, value):
+        # LIKE patterns and equality values must not be compressed
+        return Text()
+
+
+def register_functions(dbapi_connection):
+    """Add ``email_body()`` to a SQLite DB-API connection, e.g. ``sqlite3.connect(path)``."""
+    dbapi_connection.create_function("email_body", 1, decompress_text, deterministic=True)
+
+
+@event.listens_for(Engine, "connect")
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if hasattr(dbapi_connection, "create_function"):
+        register_functions(dbapi_connection)
+
+
+def run_sql(statement: str, bind=engine) -> list:
+    """Run one SQL statement, as-is, on a connection with ``email_body()``; its rows, if any."""
+    with bind.begin() as conn:
+        result = conn.exec_driver_sql(statement)
+        return result.all() if result.returns_rows else []
+
+
+_emails = table("emails", column("id"), column("body"), column("preview"))
+
+
+def compress_existing(bind=engine, batch_size: int = 500) -> int:
+    """Compress uncompressed SQLite bodies and fill missing previews, in short batches."""
+    if bind.dialect.name != "sqlite":
+        return 0
+    done, last_id = 0, 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(_emails.c.id, text("email_body(body)")).where(
+                    _emails.c.id > last_id,
+                    text("(typeof(body) = 'text' OR preview IS NULL)"),
+                ).order_by(_emails.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return done
+            conn.execute(
+                update(_emails).where(_emails.c.id == bindparam("row_id")).values(
+                    body=bindparam("new_body"), preview=bindparam("new_preview")
+                ),
+                [{"row_id": row_id, "new_body": compress_text(body) if body is not None else None,
+                  "new_preview": make_preview(body)} for row_id, body in rows],
+            )
+        done += len(rows)
+        last_id = rows[-1][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain compressed email bodies")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compress", help="Compress old SQLite bodies and fill missing previews")
+    sql = sub.add_parser("sql", help="Run a SQL statement with email_body() available, "
+                                     "e.g. a manual UPDATE or DELETE on emails")
+    sql.add_argument("statement")
+    args = parser.parse_args()
+
+    if args.command == "sql":
+        for row in run_sql(args.statement):
+            print(*row, sep="\t")
+        return
+    print(f"Rewrote {compress_existing()} emails")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Customer resolution cache and coalesced ticket counters.
+
+The processing path resolves every sender to a ``Customer``: once to
+link the email and once for the response prompt. ``customers.get`` keeps
+a bounded LRU (``CUSTOMER_CACHE_SIZE``) keyed by the lower-cased sender
+address. Misses cost one indexed lookup, and unknown senders are cached
+too, so mail from non-customers stops reaching the database. Entries
+expire after ``CUSTOMER_CACHE_TTL`` seconds. Any committed change to a
+``Customer`` row in this process drops its entry, and a new customer
+replaces a cached "unknown". Cached customers are detached read-only
+snapshots, shared between callers.
+
+Each new email from a known customer counts as a ticket. Counts are
+collected per transaction and merged on commit, then written by a
+background thread every ``CUSTOMER_COUNTER_FLUSH_SECONDS``. The write is
+one batched ``UPDATE customers SET total_tickets = total_tickets + n``
+per customer, so a busy customer costs one row write per interval, not
+one per email. Cached snapshots are bumped as counts are committed, so
+prompts see current totals before the write lands.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from os import getenv
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, case, event, func, inspect, or_, update
+from sqlalchemy.orm import Session
+
+from ..database import engine
+from ..models.email import Customer, Email
+from . import telemetry
+
+CACHE_SIZE = int(getenv("CUSTOMER_CACHE_SIZE", "10000"))
+CACHE_TTL = float(getenv("CUSTOMER_CACHE_TTL", "300"))
+FLUSH_SECONDS = float(getenv("CUSTOMER_COUNTER_FLUSH_SECONDS", "5"))
+
+_COLUMNS = [column.key for column in Customer.__table__.columns]
+
+
+def normalize(address: Optional[str]) -> str:
+    return (address or "").strip().lower()
+
+
+def _snapshot(customer: Customer) -> Customer:
+    """A detached copy that no session will expire or refresh."""
+    return Customer(**{name: getattr(customer, name) for name in _COLUMNS})
+
+
+class CustomerCache:
+    """Bounded LRU of address -> Customer snapshot (or None for unknown senders)."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Optional[Customer], float]]" = OrderedDict()
+        # customer id -> cached addresses, so committed counts reach their snapshots directly
+        self._addresses: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, address: Optional[str]) -> Optional[Customer]:
+        key = normalize(address)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        customer = db.query(Customer).filter(
+            Customer.email.in_(list({address.strip(), key}))
+        ).first()
+        if customer is not None:
+            customer = _snapshot(customer)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (customer, time.monotonic())
+            if customer is not None:
+                self._addresses.setdefault(customer.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return customer
+
+    def _drop(self, key: str):
+        """Remove an entry and its id index; the caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] is not None:
+            keys = self._addresses.get(entry[0].id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._addresses[entry[0].id]
+
+    def invalidate(self, addresses: Iterable[str]):
+        with self._lock:
+            for address in addresses:
+                self._drop(normalize(address))
+
+    def note_tickets(self, counts: Dict[int, List]):
+        """Apply committed ticket counts to the cached snapshots."""
+        with self._lock:
+            for customer_id, count in counts.items():
+                for key in self._addresses.get(customer_id, ()):
+                    _add_tickets(self._entries[key][0], *count)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._addresses.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _add_tickets(customer: Customer, tickets: int, last_contact: Optional[datetime]):
+    customer.total_tickets = (customer.total_tickets or 0) + tickets
+    if last_contact is not None and (customer.last_contact is None or customer.last_contact < last_contact):
+        customer.last_contact = last_contact
+
+
+def _merge(into: Dict[int, List], counts: Dict[int, List]):
+    for customer_id, (tickets, last_contact) in counts.items():
+        current = into.setdefault(customer_id, [0, None])
+        current[0] += tickets
+        if last_contact is not None and (current[1] is None or current[1] < last_contact):
+            current[1] = last_contact
+
+
+_customers = Customer.__table__
+_INCREMENT = update(_customers).where(_customers.c.id == bindparam("customer_id")).values(
+    total_tickets=func.coalesce(_customers.c.total_tickets, 0) + bindparam("tickets"),
+    last_contact=case(
+        (or_(_customers.c.last_contact.is_(None), _customers.c.last_contact < bindparam("contact")),
+         bindparam("contact")),
+        else_=_customers.c.last_contact,
+    ),
+)
+
+
+class TicketCounters:
+    """Committed-but-unwritten ticket counts, flushed in batches by a daemon thread."""
+
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS, bind=None):
+        self.flush_seconds = flush_seconds
+        self.bind = bind
+        self._pending: Dict[int, List] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+
+    def add(self, counts: Dict[int, List]):
+        with self._lock:
+            _merge(self._pending, counts)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="customer-counters", daemon=True)
+                self._thread.start()
+
+    def take(self) -> Dict[int, List]:
+        """Remove and return the pending {customer_id: [tickets, last_contact]}."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    @property
+    def pending(self) -> int:
+        """Tickets counted but not yet written."""
+        with self._lock:
+            return sum(tickets for tickets, _ in self._pending.values())
+
+    def flush(self, bind=None) -> int:
+        """Write every pending count in one batched UPDATE. Returns the customers updated."""
+        pending = self.take()
+        if not pending:
+            return 0
+        params = [{"customer_id": customer_id, "tickets": tickets,
+                   "contact": last_contact or datetime.utcnow()}
+                  for customer_id, (tickets, last_contact) in pending.items()]
+        try:
+            with (bind or self.bind or engine).begin() as conn:
+                conn.execute(_INCREMENT, params)
+        except Exception as e:
+            # Keep the counts for the next attempt
+            with self._lock:
+                _merge(self._pending, pending)
+            telemetry.flush_errors.inc(1, "customer_counters")
+            telemetry.log(f"Customer counter flush error: {str(e)}")
+            return 0
+        self.flushes += 1
+        return len(params)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+customers = CustomerCache()
+ticket_counters = TicketCounters()
+atexit.register(ticket_counters.flush)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session: Session, flush_context):
+    counts: Dict[int, List] = {}
+    for obj in session.new:
+        if isinstance(obj, Email) and obj.customer_id is not None:
+            _merge(counts, {obj.customer_id: [1, obj.received_at]})
+    if counts:
+        _merge(session.info.setdefault("customer_tickets", {}), counts)
+
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Customer):
+            changed.add(obj.email)
+            changed.update(inspect(obj).attrs.email.history.deleted or ())
+    if changed:
+        session.info.setdefault("customer_changes", set()).update(
+            address for address in changed if address
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    changed = session.info.pop("customer_changes", None)
+    if changed:
+        customers.invalidate(changed)
+    counts = session.info.pop("customer_tickets", None)
+    if counts:
+        ticket_counters.add(counts)
+        customers.note_tickets(counts)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop("customer_changes", None)
+    session.info.pop("customer_tickets", None)
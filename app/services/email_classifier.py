@@ -1,12 +1,13 @@
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from typing import Dict, Optional
 import json
 from ..config import settings
 from ..models.email import UrgencyLevel
+from . import telemetry
 
 class EmailClassifier:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
         self.model = "claude-3-opus-20240229"
 
     async def classify_email(self, email_data: Dict) -> Dict:
@@ -78,7 +79,7 @@ class EmailClassifier:
                 - Response priority (1-5)
 
             Return the analysis as a JSON object with these exact fields:
-            {
+            {{
                 "main_category": string,
                 "sub_category": string,
                 "sentiment_score": float,
@@ -88,7 +89,7 @@ class EmailClassifier:
                 "priority": int,
                 "confidence": float,
                 "requires_escalation": boolean
-            }
+            }}
             """
 
             response = await self.client.messages.create(
@@ -96,6 +97,7 @@ class EmailClassifier:
                 max_tokens=1000,
                 messages=[{"role": "user", "content": prompt}]
             )
+            telemetry.record_usage("classify", response.usage)
 
             classification = json.loads(response.content[0].text)
             
@@ -112,7 +114,8 @@ class EmailClassifier:
             return classification
 
         except Exception as e:
-            print(f"Classification error: {str(e)}")
+            telemetry.record_error("classify")
+            telemetry.log(f"Classification error: {str(e)}")
             return {
                 "main_category": "Other",
                 "sub_category": "Unknown",
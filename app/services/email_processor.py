@@ -0,0 +1,246 @@
+import email
+from datetime import datetime
+from email.header import decode_header
+from email.utils import make_msgid, parseaddr
+from typing import Dict, Optional, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+
+from ..models.email import Customer, Email, EmailStatus, Response, UrgencyLevel
+from . import telemetry, threads
+from .body_extraction import best_part, fill_derived
+from .customer_cache import customers
+from .email_classifier import EmailClassifier
+from .response_generator import ResponseGenerator
+
+
+class EmailProcessor:
+    """Store incoming emails, classify them and draft a response.
+
+    The LLM calls live in ``analyze``, which never touches the database, so
+    callers that must not hold a connection across model latency can load
+    an email, close their session, analyze, and ``apply`` in a new one.
+    """
+
+    def __init__(self, db: Session,
+                 classifier: Optional[EmailClassifier] = None,
+                 generator: Optional[ResponseGenerator] = None):
+        self.db = db
+        self._classifier = classifier
+        self._generator = generator
+
+    @property
+    def classifier(self) -> EmailClassifier:
+        if self._classifier is None:
+            self._classifier = EmailClassifier()
+        return self._classifier
+
+    @property
+    def generator(self) -> ResponseGenerator:
+        if self._generator is None:
+            self._generator = ResponseGenerator()
+        return self._generator
+
+    async def process_email(self, email_data: Union[Dict, bytes]) -> Optional[Dict]:
+        """Store (or reuse) an email, classify it and draft a response.
+
+        Accepts an ``EmailCreate``-shaped dict or a raw RFC 822 message.
+        Returns ``{'email': Email, 'response': Response}`` or None on failure.
+        """
+        try:
+            if isinstance(email_data, bytes):
+                email_data = self.parse_raw_email(email_data)
+            stored = self.store_email(email_data)
+            return await self.process_stored(stored)
+        except Exception as e:
+            print(f"Email processing error: {str(e)}")
+            return None
+
+    async def process_stored(self, stored: Email) -> Dict:
+        """Classify and respond to an email that is already in the database."""
+        customer = self.find_customer(stored.sender_email)
+        try:
+            classification, response_data = await self.analyze(stored, customer)
+        except Exception as e:
+            stored.status = EmailStatus.FAILED
+            stored.error_message = str(e)
+            self.db.flush()
+            raise
+        response = self.apply(stored, classification, response_data)
+        return {"email": stored, "response": response}
+
+    async def analyze(self, stored: Email, customer: Optional[Customer] = None) -> Tuple[Dict, Dict]:
+        """Run the classifier and response generator. No database access."""
+        email_data = {"subject": stored.subject, "body": stored.clean_body or stored.body}
+        with telemetry.timed("classify"):
+            classification = await self.classifier.classify_email(email_data)
+        with telemetry.timed("generate"):
+            response_data = await self.generator.generate_response(stored, classification, customer)
+        response_data.setdefault("model_version", self.generator.model)
+        return classification, response_data
+
+    def apply(self, stored: Email, classification: Dict, response_data: Dict) -> Response:
+        """Write a classification and drafted response onto ``stored`` and flush."""
+        stored.main_category = classification.get("main_category")
+        stored.sub_category = classification.get("sub_category")
+        stored.classification_confidence = classification.get("confidence")
+        stored.keywords = classification.get("keywords")
+        stored.sentiment_score = classification.get("sentiment_score")
+        try:
+            stored.urgency = UrgencyLevel(str(classification.get("urgency", "")).lower())
+        except ValueError:
+            stored.urgency = UrgencyLevel.MEDIUM
+        stored.processed_at = datetime.utcnow()
+        stored.status = EmailStatus.PROCESSED
+        stored.error_message = None
+
+        prompt_tokens = response_data.get("prompt_tokens")
+        completion_tokens = response_data.get("completion_tokens")
+        response = Response(
+            email=stored,
+            content=response_data.get("response_text", ""),
+            model_version=response_data.get("model_version"),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=(prompt_tokens or 0) + (completion_tokens or 0) if prompt_tokens is not None else None,
+        )
+        self.db.add(response)
+        self.db.flush()
+        return response
+
+    def store_email(self, email_data: Dict) -> Email:
+        """Insert an email, or return the stored one with the same message_id.
+
+        New emails are placed in their thread; a reply to a known thread
+        marks the responses already in it as replied to.
+        """
+        message_id = email_data.get("message_id") or make_msgid(domain="slyfone.com")
+        stored = self.db.query(Email).options(undefer(Email.body), undefer(Email.clean_body)).filter(
+            Email.message_id == message_id
+        ).first()
+        if stored is not None:
+            return stored
+
+        references = threads.references_of(email_data)
+        threads.thread_index.prefetch(self.db, references)
+        thread_id, known_thread = threads.thread_for(message_id, references)
+        stored = Email(
+            message_id=message_id,
+            thread_id=thread_id,
+            sender_email=email_data.get("sender_email"),
+            sender_name=email_data.get("sender_name"),
+            recipient_email=email_data.get("recipient_email"),
+            subject=email_data.get("subject"),
+            body=email_data.get("body"),
+            is_reply=email_data.get("is_reply", False),
+            additional_data=email_data.get("additional_data"),
+            status=EmailStatus.NEW,
+        )
+        fill_derived(stored)
+        customer = self.find_customer(stored.sender_email)
+        if customer is not None:
+            stored.customer_id = customer.id
+        self.db.add(stored)
+        self.db.flush()
+        if known_thread:
+            threads.mark_replied(self.db, [thread_id])
+        threads.thread_index.remember(message_id, thread_id)
+        return stored
+
+    def find_customer(self, sender_email: Optional[str]) -> Optional[Customer]:
+        """Cached read-only snapshot of the sender's customer record, or None."""
+        return customers.get(self.db, sender_email)
+
+    @staticmethod
+    def parse_raw_email(raw: bytes) -> Dict:
+        """Extract the EmailCreate fields from a raw RFC 822 message."""
+        with telemetry.timed("mime_parse"):
+            message = email.message_from_bytes(raw)
+            sender_name, sender_email = parseaddr(_decode(message.get("From", "")))
+            _, recipient_email = parseaddr(_decode(message.get("To", "")))
+
+            return {
+                "message_id": message.get("Message-ID"),
+                "references": threads.reply_references(message.get("In-Reply-To"),
+                                                       message.get("References")),
+                "sender_email": sender_email,
+                "sender_name": sender_name or None,
+                "recipient_email": recipient_email,
+                "subject": _decode(message.get("Subject", "")),
+                "body": best_part(message),
+                "is_reply": bool(message.get("In-Reply-To") or message.get("References")),
+            }
+
+
+def _decode(header: str) -> str:
+    if not header:
+        return ""
+    decoded = []
+    for value, charset in decode_header(header):
+        if isinstance(value, bytes):
+            value = value.decode(charset or "utf-8", errors="ignore")
+        decoded.append(value)
+    return "".join(decoded)
+
+
+def _store_with_customer(db: Session, email_data: Dict):
+    processor = EmailProcessor(db)
+    stored = processor.store_email(email_data)
+    return stored, processor.find_customer(stored.sender_email)
+
+
+async def process_email_async(db: AsyncSession, email_data: Union[Dict, bytes],
+                              processor: Optional[EmailProcessor] = None) -> Optional[Dict]:
+    """``EmailProcessor.process_email`` on an AsyncSession.
+
+    The stored email is committed before the model calls, so no connection
+    is held while they run; a failure leaves it NEW or FAILED for a retry.
+    """
+    try:
+        if isinstance(email_data, bytes):
+            email_data = EmailProcessor.parse_raw_email(email_data)
+        stored, customer = await db.run_sync(_store_with_customer, email_data)
+        with telemetry.timed("db_commit"):
+            await db.commit()
+        return await _classify_async(db, stored, customer, processor)
+    except Exception as e:
+        await db.rollback()
+        telemetry.log(f"Email processing error: {str(e)}")
+        return None
+
+
+async def process_stored_async(db: AsyncSession, stored: Email,
+                               processor: Optional[EmailProcessor] = None) -> Optional[Dict]:
+    """Classify and respond to an already stored email on an AsyncSession."""
+    try:
+        customer = await db.run_sync(
+            lambda session: EmailProcessor(session).find_customer(stored.sender_email)
+        )
+        await db.commit()
+        return await _classify_async(db, stored, customer, processor)
+    except Exception as e:
+        await db.rollback()
+        telemetry.log(f"Email processing error: {str(e)}")
+        return None
+
+
+async def _classify_async(db: AsyncSession, stored: Email, customer: Optional[Customer],
+                          processor: Optional[EmailProcessor]) -> Optional[Dict]:
+    processor = processor or EmailProcessor(None)
+    try:
+        classification, response_data = await processor.analyze(stored, customer)
+    except Exception as e:
+        stored.status = EmailStatus.FAILED
+        stored.error_message = str(e)
+        with telemetry.timed("db_commit"):
+            await db.commit()
+        telemetry.log(f"Email processing error: {str(e)}")
+        return None
+
+    response = await db.run_sync(
+        lambda session: EmailProcessor(session).apply(stored, classification, response_data)
+    )
+    with telemetry.timed("db_commit"):
+        await db.commit()
+    return {"email": stored, "response": response}
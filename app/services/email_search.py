@@ -0,0 +1,298 @@
+"""Full-text search over email subject, body and sender.
+
+SQLite uses an FTS5 external-content table ``emails_fts`` kept in sync by
+triggers and ranked with bm25(). It reads bodies through the
+``emails_fts_content`` view, which decodes compressed bodies. Postgres
+uses a stored generated ``search_vector`` tsvector column with a GIN
+index, ranked with ts_rank_cd() and highlighted with ts_headline(). Both
+are created by migrations 005 and 010. On a SQLite database built with ``create_all``, run
+``python -m app.services.email_search rebuild`` once. The SQLite triggers
+call ``email_body()``, so clients outside the app must register it
+before writing ``emails`` (see ``body_storage``).
+
+User input is never passed through as query syntax. Terms are reduced to
+word tokens and matched as prefixes, so partial words typed in the agent
+UI already match.
+
+Ranking every match of a common word would grow with the mailbox, so an
+unfiltered relevance search ranks only the newest ``SEARCH_RANK_WINDOW``
+matches (by id). Finding that window reads only the index, which keeps
+latency flat as the table grows. Older matches are not scored: they
+follow the ranked ones, newest first, with a score of 0, and the total
+counts them too. Filtered and RECENT searches skip the window: a filter
+can select matches older than it, and RECENT order needs no ranking
+sort. Set it to 0 to rank all matches.
+
+Only the hot tier is indexed. Searches that include archived emails scan
+both tiers by substring, newest first.
+"""
+import argparse
+import re
+from os import getenv
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, column, func, inspect as sa_inspect, literal, literal_column, select, table, text
+from sqlalchemy.orm import Session, undefer
+
+from ..database import SessionLocal, engine
+from ..models.email import Email
+from .archive import sources
+from .pagination import Page, estimate_count, paginate
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_TOKENS = 16
+RANK_WINDOW = int(getenv("SEARCH_RANK_WINDOW", "5000"))
+# Sort key of matches older than the rank window: below every real score
+UNRANKED = -1.0
+
+RELEVANCE = "relevance"
+RECENT = "recent"
+ORDERS = (RELEVANCE, RECENT)
+
+# Column weights: subject and sender count double relative to body
+SUBJECT_WEIGHT, BODY_WEIGHT, SENDER_WEIGHT = 2.0, 1.0, 2.0
+
+SQLITE_DDL = [
+    # Bodies may be stored compressed (see body_storage); FTS reads them decoded through this view
+    """CREATE VIEW IF NOT EXISTS emails_fts_content AS
+        SELECT id, subject, email_body(body) AS body, sender_email FROM emails""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+        subject, body, sender_email,
+        content='emails_fts_content', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, email_body(new.body), new.sender_email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, email_body(old.body), old.sender_email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject, body, sender_email ON emails BEGIN
+        INSERT INTO emails_fts(emails_fts, rowid, subject, body, sender_email)
+        VALUES ('delete', old.id, old.subject, email_body(old.body), old.sender_email);
+        INSERT INTO emails_fts(rowid, subject, body, sender_email)
+        VALUES (new.id, new.subject, email_body(new.body), new.sender_email);
+    END""",
+]
+
+POSTGRES_DDL = [
+    """ALTER TABLE emails ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(sender_email, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_emails_search_vector ON emails USING gin (search_vector)",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+emails_fts = table("emails_fts", column("rowid"))
+_fts_ready: Dict[str, bool] = {}
+
+
+def query_terms(query: str) -> List[List[str]]:
+    """Split user input into terms, each a list of word tokens."""
+    terms = []
+    for raw in query.split():
+        tokens = _TOKEN_RE.findall(raw.lower())
+        if tokens:
+            terms.append(tokens)
+    return terms
+
+
+def fts5_query(query: str) -> Optional[str]:
+    """Build a safe FTS5 MATCH expression: prefix words, phrases for a@b.c style terms."""
+    parts = []
+    for tokens in query_terms(query):
+        if len(tokens) == 1:
+            parts.append(f'"{tokens[0]}"*')
+        else:
+            parts.append('"' + " ".join(tokens) + '"')
+    return " ".join(parts) or None
+
+
+def tsquery(query: str) -> Optional[str]:
+    """Build a safe to_tsquery() expression with prefix matching."""
+    parts = []
+    for tokens in query_terms(query):
+        if len(tokens) == 1:
+            parts.append(f"{tokens[0]}:*")
+        else:
+            parts.append("(" + " <-> ".join(tokens) + ")")
+    return " & ".join(parts) or None
+
+
+def search_index_ready(db: Session) -> bool:
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _fts_ready:
+        # Inspect on the session's connection so this also works under AsyncSession.run_sync
+        inspector = sa_inspect(db.connection())
+        if bind.dialect.name == "sqlite":
+            _fts_ready[key] = inspector.has_table("emails_fts")
+        elif bind.dialect.name == "postgresql":
+            _fts_ready[key] = any(
+                col["name"] == "search_vector" for col in inspector.get_columns("emails")
+            )
+        else:
+            _fts_ready[key] = False
+    return _fts_ready[key]
+
+
+def _window_floor(id_column, matching):
+    """Smallest id among the newest RANK_WINDOW matches (0 if there are fewer)."""
+    floor = matching.order_by(id_column.desc()).offset(RANK_WINDOW - 1).limit(1)
+    return func.coalesce(floor.scalar_subquery(), 0)
+
+
+def _windowed(score, id_column, matching):
+    """``score`` for the newest RANK_WINDOW matches, UNRANKED (not computed) for older ones."""
+    return case((id_column >= _window_floor(id_column, matching), score), else_=literal(UNRANKED))
+
+
+def _reported(score) -> float:
+    return max(float(score), 0.0)
+
+
+def search_emails(db: Session, query: str, filters: list, limit: int = 100,
+                  cursor: Optional[str] = None, order: str = RELEVANCE,
+                  skip: int = 0, count: bool = False, include_archived: bool = False,
+                  include_body: bool = False) -> Page:
+    """Return a page of (email, score, snippet) tuples.
+
+    ``order`` is RELEVANCE (best match first, higher scores are better on
+    every backend) or RECENT (newest first). Without a usable index or
+    search terms, or with ``include_archived`` (``filters`` must then be
+    built on ``archive.all_emails``), results are always RECENT with a
+    score of 0. ``include_body`` loads the deferred body with the emails.
+    """
+    dialect = db.get_bind().dialect.name
+    indexed = dialect in ("sqlite", "postgresql") and search_index_ready(db)
+    windowed = RANK_WINDOW > 0 and order == RELEVANCE and not filters
+    emails, _, tier = sources(include_archived)
+    filters = [*filters, *tier]
+    options = [undefer(emails.body)] if include_body else []
+    if not query_terms(query) or not indexed or include_archived:
+        base = db.query(emails).options(*options).filter(*filters)
+        if query_terms(query):
+            # Unindexed fallback: substring match, no ranking
+            like = f"%{query}%"
+            body = func.email_body(emails.body) if dialect == "sqlite" else emails.body
+            base = base.filter(
+                (emails.subject.ilike(like)) |
+                (body.ilike(like)) |
+                (emails.sender_email.ilike(like))
+            )
+        page = paginate(base, [emails.received_at, emails.id],
+                        lambda email: (email.received_at, email.id),
+                        limit, cursor, descending=True, offset=skip, order=RECENT)
+        page.items = [(email, 0.0, None) for email in page.items]
+        if count:
+            _count(page, base)
+        return page
+
+    if dialect == "sqlite":
+        matches = text("emails_fts MATCH :match").bindparams(match=fts5_query(query))
+        # bm25() is lower-is-better; negate so callers can sort descending
+        score = -func.bm25(literal_column("emails_fts"), SUBJECT_WEIGHT, BODY_WEIGHT, SENDER_WEIGHT)
+        snippet = func.snippet(literal_column("emails_fts"), -1, HIGHLIGHT_START,
+                               HIGHLIGHT_END, "…", SNIPPET_TOKENS)
+        if windowed:
+            score = _windowed(score, emails_fts.c.rowid, select(emails_fts.c.rowid).where(matches))
+        ranked = db.query(Email, score.label("score"), snippet.label("snippet")).options(*options).join(
+            emails_fts, emails_fts.c.rowid == Email.id
+        ).filter(matches, *filters)
+        keys, key_of = _order_keys(order, score, lambda row: row[0])
+        page = paginate(ranked, keys, key_of, limit, cursor,
+                        descending=True, offset=skip, order=order)
+        page.items = [(email, _reported(score), snippet) for email, score, snippet in page.items]
+        if count:
+            _count(page, db.query(Email.id).join(
+                emails_fts, emails_fts.c.rowid == Email.id
+            ).filter(matches, *filters))
+        return page
+
+    vector = literal_column("emails.search_vector")
+    ts_query = func.to_tsquery("english", tsquery(query))
+    score = func.ts_rank_cd(vector, ts_query)
+    if windowed:
+        score = _windowed(score, Email.id, select(Email.id).where(vector.op("@@")(ts_query)))
+    ranked = db.query(Email.id, Email.received_at, score.label("score")).filter(
+        vector.op("@@")(ts_query), *filters
+    )
+    keys, key_of = _order_keys(order, score, lambda row: row)
+    page = paginate(ranked, keys, key_of, limit, cursor,
+                    descending=True, offset=skip, order=order)
+
+    # Headline only the rows being returned
+    snippet = func.ts_headline(
+        "english", func.coalesce(Email.body, ""), ts_query,
+        f"StartSel={HIGHLIGHT_START},StopSel={HIGHLIGHT_END},"
+        f"MaxFragments=1,MaxWords={SNIPPET_TOKENS},MinWords=5"
+    )
+    ids = [row.id for row in page.items]
+    found = {
+        email.id: (email, highlighted)
+        for email, highlighted in db.query(Email, snippet).options(*options).filter(
+            Email.id.in_(ids)
+        ).all()
+    } if ids else {}
+    page.items = [
+        (found[row.id][0], _reported(row.score), found[row.id][1])
+        for row in page.items if row.id in found
+    ]
+    if count:
+        _count(page, db.query(Email.id).filter(vector.op("@@")(ts_query), *filters))
+    return page
+
+
+def _order_keys(order: str, score, email_of):
+    """Keyset columns for an order, and how to read them from a result row."""
+    if order == RECENT:
+        return [Email.received_at, Email.id], lambda row: (
+            email_of(row).received_at, email_of(row).id
+        )
+    return [score, Email.id], lambda row: (float(row.score), email_of(row).id)
+
+
+def _count(page: Page, query):
+    page.total, page.total_exact = estimate_count(query)
+
+
+def ensure_search_index(bind):
+    """Create the full-text index objects for the bind's dialect if missing."""
+    statements = {"sqlite": SQLITE_DDL, "postgresql": POSTGRES_DDL}.get(bind.dialect.name, [])
+    with bind.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+    _fts_ready.pop(str(bind.url), None)
+
+
+def rebuild_search_index(bind):
+    """Re-index every email (SQLite); Postgres generated columns need no rebuild."""
+    if bind.dialect.name == "sqlite":
+        with bind.begin() as conn:
+            conn.execute(text("INSERT INTO emails_fts(emails_fts) VALUES ('rebuild')"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the email full-text index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="Create the index if missing and re-index all emails")
+    parser.parse_args()
+
+    ensure_search_index(engine)
+    rebuild_search_index(engine)
+    db = SessionLocal()
+    try:
+        print("Search index ready" if search_index_ready(db) else "Search index unavailable")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from typing import List, Optional
 from datetime import datetime
 from ..config import settings
 from ..models.email import Email, Response
+from . import telemetry
+from .threads import response_message_id
 
 class EmailSender:
     def __init__(self):
@@ -12,7 +14,8 @@ class EmailSender:
         self.smtp_port = settings.SMTP_PORT
         self.smtp_user = settings.SMTP_USER
         self.smtp_password = settings.SMTP_PASSWORD
-        self.default_sender = "support@slyfone.com"
+        self.use_tls = settings.SMTP_USE_TLS
+        self.default_sender = settings.SUPPORT_EMAIL
 
     async def send_response(self,
                           email: Email,
@@ -26,18 +29,27 @@ class EmailSender:
             msg["Subject"] = f"Re: {email.subject}"
             msg["From"] = self.default_sender
             msg["To"] = email.sender_email
+            # Threading headers, so the customer's reply finds its way back to this thread
+            msg["Message-ID"] = response_message_id(response)
+            msg["In-Reply-To"] = email.message_id
+            msg["References"] = " ".join(dict.fromkeys(
+                ref for ref in (email.thread_id, email.message_id) if ref
+            ))
+            msg["Auto-Submitted"] = "auto-replied"
+            if telemetry.trace_id.get():
+                msg[telemetry.TRACE_HEADER] = telemetry.trace_id.get()
             
             if cc_addresses:
                 msg["Cc"] = ", ".join(cc_addresses)
             
             # Add response content
             html_content = self._format_html_response(response.content)
-            msg.attach(MIMEText(html_content, "html"))
+            msg.attach(MIMEText(html_content, "html", "utf-8"))
 
             # Add original message as quote
             if email.body:
                 quoted_text = self._format_quoted_text(email.body)
-                msg.attach(MIMEText(quoted_text, "html"))
+                msg.attach(MIMEText(quoted_text, "html", "utf-8"))
 
             # Configure recipients
             recipients = [email.sender_email]
@@ -47,11 +59,12 @@ class EmailSender:
                 recipients.extend(bcc_addresses)
 
             # Send email
-            async with aiosmtplib.SMTP(hostname=self.smtp_server,
-                                     port=self.smtp_port,
-                                     use_tls=True) as smtp:
-                await smtp.login(self.smtp_user, self.smtp_password)
-                await smtp.send_message(msg, recipients)
+            with telemetry.timed("smtp_send"):
+                async with aiosmtplib.SMTP(hostname=self.smtp_server,
+                                         port=self.smtp_port,
+                                         use_tls=self.use_tls) as smtp:
+                    await smtp.login(self.smtp_user, self.smtp_password)
+                    await smtp.send_message(msg, recipients=recipients)
 
             # Update response status
             response.is_sent = True
@@ -61,17 +74,18 @@ class EmailSender:
             return True
 
         except Exception as e:
-            print(f"Error sending email: {str(e)}")
+            telemetry.log(f"Error sending email: {str(e)}")
             response.error_message = str(e)
             response.send_attempts += 1
             return False
 
     def _format_html_response(self, content: str) -> str:
         """Format response content as HTML."""
+        content = content.replace('\n', '<br>')
         html_template = f"""
         <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
             <div style="padding: 20px; background-color: #ffffff;">
-                {content.replace('\n', '<br>')}
+                {content}
             </div>
             <div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #eee;">
                 <img src="https://www.slyfone.com/images/logo.png" alt="SLYFONE" style="height: 40px;">
@@ -87,10 +101,11 @@ class EmailSender:
 
     def _format_quoted_text(self, original_text: str) -> str:
         """Format original message as quoted text."""
+        original_text = original_text.replace('\n', '<br>')
         quoted_html = f"""
         <div style="margin-top: 20px; padding: 10px; border-left: 2px solid #ccc; color: #666;">
             <p style="font-size: 12px; margin-bottom: 10px;">Original Message:</p>
-            {original_text.replace('\n', '<br>')}
+            {original_text}
         </div>
         """
         return quoted_html
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Columnar export of emails for BI tools.
+
+Rows are read with a server-side cursor (``stream_results``) in batches
+of ``EXPORT_BATCH_SIZE``. Each batch goes straight from Core result rows
+to an Arrow record batch, with no ORM objects or pydantic models in
+between. Batches are written as an Arrow IPC stream or as one Parquet
+row group each, and the bytes are handed to the client as soon as each
+batch is written. Memory use stays at about one batch, however long the
+date range.
+
+Exports read from the replica engine. ``pyarrow`` is imported on first
+use; without it ``available()`` is False.
+"""
+from datetime import datetime
+from os import getenv
+from typing import Iterator, List, Optional
+
+from sqlalchemy import select
+
+from ..database import replica_engine
+from ..models.email import EmailStatus
+from .archive import sources
+
+BATCH_SIZE = int(getenv("EXPORT_BATCH_SIZE", "50000"))
+
+ARROW = "arrow"
+PARQUET = "parquet"
+FORMATS = (ARROW, PARQUET)
+MEDIA_TYPES = {ARROW: "application/vnd.apache.arrow.stream", PARQUET: "application/vnd.apache.parquet"}
+
+# (column, arrow type name); enum columns are exported as their values
+COLUMNS = [
+    ("id", "int64"),
+    ("message_id", "string"),
+    ("thread_id", "string"),
+    ("sender_email", "string"),
+    ("sender_name", "string"),
+    ("recipient_email", "string"),
+    ("subject", "string"),
+    ("received_at", "timestamp"),
+    ("processed_at", "timestamp"),
+    ("main_category", "string"),
+    ("sub_category", "string"),
+    ("classification_confidence", "float64"),
+    ("sentiment_score", "float64"),
+    ("urgency", "enum"),
+    ("status", "enum"),
+    ("customer_id", "int64"),
+    ("is_reply", "bool"),
+    ("archived", "bool"),
+]
+BODY_COLUMN = ("body", "string")
+
+
+def _pyarrow():
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    return pyarrow
+
+
+def available() -> bool:
+    try:
+        _pyarrow()
+    except ImportError:
+        return False
+    return True
+
+
+def _arrow_type(pa, name: str):
+    if name == "timestamp":
+        return pa.timestamp("us")
+    if name == "enum":
+        return pa.string()
+    return getattr(pa, name if name != "bool" else "bool_")()
+
+
+class _Chunks:
+    """Write-only file object; ``drain()`` hands over what was written so far."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def export_query(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                 category: Optional[str] = None, sub_category: Optional[str] = None,
+                 status: Optional[EmailStatus] = None, include_body: bool = False,
+                 include_archived: bool = False):
+    """Core select of the exported columns, oldest first."""
+    emails, _, filters = sources(include_archived)
+    if start_date:
+        filters.append(emails.received_at >= start_date)
+    if end_date:
+        filters.append(emails.received_at < end_date)
+    if category:
+        filters.append(emails.main_category == category)
+    if sub_category:
+        filters.append(emails.sub_category == sub_category)
+    if status:
+        filters.append(emails.status == status)
+    columns = COLUMNS + [BODY_COLUMN] if include_body else COLUMNS
+    return select(*(getattr(emails, name) for name, _ in columns)).where(*filters).order_by(
+        emails.received_at, emails.id
+    ), columns
+
+
+def _record_batch(pa, schema, columns, rows):
+    arrays = []
+    for (name, kind), field, values in zip(columns, schema, zip(*rows)):
+        if kind == "enum":
+            values = [value.value if value is not None else None for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream_emails(fmt: str = ARROW, batch_size: int = BATCH_SIZE, bind=None, **filters) -> Iterator[bytes]:
+    """Yield the export as Arrow IPC stream or Parquet bytes, one batch at a time."""
+    pa = _pyarrow()
+    query, columns = export_query(**filters)
+    schema = pa.schema([(name, _arrow_type(pa, kind)) for name, kind in columns])
+    sink = _Chunks()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == PARQUET:
+        writer = pa.parquet.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+
+    try:
+        with (bind or replica_engine).connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for rows in result.partitions(batch_size):
+                batch = _record_batch(pa, schema, columns, rows)
+                if fmt == PARQUET:
+                    writer.write_table(pa.Table.from_batches([batch]))
+                else:
+                    writer.write_batch(batch)
+                # Drop this batch before the next one is fetched, so only one is ever held
+                del rows, batch
+                yield sink.drain()
+    finally:
+        # Also runs when the client disconnects early and the generator is closed
+        writer.close()
+        out.close()
+    yield sink.drain()
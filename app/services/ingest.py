@@ -0,0 +1,310 @@
+"""Batch email ingest for high-volume upstream integrations.
+
+``ingest_batch`` validates a batch of ``EmailCreate`` payloads and writes
+it in one transaction, keyed on ``message_id``. New messages are
+inserted. Messages still waiting for classification get their content
+replaced. Anything already processed is left untouched, so redelivering a
+batch is harmless. The emails to classify are recorded on an
+``IngestJob``, and ``run_job`` works through them after the HTTP response
+has gone out. It leases them through ``work_claims``, like any other
+worker. No connection is held while the model runs, and the database
+steps of both run in the threadpool, off the API's event loop.
+``INGEST_CONCURRENCY`` bounds parallel model calls.
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from os import getenv
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.email import Customer, Email, EmailStatus
+from ..models.ingest import IngestJob
+from ..schemas.email import EmailCreate
+from . import body_extraction, threads, work_claims
+from .email_processor import EmailProcessor
+
+MAX_BATCH = int(getenv("INGEST_MAX_BATCH", "5000"))
+CONCURRENCY = int(getenv("INGEST_CONCURRENCY", "4"))
+LOOKUP_CHUNK = 500
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl",
+                "application/json-seq")
+CONTENT_FIELDS = ("thread_id", "sender_email", "sender_name", "recipient_email",
+                  "subject", "body", "is_reply", "additional_data")
+
+
+class MalformedItem:
+    """An NDJSON line that is not valid JSON."""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+def parse_payload(body: bytes, content_type: str) -> List[Any]:
+    """Split a request body into raw items: a JSON array, {"emails": [...]}, or NDJSON."""
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in NDJSON_TYPES:
+        items = []
+        for line in body.decode("utf-8").splitlines():
+            line = line.strip().lstrip("\x1e")
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(MalformedItem(f"Invalid JSON: {str(e)}"))
+        return items
+
+    try:
+        payload = json.loads(body or b"null")
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {str(e)}")
+    if isinstance(payload, dict) and isinstance(payload.get("emails"), list):
+        payload = payload["emails"]
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of emails, {\"emails\": [...]}, or NDJSON")
+    return payload
+
+
+def _chunks(values: List, size: int = LOOKUP_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _validate(raw_items: List[Any]):
+    """Return ({message_id: (index, EmailCreate)}, per-index results for rejects)."""
+    valid: Dict[str, tuple] = {}
+    results: Dict[int, Dict] = {}
+    for index, raw in enumerate(raw_items):
+        message_id = raw.get("message_id") if isinstance(raw, dict) else None
+        if isinstance(raw, MalformedItem):
+            results[index] = {"index": index, "message_id": None, "status": INVALID,
+                              "errors": [{"msg": raw.error}]}
+            continue
+        try:
+            item = EmailCreate.parse_obj(raw)
+        except ValidationError as e:
+            results[index] = {"index": index, "message_id": message_id, "status": INVALID,
+                              "errors": json.loads(e.json())}
+            continue
+        if item.message_id in valid:
+            results[index] = {"index": index, "message_id": item.message_id,
+                              "status": DUPLICATE,
+                              "errors": [{"msg": f"Same message_id as item {valid[item.message_id][0]}"}]}
+            continue
+        valid[item.message_id] = (index, item)
+    return valid, results
+
+
+def _write(db: Session, valid: Dict[str, tuple], results: Dict[int, Dict]) -> List[Email]:
+    """Insert or update the valid items; fill ``results``; return emails to classify."""
+    message_ids = list(valid)
+    existing: Dict[str, Email] = {}
+    for chunk in _chunks(message_ids):
+        for stored in db.query(Email).filter(Email.message_id.in_(chunk)):
+            existing[stored.message_id] = stored
+
+    senders = list({item.sender_email for _, item in valid.values()})
+    customers: Dict[str, int] = {}
+    for chunk in _chunks(senders):
+        for customer_id, address in db.query(Customer.id, Customer.email).filter(
+            Customer.email.in_(chunk)
+        ):
+            customers[address] = customer_id
+
+    references = {message_id: threads.references_of({"thread_id": item.thread_id})
+                  for message_id, (_, item) in valid.items()}
+    threads.thread_index.prefetch(db, [ref for refs in references.values() for ref in refs])
+    # Threads assigned so far in this batch, so a reply can follow its parent in the same batch
+    assigned: Dict[str, str] = {}
+    replied = set()
+
+    queued: List[tuple] = []
+    for message_id, (index, item) in valid.items():
+        fields = {name: getattr(item, name) for name in CONTENT_FIELDS}
+        stored = existing.get(message_id)
+        if stored is None or stored.status == EmailStatus.NEW:
+            refs = references[message_id]
+            in_batch = next((assigned[ref] for ref in refs if ref in assigned), None)
+            if in_batch is not None:
+                fields["thread_id"] = in_batch
+            else:
+                fields["thread_id"], known_thread = threads.thread_for(message_id, refs)
+                if known_thread:
+                    replied.add(fields["thread_id"])
+            assigned[message_id] = fields["thread_id"]
+        if stored is None:
+            stored = Email(message_id=message_id, status=EmailStatus.NEW,
+                           customer_id=customers.get(item.sender_email), **fields)
+            db.add(stored)
+            status = CREATED
+        elif stored.status == EmailStatus.NEW:
+            for name, value in fields.items():
+                setattr(stored, name, value)
+            status = UPDATED
+        else:
+            status = UNCHANGED
+        if status != UNCHANGED:
+            body_extraction.fill_derived(stored)
+            queued.append((index, stored))
+        results[index] = {"index": index, "message_id": message_id, "status": status,
+                          "email": stored}
+
+    db.flush()
+    threads.mark_replied(db, replied)
+    for message_id, thread_id in assigned.items():
+        threads.thread_index.remember(message_id, thread_id)
+    for index, result in results.items():
+        stored = result.pop("email", None)
+        result["email_id"] = stored.id if stored is not None else None
+    return [stored for _, stored in sorted(queued, key=lambda pair: pair[0])]
+
+
+def ingest_batch(db: Session, raw_items: List[Any]) -> IngestJob:
+    """Validate and store a batch in one transaction and record the job. Commits."""
+    valid, rejects = _validate(raw_items)
+
+    for attempt in range(2):
+        results = dict(rejects)
+        try:
+            queued = _write(db, valid, results)
+            break
+        except IntegrityError:
+            # A concurrent batch inserted one of our message_ids; re-read and retry once
+            db.rollback()
+            if attempt:
+                raise
+
+    items = [results[index] for index in sorted(results)]
+    job = IngestJob(
+        id=str(uuid.uuid4()),
+        status="queued" if queued else "done",
+        total=len(raw_items),
+        accepted=sum(1 for item in items if item["status"] in (CREATED, UPDATED, UNCHANGED)),
+        rejected=sum(1 for item in items if item["status"] in (INVALID, DUPLICATE)),
+        items=items,
+        email_ids=[stored.id for stored in queued],
+    )
+    if not queued:
+        job.finished_at = datetime.utcnow()
+    db.add(job)
+    db.commit()
+    return job
+
+
+def ingest_summary(raw_items: List[Any]) -> Dict:
+    """``ingest_batch`` on a session of its own, returning the job summary.
+
+    The API runs it in the threadpool: validating and extracting the
+    bodies of a large batch would otherwise stall the event loop.
+    """
+    db = SessionLocal()
+    try:
+        return job_summary(ingest_batch(db, raw_items))
+    finally:
+        db.close()
+
+
+def _start_job(job_id: str) -> Optional[List[int]]:
+    """Mark a queued job running and return its email ids (None if not queued)."""
+    db = SessionLocal()
+    try:
+        job = db.get(IngestJob, job_id)
+        if job is None or job.status != "queued":
+            return None
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        email_ids = list(job.email_ids or [])
+        db.commit()
+        return email_ids
+    finally:
+        db.close()
+
+
+def _claim(owner: str, email_ids: List[int]) -> List[Email]:
+    db = SessionLocal()
+    try:
+        return work_claims.claim_emails(db, owner, len(email_ids), email_ids=email_ids)
+    finally:
+        db.close()
+
+
+def _finish_job(job_id: str):
+    db = SessionLocal()
+    try:
+        job = db.get(IngestJob, job_id)
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_job(job_id: str):
+    """Classify and draft responses for every email queued by a job.
+
+    Runs on the API's event loop, so every database step goes to the threadpool.
+    """
+    email_ids = await run_in_threadpool(_start_job, job_id)
+    if email_ids is None:
+        return
+
+    # Claim the job's emails like any other worker would, so emails that
+    # another worker already took are skipped rather than classified twice
+    owner = f"ingest:{job_id}"
+    processor = EmailProcessor(None)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def process(stored: Email):
+        async with semaphore:
+            await work_claims.process_claimed(stored, owner, processor)
+
+    for i in range(0, len(email_ids), LOOKUP_CHUNK):
+        claimed = await run_in_threadpool(_claim, owner, email_ids[i:i + LOOKUP_CHUNK])
+        await asyncio.gather(*(process(stored) for stored in claimed))
+
+    await run_in_threadpool(_finish_job, job_id)
+
+
+def job_summary(job: IngestJob) -> Dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "accepted": job.accepted,
+        "rejected": job.rejected,
+        "items": job.items or [],
+    }
+
+
+def job_status(db: Session, job: IngestJob) -> Dict:
+    """Job record plus how far classification of its emails has got."""
+    progress = {status.value: 0 for status in EmailStatus}
+    for chunk in _chunks(list(job.email_ids or [])):
+        for (status,) in db.query(Email.status).filter(Email.id.in_(chunk)):
+            progress[status.value] += 1
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "total": job.total,
+        "accepted": job.accepted,
+        "rejected": job.rejected,
+        "queued": len(job.email_ids or []),
+        "progress": progress,
+    }
@@ -0,0 +1,247 @@
+"""In-process live metrics fanned out to dashboard subscribers.
+
+Committed Email/Response changes are turned into small deltas: new emails
+by category and urgency, sentiment sum/count, and send-queue depth (the
+number of responses not yet sent). Each commit's delta is applied to
+running counters and pushed to every subscriber's bounded queue. A client
+that falls ``LIVE_METRICS_BUFFER`` messages behind is dropped rather than
+allowed to hold memory or slow the publisher.
+
+Counters live in the process that commits the change. The poller and
+the API must share a process for poller deltas to reach the stream.
+"""
+import asyncio
+import json
+import threading
+from collections import Counter
+from os import getenv
+from typing import AsyncIterator, Dict, Optional, Set
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from ..models.email import Email, Response
+
+BUFFER_SIZE = int(getenv("LIVE_METRICS_BUFFER", "100"))
+HEARTBEAT_SECONDS = float(getenv("LIVE_METRICS_HEARTBEAT", "15"))
+
+
+def _label(value) -> str:
+    if value is None:
+        return "unclassified"
+    return getattr(value, "value", value)
+
+
+class MetricsDelta:
+    """Changes from one transaction."""
+
+    def __init__(self):
+        self.by_category: Counter = Counter()
+        self.by_urgency: Counter = Counter()
+        self.emails = 0
+        self.sentiment_sum = 0.0
+        self.sentiment_count = 0
+        self.queue_depth = 0
+
+    def __bool__(self):
+        return bool(self.emails or self.by_category or self.by_urgency
+                    or self.sentiment_count or self.queue_depth)
+
+    def merge(self, other: "MetricsDelta"):
+        self.by_category.update(other.by_category)
+        self.by_urgency.update(other.by_urgency)
+        self.emails += other.emails
+        self.sentiment_sum += other.sentiment_sum
+        self.sentiment_count += other.sentiment_count
+        self.queue_depth += other.queue_depth
+
+    def as_dict(self) -> Dict:
+        return {
+            "emails": self.emails,
+            "by_category": {k: v for k, v in self.by_category.items() if v},
+            "by_urgency": {k: v for k, v in self.by_urgency.items() if v},
+            "sentiment_sum": self.sentiment_sum,
+            "sentiment_count": self.sentiment_count,
+            "send_queue_depth": self.queue_depth,
+        }
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class LiveMetrics:
+    """Running counters plus a fan-out to bounded per-subscriber queues."""
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.totals = MetricsDelta()
+        self.queue_depth_initialized = False
+        self.sequence = 0
+        self.dropped_subscribers = 0
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def initialize_queue_depth(self, db: Session):
+        """Seed send-queue depth from the database once per process."""
+        if self.queue_depth_initialized:
+            return
+        depth = db.query(func.count(Response.id)).filter(Response.is_sent == False).scalar()
+        with self._lock:
+            if not self.queue_depth_initialized:
+                self.totals.queue_depth += depth or 0
+                self.queue_depth_initialized = True
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            data = self.totals.as_dict()
+            data["seq"] = self.sequence
+        data["running_sentiment"] = (
+            data["sentiment_sum"] / data["sentiment_count"] if data["sentiment_count"] else None
+        )
+        data["subscribers"] = len(self._subscribers)
+        return data
+
+    def publish(self, delta: MetricsDelta):
+        with self._lock:
+            self.totals.merge(delta)
+            self.sequence += 1
+            totals = self.totals
+            message = {
+                "seq": self.sequence,
+                "delta": delta.as_dict(),
+                "running_sentiment": (
+                    totals.sentiment_sum / totals.sentiment_count
+                    if totals.sentiment_count else None
+                ),
+                "send_queue_depth": totals.queue_depth,
+            }
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is subscriber.loop:
+                self._offer(subscriber, message)
+                continue
+            try:
+                subscriber.loop.call_soon_threadsafe(self._offer, subscriber, message)
+            except RuntimeError:
+                # Subscriber's event loop is gone
+                self.unsubscribe(subscriber)
+
+    def _offer(self, subscriber: Subscriber, message: Dict):
+        if subscriber.dropped:
+            return
+        try:
+            subscriber.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            subscriber.dropped = True
+            self.unsubscribe(subscriber)
+            self.dropped_subscribers += 1
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    async def stream(self, subscriber: Subscriber, is_disconnected) -> AsyncIterator[str]:
+        """Yield Server-Sent Events: one snapshot, then deltas and heartbeats."""
+        try:
+            yield _sse("snapshot", self.snapshot())
+            while not subscriber.dropped:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield _sse("delta", message)
+            if subscriber.dropped:
+                yield _sse("dropped", {"reason": "slow consumer"})
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def _sse(event_name: str, data: Dict) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+live_metrics = LiveMetrics()
+
+
+def _pending(session: Session) -> MetricsDelta:
+    delta = session.info.get("live_metrics_delta")
+    if delta is None:
+        delta = session.info["live_metrics_delta"] = MetricsDelta()
+    return delta
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session: Session, flush_context):
+    delta = MetricsDelta()
+
+    for obj in session.new:
+        if isinstance(obj, Email):
+            delta.emails += 1
+            delta.by_category[_label(obj.main_category)] += 1
+            delta.by_urgency[_label(obj.urgency)] += 1
+            if obj.sentiment_score is not None:
+                delta.sentiment_sum += obj.sentiment_score
+                delta.sentiment_count += 1
+        elif isinstance(obj, Response) and not obj.is_sent:
+            delta.queue_depth += 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Email):
+            attrs = inspect(obj).attrs
+            for name, counter in (("main_category", delta.by_category),
+                                  ("urgency", delta.by_urgency)):
+                history = attrs[name].history
+                if history.has_changes():
+                    old = history.deleted[0] if history.deleted else None
+                    counter[_label(old)] -= 1
+                    counter[_label(getattr(obj, name))] += 1
+            history = attrs.sentiment_score.history
+            if history.has_changes():
+                old = history.deleted[0] if history.deleted else None
+                if old is not None:
+                    delta.sentiment_sum -= old
+                    delta.sentiment_count -= 1
+                if obj.sentiment_score is not None:
+                    delta.sentiment_sum += obj.sentiment_score
+                    delta.sentiment_count += 1
+        elif isinstance(obj, Response):
+            history = inspect(obj).attrs.is_sent.history
+            if history.has_changes():
+                delta.queue_depth += -1 if obj.is_sent else 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Response) and not obj.is_sent:
+            delta.queue_depth -= 1
+
+    if delta:
+        _pending(session).merge(delta)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish(session: Session):
+    delta: Optional[MetricsDelta] = session.info.pop("live_metrics_delta", None)
+    if delta:
+        live_metrics.publish(delta)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session):
+    session.info.pop("live_metrics_delta", None)
@@ -0,0 +1,156 @@
+"""Keyset (cursor) pagination.
+
+Pages are read with ``WHERE key > :last ORDER BY key LIMIT n`` instead of
+OFFSET. A deep page then costs the same as the first one. Rows inserted
+while an agent is paging (e.g. by the poller) do not shift or duplicate
+results. The key is a tuple of columns ending in a unique one, such as
+``(received_at, id)``. Cursors are opaque url-safe tokens holding the
+key of the first or last row on the page and the direction to read.
+
+Counting every row that matches a broad filter costs as much as the scan
+pagination avoids, so totals are opt-in. ``estimate_count`` asks the
+Postgres planner. Other backends get an exact count capped at
+``PAGINATION_COUNT_CAP``.
+"""
+import base64
+import json
+import re
+from datetime import datetime
+from os import getenv
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.orm import Query
+
+COUNT_CAP = int(getenv("PAGINATION_COUNT_CAP", "10000"))
+
+NEXT = "next"
+PREV = "prev"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page:
+    """One page of rows plus the cursors that lead to its neighbours."""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str] = None,
+                 prev_cursor: Optional[str] = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total: Optional[int] = None
+        self.total_exact = True
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(direction: str, values: Sequence, order: str = "") -> str:
+    payload = {"d": direction, "k": [_encode_value(v) for v in values]}
+    if order:
+        payload["o"] = order
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_count: int, order: str = "") -> Tuple[str, list]:
+    """Return (direction, key values); raise InvalidCursor if it is not one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction = payload["d"]
+        values = [_decode_value(v) for v in payload["k"]]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if direction not in (NEXT, PREV) or len(values) != key_count:
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("o", "") != order:
+        raise InvalidCursor("Cursor belongs to a different sort order")
+    return direction, values
+
+
+def after(keys: Sequence, values: Sequence, descending: bool):
+    """Rows strictly after ``values`` in (keys) order.
+
+    Expanded to ``k1 >= v1 AND (k1 > v1 OR (k1 = v1 AND k2 > v2))`` rather
+    than a row-value comparison so every backend can range-scan an index
+    on the leading key.
+    """
+    def beyond(key, value):
+        return key < value if descending else key > value
+
+    branches = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        equal = [keys[j] == values[j] for j in range(i)]
+        branches.append(and_(*equal, beyond(key, value)))
+    leading = keys[0] <= values[0] if descending else keys[0] >= values[0]
+    return and_(leading, or_(*branches))
+
+
+def paginate(query: Query, keys: Sequence, key_of: Callable[[Any], Sequence],
+             limit: int, cursor: Optional[str] = None, descending: bool = False,
+             offset: int = 0, order: str = "") -> Page:
+    """Fetch one page of ``query`` ordered by ``keys``.
+
+    ``key_of`` extracts the key values from a result row. ``offset`` is only
+    honoured without a cursor, for callers still sending ``skip``.
+    """
+    direction, values = (NEXT, None)
+    if cursor:
+        direction, values = decode_cursor(cursor, len(keys), order)
+    backwards = direction == PREV
+    walk_descending = descending != backwards
+
+    if values is not None:
+        query = query.filter(after(keys, values, walk_descending))
+    elif offset:
+        query = query.offset(offset)
+
+    ordering = [key.desc() if walk_descending else key.asc() for key in keys]
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return Page([])
+    has_next = more if not backwards else True
+    has_prev = more if backwards else (values is not None or offset > 0)
+    return Page(
+        rows,
+        next_cursor=encode_cursor(NEXT, key_of(rows[-1]), order) if has_next else None,
+        prev_cursor=encode_cursor(PREV, key_of(rows[0]), order) if has_prev else None,
+    )
+
+
+_PLAN_ROWS = re.compile(r"rows=(\d+)")
+
+
+def estimate_count(query: Query) -> Tuple[int, bool]:
+    """Return (count, exact) for the rows ``query`` matches."""
+    session = query.session
+    bind = session.get_bind()
+    statement = query.order_by(None).statement
+
+    if bind.dialect.name == "postgresql":
+        sql = str(statement.compile(bind, compile_kwargs={"literal_binds": True}))
+        plan = session.execute(text("EXPLAIN " + sql)).scalar()
+        found = _PLAN_ROWS.search(plan or "")
+        if found:
+            return int(found.group(1)), False
+
+    capped = statement.limit(COUNT_CAP + 1).subquery()
+    count = session.query(func.count()).select_from(capped).scalar()
+    return min(count, COUNT_CAP), count <= COUNT_CAP
@@ -0,0 +1,129 @@
+"""Read/write routing between the primary and the read replica.
+
+Write paths use ``get_async_db`` (the primary). Analytics, list and
+search routes use ``get_read_db``, which hands out a replica session
+unless:
+
+* the replica is further behind than ``REPLICA_MAX_LAG_SECONDS``, or
+  its lag cannot be measured. Lag is sampled at most every
+  ``REPLICA_LAG_CHECK_SECONDS``. A Postgres standby reports it through
+  ``pg_last_xact_replay_timestamp()``. A read-only SQLite connection to
+  the primary's file never lags.
+* the request asks to read its own writes with ``X-Read-Your-Writes``.
+  ``true`` always reads from the primary. A unix timestamp (the
+  ``X-Last-Write`` header write routes return) reads from the primary
+  only until the replica has caught up past it.
+
+``X-Last-Write`` is stamped when the route's transaction commits, not when
+the request starts, so a slow handler cannot return a time the replica
+has already passed. Writes committed after the response, such as
+background tasks, are not covered: clients that need to read those
+should send ``X-Read-Your-Writes: true``.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import AsyncReplicaSessionLocal, AsyncSessionLocal, async_engine, async_replica_engine
+from . import telemetry
+
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+LAST_WRITE_HEADER = "X-Last-Write"
+ROUTE_HEADER = "X-DB-Route"
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+_PG_REPLAY_LAG = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "ELSE 0 END"
+)
+
+
+class ReplicaMonitor:
+    """Cached measurement of how far the replica trails the primary."""
+
+    def __init__(self, engine, check_every: float = settings.REPLICA_LAG_CHECK_SECONDS):
+        self.engine = engine
+        self.check_every = check_every
+        self._lag: Optional[float] = None
+        self._checked_at = 0.0
+
+    async def lag(self) -> Optional[float]:
+        """Replica lag in seconds, or None if the replica is unreachable."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_every:
+            # Concurrent requests keep using the previous sample meanwhile
+            self._checked_at = now
+            self._lag = await self._measure()
+        return self._lag
+
+    async def _measure(self) -> Optional[float]:
+        if self.engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            async with self.engine.connect() as conn:
+                return float((await conn.execute(_PG_REPLAY_LAG)).scalar() or 0)
+        except Exception as e:
+            telemetry.log(f"Replica lag check failed: {str(e)}")
+            return None
+
+
+monitor = ReplicaMonitor(async_replica_engine)
+
+
+def needs_primary(read_your_writes: str, lag: float) -> bool:
+    """Whether an ``X-Read-Your-Writes`` value rules out a replica ``lag`` seconds behind."""
+    value = read_your_writes.strip().lower()
+    if not value or value in ("0", "false", "no"):
+        return False
+    try:
+        written_at = float(value)
+    except ValueError:
+        return True
+    return written_at > time.time() - lag
+
+
+async def choose_route(request: Request) -> str:
+    if async_replica_engine is async_engine:
+        return PRIMARY
+    lag = await monitor.lag()
+    if lag is None or lag > settings.REPLICA_MAX_LAG_SECONDS:
+        return PRIMARY
+    if needs_primary(request.headers.get(READ_YOUR_WRITES_HEADER, ""), lag):
+        return PRIMARY
+    return REPLICA
+
+
+async def get_read_db(request: Request, response: Response):
+    """AsyncSession for a read-only route: the replica unless routing says otherwise."""
+    route = await choose_route(request)
+    response.headers[ROUTE_HEADER] = route
+    factory = AsyncReplicaSessionLocal if route == REPLICA else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+
+_write_response: ContextVar[Optional[Response]] = ContextVar("write_response", default=None)
+
+
+async def mark_write(response: Response):
+    """Route dependency for writes: tell the client when it wrote, for read-your-writes.
+
+    Async so the context variable is set in the request's own context,
+    which the handler, its threadpool calls and AsyncSession greenlets see.
+    """
+    _write_response.set(response)
+
+
+@event.listens_for(Session, "after_commit")
+def _stamp_commit(session):
+    response = _write_response.get()
+    if response is not None:
+        response.headers[LAST_WRITE_HEADER] = f"{time.time():.3f}"
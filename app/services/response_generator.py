@@ -1,12 +1,13 @@
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from typing import Dict, Optional
 import json
 from ..config import settings
 from ..models.email import Email, Customer
+from . import telemetry
 
 class ResponseGenerator:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
         self.model = "claude-3-opus-20240229"
 
     async def generate_response(self, 
@@ -35,7 +36,7 @@ class ResponseGenerator:
 
             Original Email:
             Subject: {email.subject}
-            Content: {email.body}
+            Content: {email.clean_body or email.body}
 
             Guidelines:
             1. Address the customer by name if available
@@ -53,14 +54,14 @@ class ResponseGenerator:
             - Escalate technical issues to specialists
             
             Return response as JSON:
-            {
+            {{
                 "response_text": "The actual response",
                 "suggested_actions": ["list", "of", "follow-up", "actions"],
                 "internal_notes": "Notes for support team",
                 "requires_follow_up": boolean,
                 "escalation_needed": boolean,
                 "template_used": "template name if any"
-            }
+            }}
             """
 
             response = await self.client.messages.create(
@@ -68,8 +69,11 @@ class ResponseGenerator:
                 max_tokens=2000,
                 messages=[{"role": "user", "content": prompt}]
             )
+            prompt_tokens, completion_tokens = telemetry.record_usage("generate", response.usage)
 
             response_data = json.loads(response.content[0].text)
+            response_data["prompt_tokens"] = prompt_tokens
+            response_data["completion_tokens"] = completion_tokens
             
             # Add signature if not present
             if "Best regards" not in response_data["response_text"]:
@@ -78,7 +82,8 @@ class ResponseGenerator:
             return response_data
 
         except Exception as e:
-            print(f"Response generation error: {str(e)}")
+            telemetry.record_error("generate")
+            telemetry.log(f"Response generation error: {str(e)}")
             return {
                 "response_text": "I apologize, but I'm having trouble generating a response. I'll escalate this to our support team who will get back to you shortly.\n\nBest regards,\nDee\nSLYFONE Support Team",
                 "suggested_actions": ["Escalate to supervisor"],
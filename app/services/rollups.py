@@ -0,0 +1,392 @@
+"""Hourly/daily rollups of email and response stats for the analytics API.
+
+Rollup rows are kept current by a flush listener that turns Email and
+Response inserts, reclassifications and deletes into counter deltas, so
+summary and trend queries read a handful of pre-aggregated rows instead of
+rescanning ``emails``. Run ``python -m app.services.rollups rebuild`` to
+backfill after deploying or to repair a date range.
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+
+from ..database import SessionLocal, engine
+from ..models.analytics import AnalyticsSketch, EmailRollup
+from ..models.email import Email, Response
+from .archive import sources
+from .time_buckets import floor_bucket
+
+GRAINS = ("hour", "day")
+KEY_COLUMNS = ("grain", "bucket_start", "main_category", "sub_category",
+               "urgency", "sentiment_bucket")
+MEASURES = ("email_count", "sentiment_count", "sentiment_sum",
+            "response_count", "response_time_sum")
+# Email attributes that decide which rollup row an email lands in
+TRACKED_ATTRIBUTES = ("received_at", "main_category", "sub_category",
+                      "urgency", "sentiment_score")
+
+# Same thresholds as the sentiment distribution in /analytics/summary
+SENTIMENT_THRESHOLD = 0.3
+
+RollupKey = Tuple[str, datetime, str, str, str, str]
+
+
+def rollups_enabled() -> bool:
+    """Whether analytics endpoints may answer from rollups."""
+    return getenv("ANALYTICS_ROLLUPS", "true").lower() in ("1", "true", "yes")
+
+
+def sentiment_bucket(score: Optional[float]) -> str:
+    if score is not None and score > SENTIMENT_THRESHOLD:
+        return "positive"
+    if score is not None and score < -SENTIMENT_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+
+def bucket_start(ts: datetime, grain: str) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if grain == "day" else ts
+
+
+def is_hour_aligned(ts: datetime) -> bool:
+    return ts.minute == 0 and ts.second == 0 and ts.microsecond == 0
+
+
+def _enum_value(value) -> str:
+    if value is None:
+        return ""
+    return getattr(value, "value", value)
+
+
+class RollupDelta:
+    """Accumulates measure changes per rollup key before they are written."""
+
+    def __init__(self):
+        self.deltas: Dict[RollupKey, List[float]] = defaultdict(lambda: [0] * len(MEASURES))
+
+    def __bool__(self):
+        return bool(self.deltas)
+
+    def _keys(self, state: Dict) -> List[RollupKey]:
+        received_at = state["received_at"] or datetime.utcnow()
+        dims = (
+            state["main_category"] or "",
+            state["sub_category"] or "",
+            _enum_value(state["urgency"]),
+            sentiment_bucket(state["sentiment_score"]),
+        )
+        return [(grain, bucket_start(received_at, grain)) + dims for grain in GRAINS]
+
+    def add_email(self, state: Dict, sign: int = 1):
+        has_sentiment = state["sentiment_score"] is not None
+        for key in self._keys(state):
+            row = self.deltas[key]
+            row[0] += sign
+            if has_sentiment:
+                row[1] += sign
+                row[2] += sign * state["sentiment_score"]
+
+    def add_responses(self, state: Dict, created: List[Optional[datetime]], sign: int = 1):
+        received_at = state["received_at"] or datetime.utcnow()
+        seconds = sum(
+            ((created_at or datetime.utcnow()) - received_at).total_seconds()
+            for created_at in created
+        )
+        for key in self._keys(state):
+            row = self.deltas[key]
+            row[3] += sign * len(created)
+            row[4] += sign * seconds
+
+
+def _email_state(email: Email, previous: bool = False) -> Dict:
+    """Snapshot the tracked attributes, optionally as they were before this flush."""
+    state = {name: getattr(email, name) for name in TRACKED_ATTRIBUTES}
+    if previous:
+        instance = inspect(email)
+        loaded = instance.session.info.get("rollup_previous", {}).get(email, {}) if instance.session else {}
+        for name, value in instance.committed_state.items():
+            if name in state:
+                # NO_VALUE: never loaded here; read from the database before the flush
+                state[name] = loaded.get(name) if value is NO_VALUE else value
+    return state
+
+
+def _key_changed(email: Email) -> bool:
+    attrs = inspect(email).attrs
+    return any(attrs[name].history.has_changes() for name in TRACKED_ATTRIBUTES)
+
+
+@event.listens_for(Session, "before_flush")
+def _load_previous(session: Session, flush_context, instances):
+    """Read the stored key of emails changed without loading it first.
+
+    An email kept across a commit without expiring (as AsyncSessionLocal
+    does) never loads the columns it was inserted without, so its history
+    cannot tell which rollup row it leaves. Once flushed the row holds the
+    new values, so they are read here.
+    """
+    previous = {}
+    for obj in session.dirty:
+        if not isinstance(obj, Email):
+            continue
+        committed = inspect(obj).committed_state
+        if any(committed.get(name) is NO_VALUE for name in TRACKED_ATTRIBUTES):
+            columns = [getattr(Email, name) for name in TRACKED_ATTRIBUTES]
+            row = session.connection().execute(select(*columns).where(Email.id == obj.id)).first()
+            if row is not None:
+                previous[obj] = dict(zip(TRACKED_ATTRIBUTES, row))
+    if previous:
+        session.info["rollup_previous"] = previous
+
+
+def apply_deltas(connection, delta: RollupDelta):
+    """Add accumulated deltas to the rollup table with per-dialect upserts."""
+    table = EmailRollup.__table__
+    dialect = connection.dialect.name
+    upsert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(dialect)
+
+    for key, values in delta.deltas.items():
+        key_values = dict(zip(KEY_COLUMNS, key))
+        measures = dict(zip(MEASURES, values))
+
+        if upsert is not None:
+            stmt = upsert(table).values(**key_values, **measures)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(KEY_COLUMNS),
+                set_={name: table.c[name] + stmt.excluded[name] for name in MEASURES}
+            )
+            connection.execute(stmt)
+            continue
+
+        result = connection.execute(
+            update(table)
+            .where(and_(*(table.c[name] == value for name, value in key_values.items())))
+            .values({name: table.c[name] + value for name, value in measures.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**key_values, **measures))
+
+
+@event.listens_for(Session, "after_flush")
+def _track_rollups(session: Session, flush_context):
+    """Translate flushed Email/Response changes into rollup deltas."""
+    delta = RollupDelta()
+    new_response_ids = {obj.id for obj in session.new if isinstance(obj, Response)}
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Email):
+                delta.add_email(_email_state(obj))
+            elif isinstance(obj, Response):
+                email = obj.email or session.get(Email, obj.email_id)
+                if email is not None:
+                    delta.add_responses(_email_state(email), [obj.created_at])
+
+        for obj in session.dirty:
+            if isinstance(obj, Email) and _key_changed(obj):
+                old_state = _email_state(obj, previous=True)
+                new_state = _email_state(obj)
+                delta.add_email(old_state, -1)
+                delta.add_email(new_state)
+
+                # Responses follow their email into the new bucket. Read them with
+                # a plain select: loading obj.responses mid-flush would duplicate
+                # responses inserted by this same flush.
+                created = [
+                    created_at for response_id, created_at in session.connection().execute(
+                        select(Response.id, Response.created_at).where(Response.email_id == obj.id)
+                    ) if response_id not in new_response_ids
+                ]
+                if created:
+                    delta.add_responses(old_state, created, -1)
+                    delta.add_responses(new_state, created)
+
+        for obj in session.deleted:
+            if isinstance(obj, Email):
+                delta.add_email(_email_state(obj, previous=True), -1)
+            elif isinstance(obj, Response):
+                email = obj.email or session.get(Email, obj.email_id)
+                if email is not None:
+                    delta.add_responses(_email_state(email, previous=True), [obj.created_at], -1)
+
+    session.info.pop("rollup_previous", None)
+    if delta:
+        apply_deltas(session.connection(), delta)
+
+
+def plan_segments(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Cover [start, end) with daily buckets, using hourly ones at ragged edges."""
+    first_day = bucket_start(start, "day")
+    if first_day < start:
+        first_day += timedelta(days=1)
+    last_day = bucket_start(end, "day")
+
+    if first_day >= last_day:
+        return [("hour", start, end)] if start < end else []
+
+    segments = []
+    if start < first_day:
+        segments.append(("hour", start, first_day))
+    segments.append(("day", first_day, last_day))
+    if last_day < end:
+        segments.append(("hour", last_day, end))
+    return segments
+
+
+def _range_filter(segments: List[Tuple[str, datetime, datetime]]):
+    return or_(*(
+        and_(EmailRollup.grain == grain,
+             EmailRollup.bucket_start >= seg_start,
+             EmailRollup.bucket_start < seg_end)
+        for grain, seg_start, seg_end in segments
+    ))
+
+
+def query_rollups(db: Session, start: datetime, end: datetime, *group_by,
+                  segments: Optional[List[Tuple[str, datetime, datetime]]] = None):
+    """Sum rollup measures over [start, end), grouped by the given columns."""
+    columns = [func.coalesce(func.sum(getattr(EmailRollup, name)), 0).label(name)
+               for name in MEASURES]
+    segments = segments or plan_segments(start, end)
+    query = db.query(*group_by, *columns).filter(_range_filter(segments))
+    if group_by:
+        query = query.group_by(*group_by)
+    return query.all()
+
+
+def summary_from_rollups(db: Session, start: datetime, end: datetime) -> Dict:
+    """Build the /summary payload from rollups."""
+    totals = query_rollups(db, start, end)[0]
+    categories = query_rollups(db, start, end, EmailRollup.main_category)
+    sentiments = query_rollups(db, start, end, EmailRollup.sentiment_bucket)
+
+    avg_response_time = None
+    if totals.response_count:
+        avg_response_time = totals.response_time_sum / totals.response_count / 3600
+
+    return {
+        "total_emails": int(totals.email_count),
+        "avg_response_time_hours": avg_response_time,
+        "category_distribution": {
+            (row.main_category or None): int(row.email_count)
+            for row in categories if row.email_count
+        },
+        "sentiment_distribution": {
+            row.sentiment_bucket: int(row.email_count)
+            for row in sentiments if row.email_count
+        }
+    }
+
+
+# Which measure pair (total, n) each trend metric reads
+TREND_MEASURES = {
+    "volume": ("email_count", None),
+    "response_time": ("response_time_sum", "response_count"),
+    "sentiment": ("sentiment_sum", "sentiment_count"),
+}
+
+
+def trend_totals_from_rollups(db: Session, metric: str, interval: str,
+                              start: datetime, end: datetime) -> Dict[datetime, List[float]]:
+    """Per-bucket [total, n] for a trend metric, folding rollup rows into the interval."""
+    total_name, count_name = TREND_MEASURES[metric]
+    segments = [("hour", start, end)] if interval == "hour" else None
+
+    totals: Dict[datetime, List[float]] = defaultdict(lambda: [0.0, 0])
+    for row in query_rollups(db, start, end, EmailRollup.bucket_start, segments=segments):
+        entry = totals[floor_bucket(row.bucket_start, interval)]
+        entry[0] += getattr(row, total_name)
+        entry[1] += getattr(row, count_name) if count_name else 1
+
+    if metric == "response_time":
+        for entry in totals.values():
+            entry[0] /= 3600
+    return totals
+
+
+def rebuild_rollups(db: Session,
+                    start: Optional[datetime] = None,
+                    end: Optional[datetime] = None,
+                    batch_size: int = 10000) -> int:
+    """Recompute rollups for whole days in [start, end) from the source tables.
+
+    Rollups cover archived emails too, so both tiers are scanned. Returns
+    the number of emails scanned. The caller commits.
+    """
+    emails, responses, _ = sources(include_archived=True)
+    if start:
+        start = bucket_start(start, "day")
+    if end and end != bucket_start(end, "day"):
+        end = bucket_start(end, "day") + timedelta(days=1)
+
+    clear = delete(EmailRollup)
+    source = db.query(
+        emails.id, *(getattr(emails, name) for name in TRACKED_ATTRIBUTES),
+        responses.created_at
+    ).outerjoin(responses, responses.email_id == emails.id)
+    if start:
+        clear = clear.where(EmailRollup.bucket_start >= start)
+        source = source.filter(emails.received_at >= start)
+    if end:
+        clear = clear.where(EmailRollup.bucket_start < end)
+        source = source.filter(emails.received_at < end)
+    db.execute(clear)
+
+    delta = RollupDelta()
+    scanned = 0
+    last_id = None
+    for row in source.order_by(emails.id).yield_per(batch_size):
+        state = {name: getattr(row, name) for name in TRACKED_ATTRIBUTES}
+        if row.id != last_id:
+            delta.add_email(state)
+            last_id = row.id
+            scanned += 1
+        if row.created_at is not None:
+            delta.add_responses(state, [row.created_at])
+
+    rows = [
+        {**dict(zip(KEY_COLUMNS, key)), **dict(zip(MEASURES, values))}
+        for key, values in delta.deltas.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(EmailRollup.__table__), rows[i:i + batch_size])
+    return scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain analytics rollup tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Backfill or repair rollups and sketches from emails/responses")
+    rebuild.add_argument("--start", type=datetime.fromisoformat, default=None)
+    rebuild.add_argument("--end", type=datetime.fromisoformat, default=None)
+    rebuild.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    from .sketch_rollups import rebuild_sketches
+
+    EmailRollup.__table__.create(bind=engine, checkfirst=True)
+    AnalyticsSketch.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        scanned = rebuild_rollups(db, args.start, args.end, args.batch_size)
+        rebuild_sketches(db, args.start, args.end, args.batch_size)
+        db.commit()
+        print(f"Rebuilt rollups and sketches from {scanned} emails")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import math
+import re
+from abc import ABC, abstractmethod
+from os import getenv
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Valences on the VADER scale (-4 .. +4), tuned for support mail.
+LEXICON: Dict[str, float] = {
+    # positive
+    'amazing': 2.8, 'appreciate': 2.0, 'appreciated': 2.0, 'awesome': 3.1,
+    'best': 3.2, 'better': 1.9, 'brilliant': 2.8, 'excellent': 2.7,
+    'fantastic': 2.6, 'fast': 1.0, 'fixed': 1.4, 'fine': 0.8, 'glad': 2.0,
+    'good': 1.9, 'grateful': 2.0, 'great': 3.1, 'happy': 2.7, 'helpful': 1.8,
+    'like': 1.5, 'love': 3.2, 'loved': 2.9, 'nice': 1.8, 'perfect': 2.7,
+    'pleased': 1.9, 'quick': 1.0, 'recommend': 1.5, 'resolved': 1.6,
+    'satisfied': 1.8, 'smooth': 1.2, 'solved': 1.5, 'thank': 1.5,
+    'thanks': 1.9, 'thankful': 2.0, 'useful': 1.9, 'welcome': 2.0,
+    'well': 1.1, 'wonderful': 2.7, 'works': 0.8, 'working': 0.6,
+    # negative
+    'angry': -2.3, 'annoyed': -1.6, 'annoying': -1.8, 'awful': -2.0,
+    'bad': -2.5, 'ban': -2.6, 'banned': -2.0, 'blocked': -1.3,
+    'broken': -2.1, 'bug': -1.5, 'cancel': -1.0, 'charged': -0.8,
+    'complaint': -1.6, 'confused': -1.3, 'crash': -1.7, 'crashes': -1.7,
+    'delay': -1.3, 'delayed': -1.2, 'disappointed': -1.9,
+    'disappointing': -2.2, 'disgusting': -2.4, 'error': -1.7,
+    'fail': -2.5, 'failed': -2.3, 'failing': -2.3, 'failure': -2.3,
+    'fraud': -2.8, 'frustrated': -2.4, 'frustrating': -1.9,
+    'hate': -2.7, 'horrible': -2.5, 'issue': -0.8, 'issues': -0.8,
+    'lost': -1.3, 'mad': -2.2, 'missing': -1.2,
+    'poor': -2.1, 'problem': -1.7, 'problems': -1.7, 'refund': -0.6,
+    'ridiculous': -2.1, 'sad': -2.1, 'scam': -2.6, 'slow': -1.2,
+    'stolen': -2.2, 'stuck': -1.4, 'terrible': -2.1, 'unacceptable': -2.0,
+    'unable': -1.3, 'unhappy': -1.8, 'upset': -1.6, 'useless': -1.8,
+    'waste': -1.8, 'worse': -2.1, 'worst': -3.1, 'wrong': -2.1,
+}
+
+# Intensity added to (or taken from) the sentiment word that follows.
+BOOSTERS: Dict[str, float] = {
+    'absolutely': 0.293, 'completely': 0.293, 'extremely': 0.293,
+    'really': 0.293, 'so': 0.293, 'totally': 0.293, 'very': 0.293,
+    'incredibly': 0.293, 'super': 0.293, 'highly': 0.293, 'most': 0.293,
+    'barely': -0.293, 'hardly': -0.293, 'slightly': -0.293,
+    'somewhat': -0.293, 'kind': -0.293, 'little': -0.293,
+}
+
+NEGATIONS = frozenset([
+    'not', 'no', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor',
+    'cannot', 'cant', "can't", 'dont', "don't", 'doesnt', "doesn't",
+    'didnt', "didn't", 'isnt', "isn't", 'wasnt', "wasn't", 'wont', "won't",
+    'aint', "ain't", 'without', 'havent', "haven't", 'hasnt', "hasn't",
+])
+
+NEGATION_SCALAR = -0.74
+CAPS_INCREMENT = 0.733
+BUT_BEFORE = 0.5
+BUT_AFTER = 1.5
+NEGATION_WINDOW = 3
+BOOST_DECAY = (1.0, 0.95, 0.9)
+ALPHA = 15.0
+
+_TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z']*")
+_EXCLAIM_RE = re.compile(r'!')
+
+
+class SentimentBackend(ABC):
+    """Base class for sentiment scorers returning polarity in [-1, 1]."""
+    name = 'base'
+
+    def score(self, text: str) -> float:
+        """Score a single text."""
+        return float(self.score_batch([text])[0])
+
+    @abstractmethod
+    def score_batch(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        """Score many texts at once, returning a float64 array."""
+
+
+class LexiconSentimentBackend(SentimentBackend):
+    """VADER-style lexicon scorer with negation and intensifier handling."""
+    name = 'lexicon'
+
+    def __init__(self,
+                 lexicon: Optional[Dict[str, float]] = None,
+                 boosters: Optional[Dict[str, float]] = None):
+        self.lexicon = dict(LEXICON if lexicon is None else lexicon)
+        self.boosters = dict(BOOSTERS if boosters is None else boosters)
+
+    def score_batch(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        texts = list(texts)
+        scores = np.zeros(len(texts), dtype=np.float64)
+        for i, text in enumerate(texts):
+            if isinstance(text, str) and text:
+                scores[i] = self._score_text(text)
+        return scores
+
+    def _score_text(self, text: str) -> float:
+        tokens = _TOKEN_RE.findall(text)
+        if not tokens:
+            return 0.0
+
+        lowered = [t.lower() for t in tokens]
+        shouting = any(t.isupper() and len(t) > 1 for t in tokens) and \
+            not all(t.isupper() for t in tokens)
+
+        lexicon = self.lexicon
+        boosters = self.boosters
+        valences = [0.0] * len(tokens)
+        but_index = -1
+
+        for i, word in enumerate(lowered):
+            if word == 'but' and but_index < 0:
+                but_index = i
+            valence = lexicon.get(word)
+            if valence is None:
+                continue
+
+            if shouting and tokens[i].isupper():
+                valence += CAPS_INCREMENT if valence > 0 else -CAPS_INCREMENT
+
+            # Look back over a short window for intensifiers and negations
+            for distance in range(1, NEGATION_WINDOW + 1):
+                j = i - distance
+                if j < 0:
+                    break
+                prev = lowered[j]
+                boost = boosters.get(prev)
+                if boost is not None:
+                    # Boost fades with distance from the sentiment word
+                    scale = boost * BOOST_DECAY[distance - 1]
+                    valence += scale if valence > 0 else -scale
+                if prev in NEGATIONS:
+                    valence *= NEGATION_SCALAR
+                    break
+
+            valences[i] = valence
+
+        if but_index >= 0:
+            for i in range(len(valences)):
+                if i < but_index:
+                    valences[i] *= BUT_BEFORE
+                elif i > but_index:
+                    valences[i] *= BUT_AFTER
+
+        total = sum(valences)
+        if total == 0.0:
+            return 0.0
+
+        exclaims = min(len(_EXCLAIM_RE.findall(text)), 4)
+        emphasis = exclaims * 0.292
+        total += emphasis if total > 0 else -emphasis
+
+        return total / math.sqrt(total * total + ALPHA)
+
+
+class TextBlobSentimentBackend(SentimentBackend):
+    """Reference scorer using TextBlob's pattern-based polarity."""
+    name = 'textblob'
+
+    def __init__(self):
+        from textblob import TextBlob
+        self._blob = TextBlob
+
+    def score_batch(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        return np.fromiter(
+            (self._blob(t).sentiment.polarity if isinstance(t, str) and t else 0.0
+             for t in texts),
+            dtype=np.float64
+        )
+
+
+BACKENDS = {
+    LexiconSentimentBackend.name: LexiconSentimentBackend,
+    TextBlobSentimentBackend.name: TextBlobSentimentBackend,
+}
+
+_instances: Dict[str, SentimentBackend] = {}
+
+
+def get_sentiment_backend(name: Optional[str] = None) -> SentimentBackend:
+    """Return a shared backend instance, defaulting to SENTIMENT_BACKEND."""
+    name = (name or getenv('SENTIMENT_BACKEND', 'textblob')).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend: {name}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def available_backends() -> List[str]:
+    """Names of registered sentiment backends."""
+    return list(BACKENDS)
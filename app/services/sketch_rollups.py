@@ -0,0 +1,336 @@
+"""Per-bucket t-digests and HyperLogLogs for percentile and distinct-count analytics.
+
+Like the counter rollups, sketches are kept at hour and day grain. A
+range query merges one day sketch per whole day plus hour sketches at the
+edges. Its cost depends on the number of buckets, not on the number of
+emails.
+
+Sketch maintenance stays off the ingest path. A flush listener only
+collects the new values per bucket. On commit they join an in-process
+buffer. A background thread merges the buffer into the stored sketches
+every ``SKETCH_FLUSH_SECONDS``, loading and rewriting each touched bucket
+once per interval instead of once per transaction. Reads merge the
+buffered values of their range as well, so this process sees its own
+commits immediately. Other processes see them after the next flush, which
+bumps the analytics data version so their cached responses refresh.
+
+Sketches are append-only: a reclassification that changes an existing
+sentiment score adds the new value without removing the old one, and
+deletes are not subtracted. ``python -m app.services.rollups rebuild``
+recomputes them exactly for a range.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..database import async_engine, engine
+from ..models.analytics import AnalyticsSketch
+from ..models.email import Email, Response
+from . import telemetry
+from .analytics_cache import bump_data_version, data_version
+from .archive import sources
+from .rollups import GRAINS, bucket_start, plan_segments
+from .sketches import HyperLogLog, TDigest
+
+FLUSH_SECONDS = float(getenv("SKETCH_FLUSH_SECONDS", "5"))
+
+RESPONSE_TIME = "response_time"
+SENTIMENT = "sentiment"
+SENDERS = "senders"
+DIGEST_KINDS = (RESPONSE_TIME, SENTIMENT)
+
+Sketch = Union[TDigest, HyperLogLog]
+SketchKey = Tuple[str, datetime, str]
+
+
+def _new_sketch(kind: str) -> Sketch:
+    return HyperLogLog() if kind == SENDERS else TDigest()
+
+
+def _load_sketch(kind: str, data: bytes) -> Sketch:
+    return HyperLogLog.from_bytes(data) if kind == SENDERS else TDigest.from_bytes(data)
+
+
+class SketchBatch:
+    """Values collected during a flush, grouped by the sketch they belong to."""
+
+    def __init__(self):
+        self.values: Dict[SketchKey, list] = defaultdict(list)
+
+    def __bool__(self):
+        return bool(self.values)
+
+    def merge(self, other: "SketchBatch"):
+        for key, values in other.values.items():
+            self.values[key].extend(values)
+
+    def add(self, kind: str, received_at: Optional[datetime], value):
+        received_at = received_at or datetime.utcnow()
+        for grain in GRAINS:
+            self.values[(grain, bucket_start(received_at, grain), kind)].append(value)
+
+    def add_email(self, email: Email, include_sentiment: bool = True):
+        if email.sender_email:
+            self.add(SENDERS, email.received_at, email.sender_email.strip().lower())
+        if include_sentiment and email.sentiment_score is not None:
+            self.add(SENTIMENT, email.received_at, float(email.sentiment_score))
+
+    def add_response(self, email: Email, response: Response):
+        received_at = email.received_at or datetime.utcnow()
+        created_at = response.created_at or datetime.utcnow()
+        self.add(RESPONSE_TIME, received_at, (created_at - received_at).total_seconds())
+
+
+def apply_batch(connection, batch: SketchBatch):
+    """Merge batched values into stored sketches (read-modify-write per bucket)."""
+    table = AnalyticsSketch.__table__
+    upsert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(connection.dialect.name)
+    for (grain, start, kind), values in batch.values.items():
+        key = (table.c.grain == grain, table.c.bucket_start == start, table.c.kind == kind)
+        locked = select(table.c.data).where(*key).with_for_update()
+        stored = connection.execute(locked).scalar()
+
+        if stored is None and upsert is not None:
+            # Another process may create the bucket first; then merge into its row
+            connection.execute(upsert(table).values(
+                grain=grain, bucket_start=start, kind=kind, data=_new_sketch(kind).to_bytes()
+            ).on_conflict_do_nothing(index_elements=["grain", "bucket_start", "kind"]))
+            stored = connection.execute(locked).scalar()
+
+        sketch = _load_sketch(kind, stored) if stored is not None else _new_sketch(kind)
+        sketch.update(values)
+
+        if stored is None:
+            connection.execute(insert(table).values(
+                grain=grain, bucket_start=start, kind=kind, data=sketch.to_bytes()
+            ))
+        else:
+            connection.execute(update(table).where(*key).values(data=sketch.to_bytes()))
+
+
+class SketchBuffer:
+    """Committed values not yet merged into stored sketches, flushed by a daemon thread."""
+
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS, bind=None):
+        self.flush_seconds = flush_seconds
+        self.bind = bind
+        self._pending = SketchBatch()
+        # Taken by flush() and not yet committed; reads still count it
+        self._flushing = SketchBatch()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+
+    def add(self, batch: SketchBatch):
+        with self._lock:
+            self._pending.merge(batch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sketch-buffer", daemon=True)
+                self._thread.start()
+
+    def discard(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """Drop buffered values of buckets within [start, end)."""
+        with self._lock:
+            for key in [key for key in self._pending.values
+                        if (start is None or key[1] >= start) and (end is None or key[1] < end)]:
+                del self._pending.values[key]
+
+    def values(self, kind: str, grain: str, start: datetime, end: datetime) -> List:
+        """Buffered values of ``kind`` in ``grain`` buckets within [start, end), including a flush in flight."""
+        with self._lock:
+            return [value for batch in (self._pending, self._flushing)
+                    for (key_grain, key_start, key_kind), values in batch.values.items()
+                    if key_kind == kind and key_grain == grain and start <= key_start < end
+                    for value in values]
+
+    @property
+    def pending(self) -> int:
+        """Values buffered but not yet merged."""
+        with self._lock:
+            return sum(map(len, self._pending.values.values()))
+
+    def flush(self, bind=None) -> int:
+        """Merge every buffered value in one transaction. Returns the buckets written."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._flushing = self._pending
+                self._pending = SketchBatch()
+            if not pending:
+                return 0
+            try:
+                with (bind or self.bind or engine).begin() as conn:
+                    apply_batch(conn, pending)
+                    # Cached responses of other processes were built without these values
+                    bump_data_version(conn)
+            except Exception as e:
+                # Keep the values for the next attempt
+                with self._lock:
+                    self._pending.merge(pending)
+                    self._flushing = SketchBatch()
+                telemetry.flush_errors.inc(1, "sketches")
+                telemetry.log(f"Sketch flush error: {str(e)}")
+                return 0
+            with self._lock:
+                self._flushing = SketchBatch()
+            data_version.invalidate()
+            self.flushes += 1
+            return len(pending.values)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+sketch_buffer = SketchBuffer()
+atexit.register(sketch_buffer.flush)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_sketches(session: Session, flush_context):
+    batch = SketchBatch()
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Email):
+                batch.add_email(obj)
+            elif isinstance(obj, Response):
+                email = obj.email or session.get(Email, obj.email_id)
+                if email is not None:
+                    batch.add_response(email, obj)
+
+        for obj in session.dirty:
+            if isinstance(obj, Email):
+                history = inspect(obj).attrs.sentiment_score.history
+                if history.added and history.added[0] is not None:
+                    batch.add(SENTIMENT, obj.received_at, float(history.added[0]))
+
+    if not batch:
+        return
+    if session.bind is engine or session.bind is async_engine.sync_engine:
+        session.info.setdefault("sketch_batch", SketchBatch()).merge(batch)
+    else:
+        # Another database (a benchmark or script); the buffer only flushes to ours
+        apply_batch(session.connection(), batch)
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_sketches(session: Session):
+    batch = session.info.pop("sketch_batch", None)
+    if batch:
+        sketch_buffer.add(batch)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_sketches(session: Session):
+    session.info.pop("sketch_batch", None)
+
+
+def merged_sketch(db: Session, kind: str, start: datetime, end: datetime) -> Sketch:
+    """Merge the stored sketches covering [start, end) (hour-aligned)."""
+    merged = _new_sketch(kind)
+    for grain, seg_start, seg_end in plan_segments(start, end):
+        rows = db.query(AnalyticsSketch.data).filter(
+            AnalyticsSketch.kind == kind,
+            AnalyticsSketch.grain == grain,
+            AnalyticsSketch.bucket_start >= seg_start,
+            AnalyticsSketch.bucket_start < seg_end
+        ).all()
+        for (data,) in rows:
+            merged.merge(_load_sketch(kind, data))
+        merged.update(sketch_buffer.values(kind, grain, seg_start, seg_end))
+    return merged
+
+
+def snap_to_hours(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """Widen a range outward to whole hours, the finest sketch grain."""
+    start = bucket_start(start, "hour")
+    if end != bucket_start(end, "hour"):
+        end = bucket_start(end, "hour") + timedelta(hours=1)
+    return start, end
+
+
+def percentiles(db: Session, kind: str, start: datetime, end: datetime,
+                quantiles: List[float]) -> Dict:
+    digest = merged_sketch(db, kind, start, end)
+    scale = 1 / 3600 if kind == RESPONSE_TIME else 1
+    values = {}
+    for q in quantiles:
+        value = digest.quantile(q)
+        values[f"p{q * 100:g}"] = value * scale if value is not None else None
+    return {"count": int(digest.count), "percentiles": values}
+
+
+def unique_senders(db: Session, start: datetime, end: datetime) -> Dict:
+    hll = merged_sketch(db, SENDERS, start, end)
+    return {"unique_customers": hll.count(), "standard_error": round(hll.standard_error, 4)}
+
+
+def rebuild_sketches(db: Session,
+                     start: Optional[datetime] = None,
+                     end: Optional[datetime] = None,
+                     batch_size: int = 10000) -> int:
+    """Recompute sketches for whole days in [start, end) of both tiers. The caller commits."""
+    emails, responses, _ = sources(include_archived=True)
+    if start:
+        start = bucket_start(start, "day")
+    if end and end != bucket_start(end, "day"):
+        end = bucket_start(end, "day") + timedelta(days=1)
+    # Buffered values belong to committed rows, which the scan below counts again
+    sketch_buffer.discard(start, end)
+
+    clear = delete(AnalyticsSketch)
+    source = db.query(
+        emails.id, emails.received_at, emails.sender_email, emails.sentiment_score,
+        responses.created_at
+    ).outerjoin(responses, responses.email_id == emails.id)
+    if start:
+        clear = clear.where(AnalyticsSketch.bucket_start >= start)
+        source = source.filter(emails.received_at >= start)
+    if end:
+        clear = clear.where(AnalyticsSketch.bucket_start < end)
+        source = source.filter(emails.received_at < end)
+    db.execute(clear)
+
+    sketches: Dict[SketchKey, Sketch] = {}
+
+    def add(kind, received_at, value):
+        for grain in GRAINS:
+            key = (grain, bucket_start(received_at, grain), kind)
+            if key not in sketches:
+                sketches[key] = _new_sketch(kind)
+            sketches[key].add(value)
+
+    scanned = 0
+    last_id = None
+    for row in source.order_by(emails.id).yield_per(batch_size):
+        if row.received_at is None:
+            continue
+        if row.id != last_id:
+            last_id = row.id
+            scanned += 1
+            if row.sender_email:
+                add(SENDERS, row.received_at, row.sender_email.strip().lower())
+            if row.sentiment_score is not None:
+                add(SENTIMENT, row.received_at, float(row.sentiment_score))
+        if row.created_at is not None:
+            add(RESPONSE_TIME, row.received_at,
+                (row.created_at - row.received_at).total_seconds())
+
+    rows = [
+        {"grain": grain, "bucket_start": start_at, "kind": kind, "data": sketch.to_bytes()}
+        for (grain, start_at, kind), sketch in sketches.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(AnalyticsSketch.__table__), rows[i:i + batch_size])
+    return scanned
@@ -0,0 +1,191 @@
+"""Mergeable summaries for approximate analytics.
+
+TDigest answers quantile queries over a stream of numbers. It keeps at most
+about ``compression`` centroids and uses the k1 (arcsine) scale function,
+so centroids are smallest near q=0 and q=1. With the default
+compression of 100, quantile rank error is typically below 1% at the
+median and a small fraction of that at p99. Two digests merge by
+re-compressing their centroids together.
+
+HyperLogLog estimates the number of distinct values. With precision p,
+it keeps 2**p one-byte registers (p=12: 4 KiB). The relative standard
+error is 1.04 / sqrt(2**p), about 1.6% at p=12. Merging is an
+element-wise max of the registers.
+
+Both serialize to compact bytes for storage in ``analytics_sketches``.
+"""
+import hashlib
+import math
+import struct
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_TDIGEST_HEADER = struct.Struct("<dIdd")
+
+
+class TDigest:
+    """Merging t-digest (Dunning & Ertl) for streaming quantiles."""
+
+    def __init__(self, compression: float = 100.0,
+                 means: Optional[Sequence[float]] = None,
+                 weights: Optional[Sequence[float]] = None,
+                 min_value: float = math.inf,
+                 max_value: float = -math.inf):
+        self.compression = compression
+        self._means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self._weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self._buffer_means: List[float] = []
+        self._buffer_weights: List[float] = []
+        self._buffer_limit = int(compression * 5)
+        self.min = min_value
+        self.max = max_value
+
+    @property
+    def count(self) -> float:
+        return float(self._weights.sum()) + sum(self._buffer_weights)
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer_means.append(value)
+        self._buffer_weights.append(weight)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer_means) >= self._buffer_limit:
+            self._compress()
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(float(value))
+
+    def merge(self, other: "TDigest"):
+        other._compress()
+        self._buffer_means.extend(other._means.tolist())
+        self._buffer_weights.extend(other._weights.tolist())
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(2 * math.pi * k / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer_means:
+            return
+        means = np.concatenate([self._means, np.asarray(self._buffer_means)])
+        weights = np.concatenate([self._weights, np.asarray(self._buffer_weights)])
+        self._buffer_means, self._buffer_weights = [], []
+
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order].tolist(), weights[order].tolist()
+        total = sum(weights)
+
+        new_means, new_weights = [], []
+        current_mean, current_weight = means[0], weights[0]
+        weight_so_far = 0.0
+        q_limit = self._k_inverse(self._k(0.0) + 1)
+        for mean, weight in zip(means[1:], weights[1:]):
+            if (weight_so_far + current_weight + weight) / total <= q_limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                new_means.append(current_mean)
+                new_weights.append(current_weight)
+                weight_so_far += current_weight
+                q_limit = self._k_inverse(self._k(weight_so_far / total) + 1)
+                current_mean, current_weight = mean, weight
+        new_means.append(current_mean)
+        new_weights.append(current_weight)
+
+        self._means = np.asarray(new_means)
+        self._weights = np.asarray(new_weights)
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not len(self._means):
+            return None
+        if len(self._means) == 1:
+            return float(self._means[0])
+
+        total = self._weights.sum()
+        centers = np.cumsum(self._weights) - self._weights / 2
+        target = min(max(q, 0.0), 1.0) * total
+        if target <= centers[0]:
+            return float(np.interp(target, [0, centers[0]], [self.min, self._means[0]]))
+        if target >= centers[-1]:
+            return float(np.interp(target, [centers[-1], total], [self._means[-1], self.max]))
+        return float(np.interp(target, centers, self._means))
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        return [self.quantile(q) for q in qs]
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        header = _TDIGEST_HEADER.pack(self.compression, len(self._means), self.min, self.max)
+        return header + self._means.tobytes() + self._weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        compression, size, min_value, max_value = _TDIGEST_HEADER.unpack_from(data)
+        offset = _TDIGEST_HEADER.size
+        means = np.frombuffer(data, dtype=np.float64, count=size, offset=offset)
+        weights = np.frombuffer(data, dtype=np.float64, count=size, offset=offset + size * 8)
+        return cls(compression, means.copy(), weights.copy(), min_value, max_value)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit BLAKE2b hashes."""
+
+    def __init__(self, precision: int = 12, registers: Optional[np.ndarray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.size, dtype=np.uint8)
+        self.registers = registers
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        precision = data[0]
+        registers = np.frombuffer(data, dtype=np.uint8, offset=1).copy()
+        return cls(precision, registers)
@@ -0,0 +1,265 @@
+"""Per-request SQL profiling and the slow query log.
+
+Cursor hooks on every ``Engine`` time each statement. Inside an HTTP
+request that goes through ``profile_requests``, the statement is also
+added to a per-request profile held in a context variable. Sync routes
+running in the threadpool and AsyncSession greenlets both see it. The
+profile keeps:
+
+- the query count and total DB time;
+- the slowest statements;
+- how often each statement shape repeats, so a lazy load in a loop shows
+  up as one fingerprint executed dozens of times.
+
+The middleware reports the profile in a ``Server-Timing`` header
+(``db;dur=12.5;desc="7 queries"``, then the slowest statements), which
+browser dev tools display. It also adds the request to per-route totals
+served by ``GET /profiling/sql``.
+
+Statements slower than ``SQL_SLOW_QUERY_MS`` are written as JSON lines to
+``SQL_SLOW_LOG_PATH``, or stdout when unset. A line holds the statement's
+fingerprint: literals, bind markers and IN lists are normalized, so one
+query shape maps to one id whatever its parameters. It also holds the
+route and the trace id. For a sampled ``SQL_EXPLAIN_SAMPLE_RATE`` of
+slow SELECTs, the plan is attached, from ``EXPLAIN`` or
+``EXPLAIN QUERY PLAN`` run on the same connection.
+
+Profiling is off unless ``SQL_PROFILING_ENABLED`` is set. It can be
+switched per process at runtime with ``PUT /profiling/sql``. When it is
+off, the hooks cost one attribute check per statement.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter as Tally
+from contextvars import ContextVar
+from datetime import datetime
+from os import getenv
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import telemetry
+
+ENABLED = getenv("SQL_PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(getenv("SQL_SLOW_QUERY_MS", "200"))
+EXPLAIN_SAMPLE_RATE = float(getenv("SQL_EXPLAIN_SAMPLE_RATE", "0.1"))
+SLOW_LOG_PATH = getenv("SQL_SLOW_LOG_PATH", "")
+# A fingerprint run this many times in one request is reported as a likely N+1
+REPEAT_THRESHOLD = int(getenv("SQL_REPEAT_THRESHOLD", "10"))
+SLOWEST_KEPT = 3
+STATEMENT_CHARS = 2000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """The shape of a statement: literals and bind markers as ``?``, IN lists collapsed."""
+    text = _STRING.sub("?", statement)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("(?...)", text)
+    return _SPACE.sub(" ", text).strip().lower()
+
+
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """(short id, normalized text) of a statement."""
+    normalized = normalize(statement)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+class RequestProfile:
+    """Statements run while serving one request."""
+
+    __slots__ = ("queries", "seconds", "slowest", "shapes")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+        self.shapes: Tally = Tally()
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        self.shapes[statement] += 1
+        if len(self.slowest) < SLOWEST_KEPT or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_KEPT:]
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Fingerprints of statements run at least REPEAT_THRESHOLD times."""
+        return [(fingerprint(statement)[0], count) for statement, count in self.shapes.most_common()
+                if count >= REPEAT_THRESHOLD]
+
+    def server_timing(self, total_seconds: float) -> str:
+        noun = "query" if self.queries == 1 else "queries"
+        entries = [f'db;dur={self.seconds * 1000:.1f};desc="{self.queries} {noun}"',
+                   f"app;dur={max(total_seconds - self.seconds, 0) * 1000:.1f}"]
+        for rank, (seconds, statement) in enumerate(self.slowest, 1):
+            entries.append(f'sql-{rank};dur={seconds * 1000:.1f};desc="{fingerprint(statement)[0]}"')
+        return ", ".join(entries)
+
+
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+_route: ContextVar[Optional[str]] = ContextVar("sql_profile_route", default=None)
+
+
+class SqlProfiler:
+    """Runtime switch, slow query log and per-route totals."""
+
+    def __init__(self, enabled: bool = ENABLED, slow_ms: float = SLOW_QUERY_MS,
+                 explain_rate: float = EXPLAIN_SAMPLE_RATE, log_path: str = SLOW_LOG_PATH):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.explain_rate = explain_rate
+        self.log_path = log_path
+        # route -> [requests, queries, db seconds, max queries in one request]
+        self.routes: Dict[str, List[float]] = {}
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: Optional[bool] = None, slow_ms: Optional[float] = None,
+                  explain_rate: Optional[float] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if explain_rate is not None:
+            self.explain_rate = max(0.0, min(1.0, explain_rate))
+
+    def settings(self) -> Dict:
+        return {"enabled": self.enabled, "slow_ms": self.slow_ms,
+                "explain_rate": self.explain_rate, "log_path": self.log_path or None}
+
+    def add_request(self, route: str, profile: RequestProfile):
+        with self._lock:
+            totals = self.routes.setdefault(route, [0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += profile.queries
+            totals[2] += profile.seconds
+            totals[3] = max(totals[3], profile.queries)
+
+    def route_stats(self) -> List[Dict]:
+        with self._lock:
+            rows = [(route, list(totals)) for route, totals in self.routes.items()]
+        return sorted((
+            {"route": route, "requests": int(requests), "queries": int(queries),
+             "queries_per_request": round(queries / requests, 2),
+             "max_queries": int(max_queries), "db_ms": round(seconds * 1000, 1),
+             "db_ms_per_request": round(seconds * 1000 / requests, 2)}
+            for route, (requests, queries, seconds, max_queries) in rows
+        ), key=lambda row: row["db_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+    def write(self, entry: Dict):
+        line = json.dumps(entry, default=str)
+        if not self.log_path:
+            print(f"slow_query {line}")
+            return
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as log:
+                log.write(line + "\n")
+        except OSError as e:
+            print(f"Slow query log error: {str(e)}")
+
+    def slow_query(self, conn, cursor, statement: str, parameters, seconds: float, executemany: bool):
+        self.slow_queries += 1
+        short_id, normalized = fingerprint(statement)
+        entry = {
+            "ts": datetime.utcnow().isoformat(),
+            "fingerprint": short_id,
+            "ms": round(seconds * 1000, 2),
+            "statement": normalized[:STATEMENT_CHARS],
+            "route": _route.get(),
+            "trace_id": telemetry.trace_id.get(),
+        }
+        if not executemany and random.random() < self.explain_rate:
+            entry["plan"] = explain(conn, cursor, statement, parameters)
+        self.write(entry)
+
+
+profiler = SqlProfiler()
+
+
+def explain(conn, cursor, statement: str, parameters) -> Optional[List[str]]:
+    """Plan of a SELECT, run on the connection that executed it; None otherwise."""
+    if not statement.lstrip().lower().startswith(("select", "with")):
+        return None
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    plan_cursor = conn.connection.cursor()
+    try:
+        plan_cursor.execute(prefix + statement, parameters)
+        return [" ".join(str(value) for value in row) for row in plan_cursor.fetchall()]
+    except Exception as e:
+        return [f"explain failed: {str(e)}"]
+    finally:
+        plan_cursor.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if profiler.enabled:
+        conn.info.setdefault("sql_profiler_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("sql_profiler_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(statement, seconds)
+    if seconds * 1000 >= profiler.slow_ms:
+        profiler.slow_query(conn, cursor, statement, parameters, seconds, executemany)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("sql_profiler_started"):
+        connection.info["sql_profiler_started"].pop()
+
+
+def _route_of(request) -> str:
+    route = request.scope.get("route")
+    return f"{request.method} {getattr(route, 'path', request.url.path)}"
+
+
+async def profile_requests(request, call_next):
+    """HTTP middleware, registered by ``app.main.create_app``.
+
+    Profiles the request's SQL when profiling is on and adds Server-Timing.
+    """
+    if not profiler.enabled:
+        return await call_next(request)
+    profile = RequestProfile()
+    profile_token = _profile.set(profile)
+    route_token = _route.set(f"{request.method} {request.url.path}")
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _profile.reset(profile_token)
+        _route.reset(route_token)
+    route = _route_of(request)
+    response.headers["Server-Timing"] = profile.server_timing(time.perf_counter() - started)
+    profiler.add_request(route, profile)
+    for short_id, count in profile.repeated():
+        telemetry.log(f"{route} ran statement {short_id} {count} times; likely an N+1 query")
+    return response
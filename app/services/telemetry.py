@@ -0,0 +1,278 @@
+"""Pipeline latency metrics, Prometheus exposition and trace ids.
+
+Instruments are process-local and written without I/O: an observation
+takes a dictionary lookup, a bisect and one lock. The whole subsystem can
+stay on in production. ``render()`` produces the Prometheus text format
+(0.0.4) served at ``/metrics``. Callback gauges are evaluated at scrape
+time: queue depths, and the hit counts the caches already keep.
+
+``timed(stage)`` records one pipeline stage into
+``email_stage_duration_seconds`` and counts exceptions leaving it in
+``email_stage_errors_total``. The stages are:
+
+- imap_fetch
+- mime_parse
+- classify
+- generate
+- db_commit
+- smtp_send
+
+Every email handled by the poller, and every HTTP request through
+``trace_requests``, runs under a trace id held in a context variable.
+Log lines written with ``log()`` carry it. Outgoing responses send it as
+``X-Trace-Id``, so one email can be followed from fetch to send. Set
+``TELEMETRY_ENABLED=false`` to turn the instruments into no-ops.
+"""
+import math
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+ENABLED = getenv("TELEMETRY_ENABLED", "true").lower() not in ("0", "false", "no")
+# The framework appends "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+TRACE_HEADER = "X-Trace-Id"
+
+# Seconds; spans a millisecond DB commit up to a slow model call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+        # Set to {} to also keep raw observations, for exact percentiles in benchmarks
+        self.samples: Optional[Dict[LabelValues, List[float]]] = None
+
+    def observe(self, value: float, *labels: str):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+            if self.samples is not None:
+                self.samples.setdefault(labels, []).append(value)
+
+    def count(self, *labels: str) -> int:
+        counts = self._values.get(labels)
+        return int(sum(counts[:-1])) if counts else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        lines = self.header()
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {int(cumulative)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackMetric(_Metric):
+    """A gauge or counter whose samples are read at scrape time."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str],
+                 read: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.read = read
+
+    def collect(self) -> List[str]:
+        try:
+            values = sorted(self.read().items())
+        except Exception as e:
+            print(f"Metric {self.name} could not be read: {str(e)}")
+            return []
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.register(Histogram(
+    "email_stage_duration_seconds", "Latency of each email pipeline stage.", ["stage"]
+))
+stage_errors = registry.register(Counter(
+    "email_stage_errors_total", "Errors raised or handled in each email pipeline stage.", ["stage"]
+))
+tokens = registry.register(Counter(
+    "llm_tokens_total", "Model tokens used, by pipeline stage and direction.", ["stage", "kind"]
+))
+emails_processed = registry.register(Counter(
+    "emails_processed_total", "Emails taken through the pipeline, by source and outcome.", ["source", "result"]
+))
+flush_errors = registry.register(Counter(
+    "background_flush_errors_total", "Failed flushes of buffered writes, kept for a retry, by buffer.",
+    ["buffer"]
+))
+email_queue = registry.register(Gauge(
+    "email_queue_depth", "Emails by status, as of the last recount.", ["status"]
+))
+
+
+def register_callback(name: str, help_text: str, labelnames: Sequence[str],
+                      read: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+    registry.register(CallbackMetric(name, help_text, labelnames, read, kind))
+
+
+def render() -> str:
+    return registry.render()
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the duration of a stage, and count it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(1, stage)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - started, stage)
+
+
+def record_error(stage: str):
+    """Count an error that the stage handled itself (e.g. with a fallback)."""
+    stage_errors.inc(1, stage)
+
+
+def record_usage(stage: str, usage) -> Tuple[int, int]:
+    """Count a model response's input/output tokens; returns them."""
+    prompt = getattr(usage, "input_tokens", 0) or 0
+    completion = getattr(usage, "output_tokens", 0) or 0
+    tokens.inc(prompt, stage, "prompt")
+    tokens.inc(completion, stage, "completion")
+    return prompt, completion
+
+
+trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def tracing(existing: Optional[str] = None) -> Iterator[str]:
+    """Run the block under ``existing`` or a fresh trace id."""
+    token = trace_id.set(existing or new_trace_id())
+    try:
+        yield trace_id.get()
+    finally:
+        trace_id.reset(token)
+
+
+def log(message: str):
+    print(f"[trace {trace_id.get() or '-'}] {message}")
+
+
+async def trace_requests(request, call_next):
+    """HTTP middleware, registered by ``app.main.create_app``.
+
+    Adopts the caller's X-Trace-Id or starts one, and echoes it back.
+    """
+    with tracing(request.headers.get(TRACE_HEADER)) as current:
+        response = await call_next(request)
+    response.headers[TRACE_HEADER] = current
+    return response
@@ -0,0 +1,184 @@
+"""Conversation threads.
+
+Every email carries a ``thread_id``: the Message-ID of the first email in
+its conversation. A reply is placed in a thread through its
+``In-Reply-To`` and ``References`` headers. The nearest reference we have
+stored wins. Our own outgoing responses carry Message-IDs of the form
+``<response-{id}.{email_id}@slyfone.com>``, so a customer answering one
+resolves to the email it answered without a lookup table for responses.
+
+Resolved Message-IDs are kept in a bounded in-process LRU
+(``THREAD_CACHE_SIZE`` entries). A thread id never changes once assigned,
+so entries never go stale. Misses cost one indexed query per email, or
+per batch on the ingest path. References we have never seen are not
+cached, since their email may still arrive. A reply whose references are
+all unknown starts a thread named after its oldest reference, so its
+siblings still group together.
+
+A reply to a known thread marks every earlier response in that thread
+``customer_replied`` in one UPDATE through ``ix_emails_thread_id_received_at``.
+"""
+import re
+import threading
+from collections import OrderedDict
+from os import getenv
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session, selectinload, undefer
+
+from ..models.email import Email, Response
+from .analytics_cache import bump_data_version
+from .archive import archived_emails, archived_responses
+
+CACHE_SIZE = int(getenv("THREAD_CACHE_SIZE", "100000"))
+LOOKUP_CHUNK = 500
+
+RESPONSE_DOMAIN = "slyfone.com"
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+_RESPONSE_ID = re.compile(r"^<response-\d+\.(\d+)@" + re.escape(RESPONSE_DOMAIN) + r">$")
+
+
+def response_message_id(response: Response) -> str:
+    """Message-ID for an outgoing response; replies to it resolve back to its email."""
+    return f"<response-{response.id}.{response.email_id}@{RESPONSE_DOMAIN}>"
+
+
+def reply_references(in_reply_to: Optional[str], references: Optional[str]) -> List[str]:
+    """Message-IDs a reply points at, nearest first."""
+    found = _MESSAGE_ID.findall(in_reply_to or "") + _MESSAGE_ID.findall(references or "")[::-1]
+    return list(dict.fromkeys(found))
+
+
+def references_of(email_data: Dict) -> List[str]:
+    """References of a parsed message, or the caller-supplied ``thread_id`` of an API payload."""
+    if email_data.get("references") is not None:
+        return email_data["references"]
+    return [email_data["thread_id"]] if email_data.get("thread_id") else []
+
+
+class ThreadIndex:
+    """Bounded LRU of Message-ID -> thread_id, backed by ``emails.message_id``."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message_id: str) -> Optional[str]:
+        with self._lock:
+            thread_id = self._entries.get(message_id)
+            if thread_id is not None:
+                self._entries.move_to_end(message_id)
+            return thread_id
+
+    def remember(self, message_id: str, thread_id: str):
+        with self._lock:
+            self._entries[message_id] = thread_id
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def prefetch(self, db: Session, references: Iterable[str]):
+        """Load the thread of every uncached reference that is stored, in chunked queries."""
+        references = list(dict.fromkeys(references))
+        missing = [ref for ref in references if self.get(ref) is None]
+        self.hits += len(references) - len(missing)
+        self.misses += len(missing)
+        for i in range(0, len(missing), LOOKUP_CHUNK):
+            chunk = missing[i:i + LOOKUP_CHUNK]
+            responses = {}
+            for ref in chunk:
+                match = _RESPONSE_ID.match(ref)
+                if match:
+                    responses[int(match.group(1))] = ref
+            # A reference may also be a thread id itself, as API clients send them
+            clauses = [Email.message_id.in_(chunk), Email.thread_id.in_(chunk)]
+            if responses:
+                clauses.append(Email.id.in_(list(responses)))
+            for email_id, message_id, thread_id in db.query(
+                Email.id, Email.message_id, Email.thread_id
+            ).filter(or_(*clauses)):
+                thread_id = thread_id or message_id
+                self.remember(message_id, thread_id)
+                self.remember(thread_id, thread_id)
+                if email_id in responses:
+                    self.remember(responses[email_id], thread_id)
+
+    def lookup(self, references: Sequence[str]) -> Optional[str]:
+        """Thread of the nearest cached reference, without touching the database."""
+        for ref in references:
+            thread_id = self.get(ref)
+            if thread_id is not None:
+                return thread_id
+        return None
+
+    def resolve(self, db: Session, references: Sequence[str]) -> Optional[str]:
+        self.prefetch(db, references)
+        return self.lookup(references)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+thread_index = ThreadIndex()
+
+
+def thread_for(message_id: str, references: Sequence[str]) -> Tuple[str, bool]:
+    """(thread_id, whether it is an existing thread) from cached references; prefetch first."""
+    thread_id = thread_index.lookup(references)
+    if thread_id is not None:
+        return thread_id, True
+    return (references[-1] if references else message_id), False
+
+
+def mark_replied(db: Session, thread_ids: Iterable[str]) -> int:
+    """Set ``customer_replied`` on the responses already sent in these threads. Caller commits."""
+    thread_ids = list(set(thread_ids))
+    if not thread_ids:
+        return 0
+    in_threads = db.query(Email.id).filter(Email.thread_id.in_(thread_ids))
+    marked = db.execute(
+        update(Response).where(
+            Response.email_id.in_(in_threads.scalar_subquery()),
+            Response.customer_replied.isnot(True),
+        ).values(customer_replied=True).execution_options(synchronize_session=False)
+    ).rowcount
+    if marked:
+        bump_data_version(db.connection())
+    return marked
+
+
+def get_thread(db: Session, thread_id: str, include_archived: bool = False) -> List[Tuple[Email, List[Response]]]:
+    """Every email in a thread with its responses, oldest first.
+
+    Hot emails and all their responses come from one query plus one
+    ``selectinload``; archived ones, when asked for, from two more.
+    """
+    emails = db.query(Email).options(
+        undefer(Email.body), undefer(Email.clean_body), selectinload(Email.responses)
+    ).filter(Email.thread_id == thread_id).all()
+    thread = [(email, list(email.responses)) for email in emails]
+    if include_archived:
+        archived = db.query(archived_emails).options(
+            undefer(archived_emails.body), undefer(archived_emails.clean_body)
+        ).filter(archived_emails.thread_id == thread_id).all()
+        responses: Dict[int, List[Response]] = {email.id: [] for email in archived}
+        if archived:
+            for response in db.query(archived_responses).filter(
+                archived_responses.email_id.in_(list(responses))
+            ):
+                responses[response.email_id].append(response)
+        thread += [(email, responses[email.id]) for email in archived]
+
+    thread.sort(key=lambda pair: (pair[0].received_at, pair[0].id))
+    for _, responses in thread:
+        responses.sort(key=lambda response: (response.created_at, response.id))
+    return thread
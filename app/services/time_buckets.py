@@ -0,0 +1,218 @@
+"""Dialect-portable time bucketing for trend queries.
+
+``received_at`` is stored as naive UTC. Bucket expressions are only ever
+used in SELECT/GROUP BY; the WHERE clause is always a plain half-open
+range on the raw column so the ``received_at`` index stays usable.
+
+Timezones: Postgres converts with ``timezone()`` inside ``date_trunc``.
+SQLite has no zone database, so the range is split wherever the zone's UTC
+offset changes (DST) and each constant-offset segment shifts the column
+with ``datetime(col, '+N minutes')``. Partial sums from the segments are
+merged per bucket.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    from dateutil.tz import gettz as ZoneInfo
+
+from .archive import sources
+
+INTERVALS = ("hour", "day", "week", "month")
+
+_SQLITE_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+    "week": "%Y-%m-%d 00:00:00",
+    "month": "%Y-%m-01 00:00:00",
+}
+
+Segment = Tuple[datetime, datetime, timedelta]
+
+
+def get_zone(tz: Optional[str]):
+    """Resolve an IANA zone name; None or UTC means no conversion."""
+    if not tz or tz.upper() == "UTC":
+        return None
+    zone = ZoneInfo(tz)
+    if zone is None:
+        raise ValueError(f"Unknown timezone: {tz}")
+    return zone
+
+
+def to_utc_naive(ts: datetime) -> datetime:
+    """Normalise a possibly tz-aware datetime to the naive UTC stored in the DB."""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _utc_offset(zone, utc_ts: datetime) -> timedelta:
+    if zone is None:
+        return timedelta(0)
+    return utc_ts.replace(tzinfo=timezone.utc).astimezone(zone).utcoffset()
+
+
+def offset_segments(start: datetime, end: datetime, zone) -> List[Segment]:
+    """Split the naive-UTC range [start, end) into constant UTC-offset segments."""
+    segments = []
+    seg_start = start
+    offset = _utc_offset(zone, start)
+    cursor = start
+    while zone is not None and cursor < end:
+        step = min(cursor + timedelta(days=1), end)
+        if _utc_offset(zone, step) != offset:
+            # Narrow the transition down to the minute
+            lo, hi = cursor, step
+            while hi - lo > timedelta(minutes=1):
+                mid = lo + (hi - lo) / 2
+                if _utc_offset(zone, mid) == offset:
+                    lo = mid
+                else:
+                    hi = mid
+            hi = hi.replace(second=0, microsecond=0)
+            segments.append((seg_start, hi, offset))
+            seg_start, offset = hi, _utc_offset(zone, hi)
+            cursor = hi
+            continue
+        cursor = step
+    segments.append((seg_start, end, offset))
+    return segments
+
+
+def floor_bucket(ts: datetime, interval: str) -> datetime:
+    """Start of the bucket containing a (local, naive) timestamp."""
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    if interval == "hour":
+        return ts
+    ts = ts.replace(hour=0)
+    if interval == "week":
+        return ts - timedelta(days=ts.weekday())
+    if interval == "month":
+        return ts.replace(day=1)
+    return ts
+
+
+def next_bucket(ts: datetime, interval: str) -> datetime:
+    if interval == "hour":
+        return ts + timedelta(hours=1)
+    if interval == "day":
+        return ts + timedelta(days=1)
+    if interval == "week":
+        return ts + timedelta(days=7)
+    return (ts.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def bucket_starts(start: datetime, end: datetime, interval: str, zone=None) -> List[datetime]:
+    """Every local bucket start touched by the naive-UTC range [start, end)."""
+    if start >= end:
+        return []
+    local_start = start + _utc_offset(zone, start)
+    local_end = end + _utc_offset(zone, end)
+    starts = []
+    bucket = floor_bucket(local_start, interval)
+    while bucket < local_end:
+        starts.append(bucket)
+        bucket = next_bucket(bucket, interval)
+    return starts
+
+
+def bucket_expression(column, interval: str, dialect: str,
+                      offset: timedelta = timedelta(0), tz: Optional[str] = None):
+    """SQL expression for the local bucket start of a naive-UTC column."""
+    if interval not in INTERVALS:
+        raise ValueError(f"Unsupported interval: {interval}")
+
+    if dialect == "postgresql":
+        local = func.timezone(tz, func.timezone("UTC", column)) if tz else column
+        return func.date_trunc(interval, local)
+
+    if dialect == "sqlite":
+        minutes = int(offset.total_seconds() // 60)
+        local = func.datetime(column, f"{minutes:+d} minutes") if minutes else column
+        if interval == "week":
+            # Move to the coming Sunday (or stay), then back to that week's Monday
+            local = func.date(local, "weekday 0", "-6 days")
+        return func.strftime(_SQLITE_FORMATS[interval], local)
+
+    raise ValueError(f"Time bucketing is not supported on {dialect}")
+
+
+def seconds_between(start_column, end_column, dialect: str):
+    """SQL expression for end - start in seconds."""
+    if dialect == "postgresql":
+        return func.extract("epoch", end_column - start_column)
+    if dialect == "sqlite":
+        return (func.julianday(end_column) - func.julianday(start_column)) * 86400.0
+    raise ValueError(f"Interval arithmetic is not supported on {dialect}")
+
+
+def _metric_query(db: Session, metric: str, bucket, dialect: str, emails, responses):
+    """Select (bucket, total, n) where value = total for volume, total / n otherwise."""
+    if metric == "volume":
+        return db.query(bucket.label("bucket"), func.count(emails.id), literal(1))
+    if metric == "response_time":
+        elapsed = seconds_between(emails.received_at, responses.created_at, dialect)
+        return db.query(
+            bucket.label("bucket"), func.sum(elapsed) / 3600.0, func.count(responses.id)
+        ).select_from(emails).join(responses, responses.email_id == emails.id)
+    return db.query(
+        bucket.label("bucket"), func.sum(emails.sentiment_score), func.count(emails.sentiment_score)
+    )
+
+
+def _parse_bucket(value) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def trend_totals(db: Session, metric: str, interval: str,
+                 start: datetime, end: datetime,
+                 tz: Optional[str] = None,
+                 include_archived: bool = False) -> Dict[datetime, List[float]]:
+    """Per-bucket [total, n] for a metric over the naive-UTC range [start, end)."""
+    dialect = db.get_bind().dialect.name
+    emails, responses, tier = sources(include_archived)
+    zone = get_zone(tz)
+    if dialect == "postgresql":
+        segments = [(start, end, timedelta(0))]
+    else:
+        segments = offset_segments(start, end, zone)
+
+    totals: Dict[datetime, List[float]] = defaultdict(lambda: [0.0, 0])
+    for seg_start, seg_end, offset in segments:
+        bucket = bucket_expression(emails.received_at, interval, dialect,
+                                   offset, tz if zone else None)
+        rows = _metric_query(db, metric, bucket, dialect, emails, responses).filter(
+            emails.received_at >= seg_start,
+            emails.received_at < seg_end,
+            *tier
+        ).group_by("bucket").all()
+        for key, total, n in rows:
+            entry = totals[_parse_bucket(key)]
+            entry[0] += float(total or 0)
+            entry[1] += n or 0
+    return totals
+
+
+def dense_series(totals: Dict[datetime, List[float]], metric: str, interval: str,
+                 start: datetime, end: datetime, tz: Optional[str] = None) -> List[Dict]:
+    """Turn per-bucket totals into a gap-free series of {date, value} points."""
+    zone = get_zone(tz)
+    data = []
+    for bucket in bucket_starts(start, end, interval, zone):
+        total, n = totals.get(bucket, (0.0, 0))
+        if metric == "volume":
+            value = total
+        else:
+            value = total / n if n else 0
+        date = bucket.replace(tzinfo=zone) if zone else bucket
+        data.append({"date": date, "value": float(value)})
+    return data
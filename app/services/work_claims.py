@@ -0,0 +1,288 @@
+"""Leased work claims on the emails table.
+
+A worker claims a batch of NEW emails by moving them to PROCESSING with
+its owner ID and a lease expiry, in one atomic statement:
+
+* Postgres: ``UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+  RETURNING id``. Concurrent claimers skip each other's rows instead of
+  waiting on them.
+* SQLite (3.35+): ``UPDATE ... WHERE id IN (SELECT ... LIMIT n) RETURNING
+  id``. SQLite serializes writers, so the statement is atomic as is.
+
+Results are written back only while the worker still holds the lease,
+so work is never saved twice. A lease that expires (a crashed or hung
+worker) is put back to NEW by the next claimer. After ``WORK_MAX_CLAIMS``
+expired leases the email is marked FAILED instead of retried forever.
+
+Claims and reclaims are bulk UPDATEs, which skip the ORM flush
+listeners. They only change status and lease columns, which rollups,
+sketches and live metrics do not read. They bump the analytics data
+version themselves, so cached status counts are refreshed. Saving a result
+goes through the ORM and fires every listener.
+
+Run workers with ``python -m app.services.work_claims work``. Start as
+many as needed, on any number of hosts.
+"""
+import argparse
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from os import getenv
+from typing import List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, bindparam, select, text, update
+from sqlalchemy.orm import Session, undefer
+
+from ..database import SessionLocal
+from ..models.email import Email, EmailStatus, status_literal
+from . import telemetry
+from .analytics_cache import bump_in_session
+from .email_processor import EmailProcessor
+
+LEASE_SECONDS = int(getenv("WORK_LEASE_SECONDS", "300"))
+MAX_CLAIMS = int(getenv("WORK_MAX_CLAIMS", "3"))
+BATCH_SIZE = int(getenv("WORK_BATCH_SIZE", "10"))
+POLL_SECONDS = float(getenv("WORK_POLL_SECONDS", "2"))
+
+_columns = Email.__table__.c
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def reclaim_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Return expired PROCESSING leases to NEW (or FAILED past MAX_CLAIMS). Caller commits."""
+    now = now or datetime.utcnow()
+    expired = and_(Email.status == EmailStatus.PROCESSING, Email.lease_expires_at < now)
+    failed = db.execute(
+        update(Email).where(expired, Email.claim_count >= MAX_CLAIMS).values(
+            status=EmailStatus.FAILED, lease_owner=None, lease_expires_at=None,
+            error_message=f"Lease expired {MAX_CLAIMS} times"
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    returned = db.execute(
+        update(Email).where(expired).values(
+            status=EmailStatus.NEW, lease_owner=None, lease_expires_at=None
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    reclaimed = (failed or 0) + (returned or 0)
+    if reclaimed:
+        bump_in_session(db)
+    return reclaimed
+
+
+_SQLITE_CLAIM = """
+    UPDATE emails
+    SET status = :processing, lease_owner = :owner, lease_expires_at = :expires,
+        claim_count = coalesce(claim_count, 0) + 1
+    WHERE id IN (
+        SELECT id FROM emails
+        WHERE status = :new {only_ids}
+        ORDER BY received_at, id
+        LIMIT :limit
+    )
+    RETURNING id
+"""
+
+
+def _claim_ids(db: Session, owner: str, limit: int, expires: datetime,
+               email_ids: Optional[Sequence[int]]) -> List[int]:
+    dialect = db.get_bind().dialect.name
+    values = dict(status=EmailStatus.PROCESSING, lease_owner=owner, lease_expires_at=expires,
+                  claim_count=Email.claim_count + 1)
+    candidates = select(Email.id).where(Email.status == status_literal(EmailStatus.NEW))
+    if email_ids is not None:
+        candidates = candidates.where(Email.id.in_(list(email_ids)))
+    candidates = candidates.order_by(Email.received_at, Email.id).limit(limit)
+
+    if dialect == "postgresql":
+        claim = update(Email).where(
+            Email.id.in_(candidates.with_for_update(skip_locked=True).scalar_subquery())
+        ).values(**values).returning(Email.id).execution_options(synchronize_session=False)
+        return [row[0] for row in db.execute(claim)]
+
+    if dialect == "sqlite":
+        sql = _SQLITE_CLAIM.format(only_ids="AND id IN :ids" if email_ids is not None else "")
+        params = [
+            bindparam("processing", EmailStatus.PROCESSING, type_=_columns.status.type),
+            bindparam("new", EmailStatus.NEW, type_=_columns.status.type),
+            bindparam("expires", expires, type_=_columns.lease_expires_at.type),
+            bindparam("owner", owner),
+            bindparam("limit", limit),
+        ]
+        if email_ids is not None:
+            params.append(bindparam("ids", list(email_ids), expanding=True))
+        return [row[0] for row in db.execute(text(sql).bindparams(*params))]
+
+    # Other backends: lock, then update by id
+    ids = [row[0] for row in db.execute(candidates.with_for_update(skip_locked=True))]
+    if ids:
+        db.execute(update(Email).where(Email.id.in_(ids)).values(**values)
+                   .execution_options(synchronize_session=False))
+    return ids
+
+
+def claim_emails(db: Session, owner: str, limit: int = BATCH_SIZE,
+                 lease_seconds: int = LEASE_SECONDS,
+                 email_ids: Optional[Sequence[int]] = None) -> List[Email]:
+    """Atomically lease up to ``limit`` NEW emails, oldest first. Commits.
+
+    ``email_ids`` restricts the claim to those emails (e.g. one ingest job).
+    """
+    if email_ids is not None and not email_ids:
+        return []
+    reclaim_expired(db)
+    expires = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    ids = _claim_ids(db, owner, limit, expires, email_ids)
+    if ids:
+        bump_in_session(db)
+    db.commit()
+    if not ids:
+        return []
+    return db.query(Email).options(undefer(Email.body), undefer(Email.clean_body)).filter(
+        Email.id.in_(ids)
+    ).order_by(Email.received_at, Email.id).all()
+
+
+def renew_lease(db: Session, email_id: int, owner: str,
+                lease_seconds: int = LEASE_SECONDS) -> bool:
+    """Extend a lease still held by ``owner``. Commits.
+
+    Only the lease expiry changes, which no analytics read, so the data
+    version is left alone.
+    """
+    renewed = db.execute(
+        update(Email).where(
+            Email.id == email_id,
+            Email.status == EmailStatus.PROCESSING,
+            Email.lease_owner == owner
+        ).values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def load_if_owned(db: Session, email_id: int, owner: str) -> Optional[Email]:
+    """Lock and return the email if ``owner`` still holds its lease."""
+    stored = db.query(Email).filter(Email.id == email_id).with_for_update().first()
+    if stored is None or stored.status != EmailStatus.PROCESSING or stored.lease_owner != owner:
+        return None
+    return stored
+
+
+def release(stored: Email):
+    stored.lease_owner = None
+    stored.lease_expires_at = None
+
+
+def _find_customer(sender_email: str):
+    db = SessionLocal()
+    try:
+        return EmailProcessor(db).find_customer(sender_email)
+    finally:
+        db.close()
+
+
+def save_claimed(stored: Email, owner: str, classification, response_data,
+                 error: Optional[Exception] = None):
+    """Save the result of a leased email if the lease is still ours, and release it."""
+    db = SessionLocal()
+    try:
+        owned = load_if_owned(db, stored.id, owner)
+        if owned is None:
+            telemetry.log(f"Lease on email {stored.id} lost before save; result discarded")
+            return
+        if error is not None:
+            owned.status = EmailStatus.FAILED
+            owned.error_message = str(error)
+        else:
+            EmailProcessor(db).apply(owned, classification, response_data)
+        release(owned)
+        with telemetry.timed("db_commit"):
+            db.commit()
+        telemetry.emails_processed.inc(1, "worker", "failed" if error is not None else "processed")
+    except Exception as e:
+        db.rollback()
+        telemetry.log(f"Error saving classification for email {stored.id}: {str(e)}")
+    finally:
+        db.close()
+
+
+async def process_claimed(stored: Email, owner: str, processor: EmailProcessor):
+    """Classify a leased email without holding a connection, then save if still owned.
+
+    The sync database steps run in the threadpool, so the event loop (the
+    API's, for ingest jobs) keeps serving while they wait on the database.
+    """
+    error: Optional[Exception] = None
+    classification = response_data = None
+    customer = await run_in_threadpool(_find_customer, stored.sender_email)
+    try:
+        classification, response_data = await processor.analyze(stored, customer)
+    except Exception as e:
+        error = e
+    await run_in_threadpool(save_claimed, stored, owner, classification, response_data, error)
+
+
+def _claim_batch(owner: str, batch_size: int, lease_seconds: int) -> List[Email]:
+    db = SessionLocal()
+    try:
+        return claim_emails(db, owner, batch_size, lease_seconds)
+    finally:
+        db.close()
+
+
+async def run_worker(owner: str, batch_size: int = BATCH_SIZE, concurrency: int = 4,
+                     lease_seconds: int = LEASE_SECONDS, once: bool = False):
+    """Claim and process batches until stopped (or one pass with ``once``)."""
+    processor = EmailProcessor(None)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(stored: Email):
+        async with semaphore:
+            with telemetry.tracing():
+                await process_claimed(stored, owner, processor)
+
+    while True:
+        claimed = await run_in_threadpool(_claim_batch, owner, batch_size, lease_seconds)
+
+        if claimed:
+            telemetry.log(f"Worker {owner} claimed {len(claimed)} emails")
+            await asyncio.gather(*(process(stored) for stored in claimed))
+        if once:
+            return
+        if not claimed:
+            await asyncio.sleep(POLL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leased email processing worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    work = sub.add_parser("work", help="Claim and classify NEW emails until stopped")
+    work.add_argument("--worker-id", default=default_owner())
+    work.add_argument("--batch", type=int, default=BATCH_SIZE)
+    work.add_argument("--concurrency", type=int, default=4)
+    work.add_argument("--lease", type=int, default=LEASE_SECONDS, help="Lease length in seconds")
+    work.add_argument("--once", action="store_true", help="Process one batch and exit")
+    sub.add_parser("reclaim", help="Return expired leases to the queue and exit")
+    args = parser.parse_args()
+
+    if args.command == "reclaim":
+        db = SessionLocal()
+        try:
+            count = reclaim_expired(db)
+            db.commit()
+        finally:
+            db.close()
+        telemetry.log(f"Reclaimed {count} expired leases")
+        return
+
+    asyncio.run(run_worker(args.worker_id, args.batch, args.concurrency, args.lease, args.once))
+
+
+if __name__ == "__main__":
+    main()
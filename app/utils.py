@@ -1,14 +1,23 @@
-from textblob import TextBlob
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from typing import Dict, Any
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Day, Tick
+from sqlalchemy import column, select, table
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Iterable, Optional, Sequence
 
-def calculate_sentiment(text: str) -> float:
+from .services.sentiment import get_sentiment_backend
+
+def calculate_sentiment(text: str, backend: Optional[str] = None) -> float:
     """Calculate sentiment score for given text"""
     if not text:
         return 0.0
-    analysis = TextBlob(text)
-    return analysis.sentiment.polarity
+    return get_sentiment_backend(backend).score(text)
+
+def calculate_sentiment_batch(texts: Iterable[str], backend: Optional[str] = None) -> np.ndarray:
+    """Calculate sentiment scores for many texts in one call"""
+    return get_sentiment_backend(backend).score_batch(texts)
 
 def categorize_content(subject: str, body: str) -> tuple:
     """Categorize content based on subject and body"""
@@ -45,10 +54,12 @@ def determine_urgency(subject: str, body: str) -> str:
 def process_csv_data(df: pd.DataFrame) -> list:
     """Process CSV data and return list of tickets"""
     processed_data = []
+    rows = [row for _, row in df.iterrows()]
+    bodies = [row.get('body', '') or row.get('content', '') for row in rows]
+    sentiments = calculate_sentiment_batch(bodies)
     
-    for _, row in df.iterrows():
+    for row, body, sentiment in zip(rows, bodies, sentiments):
         subject = row.get('subject', '')
-        body = row.get('body', '') or row.get('content', '')
         
         main_cat, sub_cat = categorize_content(subject, body)
         
@@ -58,7 +69,7 @@ def process_csv_data(df: pd.DataFrame) -> list:
             'sub_category': sub_cat,
             'urgency_level': determine_urgency(subject, body),
             'content': body,
-            'sentiment_score': calculate_sentiment(body),
+            'sentiment_score': float(sentiment),
             'email_id': row.get('email_id'),
             'subject': subject,
             'from_address': row.get('from_address'),
@@ -67,39 +78,117 @@ def process_csv_data(df: pd.DataFrame) -> list:
     
     return processed_data
 
-def calculate_metrics(tickets: list) -> Dict[str, Any]:
-    """Calculate metrics from tickets"""
+TICKET_METRIC_COLUMNS = ('date', 'main_category', 'urgency_level', 'sentiment_score')
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+_tickets_table = table('tickets', *(column(name) for name in TICKET_METRIC_COLUMNS))
+
+def fetch_ticket_columns(db: Session,
+                         start_date: Optional[datetime] = None,
+                         end_date: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """Load the metric columns for tickets as arrays, skipping ORM hydration"""
+    query = select(*_tickets_table.columns)
+    if start_date:
+        query = query.where(_tickets_table.c.date >= start_date)
+    if end_date:
+        query = query.where(_tickets_table.c.date <= end_date)
+
+    df = pd.read_sql(query, db.connection(), parse_dates=['date'])
+    return {name: df[name].to_numpy() for name in TICKET_METRIC_COLUMNS}
+
+def _count_values(values: np.ndarray) -> Dict[Any, int]:
+    """Count occurrences of each value, keeping missing values under None"""
+    codes, uniques = pd.factorize(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    result = {value: int(count) for value, count in zip(uniques.tolist(), counts.tolist())}
+    missing = int((codes < 0).sum())
+    if missing:
+        result[None] = missing
+    return result
+
+def _bucket_dates(dates: np.ndarray, bucket: str) -> Dict[str, int]:
+    """Count dates per time bucket (any pandas offset alias, e.g. 1D, 15min, W, M)"""
+    index = pd.DatetimeIndex(dates).dropna()
+    if index.empty:
+        return {}
+
+    try:
+        offset = to_offset(bucket)
+    except ValueError:
+        # Period-only aliases (M, Q, Y on newer pandas)
+        offset = None
+
+    if isinstance(offset, Tick):
+        step = offset.nanos
+        ns = index.asi8
+        keys, counts = np.unique(ns - ns % step, return_counts=True)
+        starts = pd.to_datetime(keys)
+        fmt = '%Y-%m-%d' if step % Day(1).nanos == 0 else '%Y-%m-%d %H:%M'
+    else:
+        per_period = index.to_period(bucket).value_counts().sort_index()
+        starts = per_period.index.start_time
+        counts = per_period.to_numpy()
+        fmt = '%Y-%m-%d'
+
+    return dict(zip(starts.strftime(fmt), counts.tolist()))
+
+def calculate_metrics_columnar(dates: np.ndarray,
+                               categories: np.ndarray,
+                               urgencies: np.ndarray,
+                               sentiments: np.ndarray,
+                               bucket: str = '1D',
+                               percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+    """Calculate metrics from parallel column arrays"""
     metrics = {
         'categoryDistribution': {},
         'timeDistribution': {},
         'urgencyDistribution': {},
-        'averageSentiment': 0
+        'averageSentiment': 0,
+        'sentimentStats': {}
     }
-    
-    if not tickets:
+
+    if len(dates) == 0:
         return metrics
-    
-    total_sentiment = 0
-    
-    for ticket in tickets:
-        # Category distribution
-        category = ticket.main_category
-        metrics['categoryDistribution'][category] = \
-            metrics['categoryDistribution'].get(category, 0) + 1
-        
-        # Time distribution
-        date_key = ticket.date.strftime('%Y-%m-%d')
-        metrics['timeDistribution'][date_key] = \
-            metrics['timeDistribution'].get(date_key, 0) + 1
-        
-        # Urgency distribution
-        urgency = ticket.urgency_level
-        metrics['urgencyDistribution'][urgency] = \
-            metrics['urgencyDistribution'].get(urgency, 0) + 1
-        
-        # Sentiment
-        total_sentiment += ticket.sentiment_score
-    
-    metrics['averageSentiment'] = total_sentiment / len(tickets)
-    
-    return metrics
\ No newline at end of file
+
+    metrics['categoryDistribution'] = _count_values(np.asarray(categories, dtype=object))
+    metrics['urgencyDistribution'] = _count_values(np.asarray(urgencies, dtype=object))
+    metrics['timeDistribution'] = _bucket_dates(dates, bucket)
+
+    scores = pd.to_numeric(pd.Series(sentiments), errors='coerce').to_numpy(dtype=np.float64)
+    scores = scores[~np.isnan(scores)]
+    if scores.size:
+        metrics['averageSentiment'] = float(scores.mean())
+        stats = {'median': float(np.median(scores))}
+        if percentiles:
+            values = np.percentile(scores, percentiles)
+            stats.update({f'p{p:g}': float(v) for p, v in zip(percentiles, values)})
+        metrics['sentimentStats'] = stats
+
+    return metrics
+
+def calculate_metrics(tickets: list, bucket: str = '1D') -> Dict[str, Any]:
+    """Calculate metrics from tickets"""
+    if not tickets:
+        return calculate_metrics_columnar([], [], [], [], bucket)
+
+    return calculate_metrics_columnar(
+        np.array([t.date for t in tickets], dtype='datetime64[ns]'),
+        np.array([t.main_category for t in tickets], dtype=object),
+        np.array([t.urgency_level for t in tickets], dtype=object),
+        np.array([t.sentiment_score for t in tickets], dtype=np.float64),
+        bucket
+    )
+
+def calculate_ticket_metrics(db: Session,
+                             start_date: Optional[datetime] = None,
+                             end_date: Optional[datetime] = None,
+                             bucket: str = '1D') -> Dict[str, Any]:
+    """Calculate metrics for the tickets table straight from a column SELECT"""
+    columns = fetch_ticket_columns(db, start_date, end_date)
+    return calculate_metrics_columnar(
+        columns['date'],
+        columns['main_category'],
+        columns['urgency_level'],
+        columns['sentiment_score'],
+        bucket
+    )
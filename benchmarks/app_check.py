@@ -0,0 +1,90 @@
+"""Check the wiring of the app built by ``app.main.create_app``.
+
+Usage:
+    DATABASE_URL=sqlite:///app_check.db python -m benchmarks.app_check
+
+Sends requests through the full app, middleware included, and checks
+that ``/metrics`` serves the Prometheus exposition, and that every
+response carries ``X-Trace-Id``: the caller's own when it sent one, a
+fresh one otherwise. With SQL profiling switched on, a request that
+queries must report its statements in ``Server-Timing`` and in the
+per-route totals. ``/emails/pending`` and ``/emails/search`` leave the
+body out unless ``include_body`` is set. Exits 1 on failure.
+"""
+import asyncio
+import sys
+
+import httpx
+
+from app.database import Base, SessionLocal, engine
+from app.main import create_app
+from app.models.email import Email
+from app.services import telemetry
+from app.services.body_extraction import fill_derived
+from app.services.sql_profiler import profiler
+
+TRACE_ID = "appcheck00000001"
+MESSAGE_ID = "<app-check@example.com>"
+BODY = "<p>The appcheck router needs a restart.</p>"
+
+
+def store_email():
+    with SessionLocal() as db:
+        if db.query(Email.id).filter(Email.message_id == MESSAGE_ID).first() is None:
+            email = Email(message_id=MESSAGE_ID, sender_email="customer@example.com",
+                          recipient_email="support@slyfone.com", subject="Router", body=BODY)
+            fill_derived(email)
+            db.add(email)
+            db.commit()
+
+
+def bodies(response) -> list:
+    """The body of the check email in a list response: missing, or its value."""
+    return [item.get("body", "missing") for item in response.json() if item["message_id"] == MESSAGE_ID]
+
+
+async def check() -> bool:
+    Base.metadata.create_all(engine)
+    store_email()
+    results = []
+    async with httpx.AsyncClient(app=create_app(), base_url="http://check") as client:
+        response = await client.get("/metrics", headers={telemetry.TRACE_HEADER: TRACE_ID})
+        results.append(("/metrics", response.status_code == 200
+                        and response.headers["content-type"].startswith(telemetry.CONTENT_TYPE)
+                        and "email_queue_depth" in response.text))
+        results.append(("trace id echoed", response.headers.get(telemetry.TRACE_HEADER) == TRACE_ID))
+
+        response = await client.get("/emails/pending")
+        trace_id = response.headers.get(telemetry.TRACE_HEADER) or ""
+        results.append(("trace id started", response.status_code == 200
+                        and len(trace_id) == 16 and trace_id != TRACE_ID))
+
+        enabled = profiler.enabled
+        profiler.configure(enabled=True)
+        profiler.reset()
+        try:
+            response = await client.get("/emails/pending")
+        finally:
+            profiler.configure(enabled=enabled)
+        timing = response.headers.get("Server-Timing", "")
+        routes = {stats["route"]: stats for stats in profiler.route_stats()}
+        results.append(("Server-Timing", timing.startswith("db;dur=") and "app;dur=" in timing))
+        results.append(("route profile", routes.get("GET /emails/pending", {}).get("queries", 0) > 0))
+
+        for path, params in (("/emails/pending", {}), ("/emails/search", {"query": "appcheck"})):
+            without = await client.get(path, params=params)
+            with_body = await client.get(path, params={**params, "include_body": "true"})
+            results.append((f"{path.split('/')[-1]} body", bodies(without) == ["missing"]
+                            and bodies(with_body) == [BODY]))
+    for name, passed in results:
+        print(f"  {name:<18} {'ok' if passed else 'FAIL'}")
+    return all(passed for _, passed in results)
+
+
+def main():
+    if not asyncio.run(check()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
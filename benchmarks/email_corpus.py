@@ -0,0 +1,198 @@
+"""Synthetic SLYFONE support mail for the pipeline benchmark.
+
+Usage:
+    python -m benchmarks.email_corpus --emails 200 --out corpus/
+
+``generate`` builds a reproducible mailbox of RFC 822 messages. They are
+written by customers of a virtual phone number service about the
+categories the classifier knows. The mix is controlled by ``CorpusMix``:
+
+* sizes, from one-line notes to long complaints with quoted history;
+* plain text, or HTML with a plain-text stub;
+* attachments (screenshots, invoices) of a few to a few hundred KB;
+* replies that continue an earlier thread through In-Reply-To and
+  References;
+* re-deliveries of an earlier message with the same Message-ID, which
+  must be stored once;
+* auto-replies, which the poller must skip.
+
+The same seed always gives the same bytes, so benchmark runs are
+comparable.
+"""
+import argparse
+import random
+from dataclasses import dataclass
+from email.message import EmailMessage
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import List
+
+START = datetime(2024, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+# Opening lines per category, in the customer's words
+TOPICS = {
+    "Account_Issues": [
+        "I can't log in to my SLYFONE account, it keeps saying the password is wrong.",
+        "Please change the email address on my account, I no longer use the old one.",
+        "I want to delete my account and all of my data.",
+    ],
+    "Payment_Billing": [
+        "I was charged twice for my monthly subscription and want a refund.",
+        "My card payment failed but the money left my bank account.",
+        "Why did my credit balance drop by $10 without any calls?",
+    ],
+    "Technical_Issues": [
+        "The app crashes every time I open the dialer.",
+        "Incoming calls to my virtual number never ring on my phone.",
+        "SMS messages arrive hours late or not at all.",
+    ],
+    "Number_Management": [
+        "I'd like to port my existing number to SLYFONE.",
+        "Can I get a second number in a different area code?",
+        "My number was cancelled by mistake, please restore it.",
+    ],
+    "Service_Questions": [
+        "Does SLYFONE work in Canada and Mexico?",
+        "What is the difference between the Basic and Pro plans?",
+        "How do I set up call forwarding to my office line?",
+    ],
+    "WhatsApp_Related": [
+        "WhatsApp never sends the verification code to my SLYFONE number.",
+        "My WhatsApp account on this number was banned, what can I do?",
+        "The OTP for WhatsApp expires before it arrives.",
+    ],
+    "Other": [
+        "I just wanted to say your support team was great last week.",
+        "Do you have a referral program?",
+    ],
+}
+DETAILS = [
+    "I have tried restarting the app and reinstalling it.",
+    "This started after the latest update.",
+    "I need this fixed today, I use the number for work.",
+    "My account ID is ACC{account}.",
+    "I'm on iOS 17 with the latest version of the app.",
+    "I'm on Android 14, Samsung Galaxy S23.",
+    "I already contacted you about this last week and got no answer.",
+    "Please call me back or reply to this email.",
+]
+SIGNATURE = "\n\n--\n{name}\nSent from my iPhone"
+NAMES = ["Maria Lopez", "James Chen", "Aisha Khan", "Tom Becker", "Yuki Tanaka", "Olu Adeyemi",
+         "Sofia Rossi", "Liam O'Brien", "Priya Nair", "Jonas Berg"]
+
+
+@dataclass
+class CorpusMix:
+    """Shares of each kind of message, as fractions of the corpus."""
+
+    html: float = 0.4
+    attachments: float = 0.1
+    replies: float = 0.2
+    duplicates: float = 0.03
+    auto_replies: float = 0.02
+    large: float = 0.1
+    customers: int = 200
+
+
+def _body(rng: random.Random, category: str, large: bool, account: int) -> str:
+    lines = [rng.choice(TOPICS[category])]
+    lines += [rng.choice(DETAILS).format(account=account) for _ in range(rng.randrange(1, 4))]
+    if large:
+        # A long complaint with a pasted log, as customers do
+        lines += [rng.choice(DETAILS).format(account=account) for _ in range(rng.randrange(20, 60))]
+        lines += [f"{START + timedelta(minutes=i)} call failed: SIP 480 Temporarily Unavailable"
+                  for i in range(rng.randrange(50, 200))]
+    return "\n\n".join(lines)
+
+
+def _html(text: str) -> str:
+    paragraphs = "".join(f"<p style='margin:0 0 8px'>{line}</p>" for line in text.split("\n\n"))
+    return (f"<html><head><style>p{{font-family:Arial}}</style></head>"
+            f"<body><div dir='ltr'>{paragraphs}</div></body></html>")
+
+
+def _attach(rng: random.Random, message: EmailMessage):
+    kind = rng.choice(("screenshot", "invoice"))
+    size = rng.choice((20_000, 80_000, 300_000))
+    data = rng.getrandbits(8 * size).to_bytes(size, "little")
+    if kind == "screenshot":
+        message.add_attachment(data, maintype="image", subtype="png", filename="screenshot.png")
+    else:
+        message.add_attachment(data, maintype="application", subtype="pdf", filename="invoice.pdf")
+
+
+def generate(count: int, seed: int = 7, mix: CorpusMix = CorpusMix()) -> List[bytes]:
+    """``count`` raw messages in arrival order."""
+    rng = random.Random(seed)
+    categories = list(TOPICS)
+    sent: List[EmailMessage] = []
+    messages: List[bytes] = []
+    for i in range(count):
+        roll = rng.random()
+        if sent and roll < mix.duplicates:
+            # The provider delivers an earlier message again
+            messages.append(rng.choice(messages))
+            continue
+        customer = rng.randrange(mix.customers)
+        name = NAMES[customer % len(NAMES)]
+        message = EmailMessage()
+        message["From"] = f"{name} <customer{customer}@example.com>"
+        message["To"] = "support@slyfone.com"
+        message["Date"] = format_datetime(START + timedelta(seconds=37 * i))
+        message["Message-ID"] = f"<bench-{seed}-{i}@example.com>"
+
+        if roll < mix.duplicates + mix.auto_replies:
+            message["Subject"] = "Automatic reply: out of office"
+            message["Auto-Submitted"] = "auto-replied"
+            message.set_content("I am out of the office until Monday with limited access to email.")
+            sent.append(message)
+            messages.append(message.as_bytes())
+            continue
+
+        parent = None
+        if sent and rng.random() < mix.replies:
+            parent = rng.choice(sent[-50:])
+        category = rng.choice(categories)
+        text = _body(rng, category, rng.random() < mix.large, customer) + SIGNATURE.format(name=name)
+        if parent is not None:
+            references = (parent.get("References", "") + " " + parent["Message-ID"]).strip()
+            subject = parent["Subject"]
+            message["Subject"] = subject if subject.startswith("Re: ") else "Re: " + subject
+            message["In-Reply-To"] = parent["Message-ID"]
+            message["References"] = references
+            quoted = "\n".join("> " + line for line in str(parent.get_body(("plain",)).get_content()).splitlines())
+            text += f"\n\nOn {parent['Date']}, {parent['From']} wrote:\n{quoted}"
+        else:
+            message["Subject"] = f"{category.replace('_', ' ')}: " + rng.choice(TOPICS[category])[:40]
+
+        message.set_content(text)
+        if rng.random() < mix.html:
+            message.add_alternative(_html(text), subtype="html")
+        if rng.random() < mix.attachments:
+            _attach(rng, message)
+        # Fixed MIME boundaries instead of random ones, so the bytes are reproducible
+        for j, part in enumerate(message.walk()):
+            if part.is_multipart():
+                part.set_boundary(f"==bench-{seed}-{i}-{j}==")
+        sent.append(message)
+        messages.append(message.as_bytes())
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", type=Path, required=True, help="Directory for the .eml files")
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    messages = generate(args.emails, args.seed)
+    for i, raw in enumerate(messages):
+        (args.out / f"{i:06d}.eml").write_bytes(raw)
+    print(f"Wrote {len(messages)} messages ({sum(map(len, messages)) / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
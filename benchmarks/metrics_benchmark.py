@@ -0,0 +1,104 @@
+"""Benchmark ticket metrics: per-object loop vs. columnar engine.
+
+Usage:
+    python -m benchmarks.metrics_benchmark [--rows 1000000] [--sqlite]
+
+With ``--sqlite`` the synthetic tickets are also written to an in-memory
+SQLite ``tickets`` table and the full SELECT + aggregate path is timed.
+"""
+import argparse
+import time
+from types import SimpleNamespace
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.utils import calculate_metrics_columnar, calculate_ticket_metrics
+
+CATEGORIES = ['Technical Issue', 'Account', 'Billing', 'Feature Request',
+              'General Inquiry', 'Other']
+URGENCIES = ['High', 'Medium', 'Low']
+
+
+def generate_columns(rows: int, seed: int = 7) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2024-01-01T00:00:00', 'ns')
+    offsets = rng.integers(0, 365 * 24 * 3600, rows).astype('timedelta64[s]')
+    return {
+        'date': start + offsets,
+        'main_category': np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)],
+        'urgency_level': np.array(URGENCIES, dtype=object)[rng.integers(0, len(URGENCIES), rows)],
+        'sentiment_score': rng.uniform(-1, 1, rows),
+    }
+
+
+def loop_metrics(tickets: list) -> Dict[str, Any]:
+    """The original per-ticket implementation, kept as the baseline."""
+    metrics = {'categoryDistribution': {}, 'timeDistribution': {},
+               'urgencyDistribution': {}, 'averageSentiment': 0}
+    total_sentiment = 0
+    for ticket in tickets:
+        category = ticket.main_category
+        metrics['categoryDistribution'][category] = \
+            metrics['categoryDistribution'].get(category, 0) + 1
+        date_key = ticket.date.strftime('%Y-%m-%d')
+        metrics['timeDistribution'][date_key] = \
+            metrics['timeDistribution'].get(date_key, 0) + 1
+        urgency = ticket.urgency_level
+        metrics['urgencyDistribution'][urgency] = \
+            metrics['urgencyDistribution'].get(urgency, 0) + 1
+        total_sentiment += ticket.sentiment_score
+    metrics['averageSentiment'] = total_sentiment / len(tickets)
+    return metrics
+
+
+def timed(label: str, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label:<36} {time.perf_counter() - started:>8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--sqlite', action='store_true', help='Also time the SELECT path on SQLite')
+    args = parser.parse_args()
+
+    columns = generate_columns(args.rows)
+    print(f"tickets: {args.rows}")
+
+    tickets = [
+        SimpleNamespace(date=d, main_category=c, urgency_level=u, sentiment_score=s)
+        for d, c, u, s in zip(pd.DatetimeIndex(columns['date']).to_pydatetime(),
+                              columns['main_category'], columns['urgency_level'],
+                              columns['sentiment_score'].tolist())
+    ]
+    baseline = timed('loop over objects', loop_metrics, tickets)
+    del tickets
+
+    columnar = timed('columnar (1D buckets)', calculate_metrics_columnar,
+                     columns['date'], columns['main_category'],
+                     columns['urgency_level'], columns['sentiment_score'])
+    timed('columnar (1h buckets)', calculate_metrics_columnar,
+          columns['date'], columns['main_category'],
+          columns['urgency_level'], columns['sentiment_score'], bucket='1h')
+
+    for key in ('categoryDistribution', 'timeDistribution', 'urgencyDistribution'):
+        assert baseline[key] == columnar[key], f"{key} mismatch"
+    assert abs(baseline['averageSentiment'] - columnar['averageSentiment']) < 1e-9
+
+    if args.sqlite:
+        engine = create_engine('sqlite://')
+        frame = pd.DataFrame(columns)
+        frame['date'] = pd.to_datetime(frame['date'])
+        timed('seed sqlite', frame.to_sql, 'tickets', engine, index=False, chunksize=50_000)
+        with Session(engine) as db:
+            timed('SELECT + columnar', calculate_ticket_metrics, db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""End-to-end pipeline benchmark: IMAP poll -> classify -> respond -> SMTP send.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--scenario baseline] [--scenario all]
+        [--emails 300] [--send-concurrency 8] [--save results.json]
+        [--compare baseline.json --tolerance 0.15]
+
+Every scenario runs the real ``EmailPoller`` against the servers from
+``benchmarks.stub_servers``:
+
+* an IMAP mailbox holding a ``benchmarks.email_corpus`` corpus;
+* an aiosmtpd sink;
+* a fake Anthropic API, which ``AsyncAnthropic`` reaches through
+  ``ANTHROPIC_BASE_URL``.
+
+The poller stores, classifies and drafts a reply for each message. The
+poller does not send, so a sender loop runs next to it, as the API's
+send path would. It picks up unsent responses and sends them through
+``EmailSender``.
+
+Each scenario runs in a fresh process with its own SQLite database, so
+settings, engines, caches and peak RSS do not leak between scenarios.
+Reported per scenario:
+
+* emails per second, end to end;
+* p50/p99 of each pipeline stage, from the telemetry histograms'
+  raw samples;
+* stage errors, LLM requests and rate-limit responses;
+* messages sent, and peak RSS of the pipeline process.
+
+``--save`` writes the results as JSON. ``--compare`` checks a run
+against saved results and exits non-zero when a scenario's throughput
+drops by more than ``--tolerance``, so it can gate a deploy.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+from benchmarks.email_corpus import CorpusMix, generate
+from benchmarks.stub_servers import StubConfig, StubServers
+
+SCENARIOS = {
+    "baseline": (StubConfig(llm_latency_ms=50, llm_jitter_ms=20, imap_latency_ms=1), CorpusMix()),
+    "slow_llm": (StubConfig(llm_latency_ms=400, llm_jitter_ms=150, imap_latency_ms=1), CorpusMix()),
+    "rate_limited": (StubConfig(llm_latency_ms=50, llm_jitter_ms=20, llm_rate_limit=8, llm_burst=4,
+                                imap_latency_ms=1), CorpusMix()),
+    "flaky_llm": (StubConfig(llm_latency_ms=50, llm_jitter_ms=20, llm_error_rate=0.1,
+                             imap_latency_ms=1), CorpusMix()),
+    "heavy_mail": (StubConfig(llm_latency_ms=50, llm_jitter_ms=20, imap_latency_ms=5),
+                   CorpusMix(html=0.8, attachments=0.4, large=0.5)),
+}
+STAGES = ("imap_fetch", "mime_parse", "classify", "generate", "db_commit", "smtp_send")
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def _configure_environment(stubs: StubServers, database: Path, max_per_fetch: int):
+    """Point the app's settings at the stubs; must run before ``app`` is imported."""
+    config = stubs.config
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{database}",
+        "IMAP_SERVER": "127.0.0.1", "IMAP_PORT": str(config.imap_port), "IMAP_USE_SSL": "false",
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(config.smtp_port), "SMTP_USE_TLS": "false",
+        "SMTP_USER": "bench", "SMTP_PASSWORD": "bench",
+        "ANTHROPIC_API_KEY": "bench", "ANTHROPIC_BASE_URL": stubs.llm_url,
+        "MAX_EMAILS_PER_FETCH": str(max_per_fetch),
+        "CUSTOMER_COUNTER_FLUSH_SECONDS": "1",
+    })
+
+
+async def _drive(send_concurrency: int) -> Dict:
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload, undefer
+
+    from app.database import AsyncSessionLocal, Base, engine
+    from app.email_poller import EmailPoller
+    from app.models.email import Email, Response
+    from app.services import telemetry
+    from app.services.email_sender import EmailSender
+
+    Base.metadata.create_all(engine)
+    telemetry.stage_duration.samples = {}
+    poller = EmailPoller()
+    sender = EmailSender()
+    polling = True
+    sent = failed = 0
+
+    async def send_one(response_id: int, semaphore: asyncio.Semaphore):
+        nonlocal sent, failed
+        async with semaphore, AsyncSessionLocal() as db:
+            response = await db.get(Response, response_id, options=[
+                selectinload(Response.email).options(undefer(Email.body))
+            ])
+            with telemetry.tracing():
+                ok = await sender.send_response(response.email, response)
+            await db.commit()
+            if ok:
+                sent += 1
+            else:
+                failed += 1
+
+    async def send_loop():
+        semaphore = asyncio.Semaphore(send_concurrency)
+        while True:
+            async with AsyncSessionLocal() as db:
+                pending = (await db.execute(
+                    select(Response.id).where(Response.is_sent == False, Response.send_attempts == 0)  # noqa: E712
+                )).scalars().all()
+            if pending:
+                await asyncio.gather(*(send_one(response_id, semaphore) for response_id in pending))
+            elif not polling:
+                return
+            else:
+                await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    sending = asyncio.create_task(send_loop())
+    while True:
+        before = poller._processed_count
+        await poller.poll_emails()
+        if poller._processed_count == before:
+            break
+    polling = False
+    await sending
+    elapsed = time.perf_counter() - started
+
+    samples = telemetry.stage_duration.samples
+    return {
+        "seconds": round(elapsed, 2),
+        "processed": poller._processed_count,
+        "emails_per_second": round(poller._processed_count / elapsed, 2),
+        "sent": sent,
+        "send_failures": failed,
+        "stages": {
+            stage: {"count": len(samples.get((stage,), [])),
+                    "p50_ms": round(percentile(samples.get((stage,), []), 0.5) * 1000, 2),
+                    "p99_ms": round(percentile(samples.get((stage,), []), 0.99) * 1000, 2),
+                    "errors": int(telemetry.stage_errors.value(stage))}
+            for stage in STAGES
+        },
+        "llm_tokens": int(sum(telemetry.tokens.value(stage, kind)
+                              for stage in ("classify", "generate") for kind in ("prompt", "completion"))),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _run_scenario(name: str, emails: int, seed: int, send_concurrency: int, max_per_fetch: int,
+                  workdir: str, results):
+    config, mix = SCENARIOS[name]
+    messages = generate(emails, seed, mix)
+    database = Path(workdir) / f"pipeline_benchmark_{name}.db"
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{database}{suffix}").unlink(missing_ok=True)
+    # The pipeline's own log lines go to a file next to the database, out of the report
+    sys.stdout = open(Path(workdir) / f"pipeline_benchmark_{name}.log", "w")
+    with StubServers(config, messages) as stubs:
+        _configure_environment(stubs, database, max_per_fetch)
+        result = asyncio.run(_drive(send_concurrency))
+        stats = stubs.stats()
+    result.update(scenario=name, emails=len(messages),
+                  corpus_mb=round(sum(map(len, messages)) / 1e6, 1),
+                  llm_requests=stats["llm_requests"], llm_rate_limited=stats["llm_rate_limited"],
+                  llm_errors=stats["llm_errors"], smtp_received=stats["smtp_messages"],
+                  smtp_traced=stats["smtp_traced"])
+    results.put(result)
+
+
+def run(name: str, args) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_scenario, args=(
+        name, args.emails, args.seed, args.send_concurrency, args.max_per_fetch, args.workdir, results
+    ))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Scenario {name} failed with exit code {process.exitcode}")
+    return results.get()
+
+
+def report(result: Dict):
+    print(f"  {result['scenario']:<13} {result['emails']} emails ({result['corpus_mb']} MB)  "
+          f"{result['seconds']:7.2f} s  {result['emails_per_second']:7.2f} emails/s  "
+          f"sent {result['smtp_received']} (traced {result['smtp_traced']})  "
+          f"peak RSS {result['peak_rss_mb']} MB")
+    print(f"    llm requests {result['llm_requests']}  rate limited {result['llm_rate_limited']}  "
+          f"errors {result['llm_errors']}  tokens {result['llm_tokens']}")
+    for stage, numbers in result["stages"].items():
+        print(f"    {stage:<11} n={numbers['count']:<5} p50 {numbers['p50_ms']:8.2f} ms  "
+              f"p99 {numbers['p99_ms']:8.2f} ms  errors {numbers['errors']}")
+
+
+def compare(results, baseline_path: Path, tolerance: float) -> bool:
+    baseline = {result["scenario"]: result for result in json.loads(baseline_path.read_text())}
+    ok = True
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if previous is None:
+            continue
+        change = result["emails_per_second"] / previous["emails_per_second"] - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        print(f"  {result['scenario']:<13} {previous['emails_per_second']:7.2f} -> "
+              f"{result['emails_per_second']:7.2f} emails/s ({change:+.0%})"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=[*SCENARIOS, "all"],
+                        help="Repeatable; defaults to baseline")
+    parser.add_argument("--emails", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--send-concurrency", type=int, default=8)
+    parser.add_argument("--max-per-fetch", type=int, default=50)
+    parser.add_argument("--workdir", default=".")
+    parser.add_argument("--save", type=Path, help="Write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="Results JSON of an earlier run to check against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed throughput drop against --compare, as a fraction")
+    args = parser.parse_args()
+
+    names = args.scenario or ["baseline"]
+    if "all" in names:
+        names = list(SCENARIOS)
+    results = []
+    for name in names:
+        result = run(name, args)
+        report(result)
+        results.append(result)
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
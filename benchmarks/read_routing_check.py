@@ -0,0 +1,99 @@
+"""Check that write routes stamp X-Last-Write when they commit.
+
+Usage:
+    python -m benchmarks.read_routing_check [--delay 0.5]
+
+Serves write routes that wait ``--delay`` seconds before committing,
+from an async handler on AsyncSession and from a sync handler on a sync
+Session, plus one that never commits. Each response's ``X-Last-Write``
+must be no earlier than the commit, and ``needs_primary`` must still
+send a read to the primary with a replica lag shorter than the delay.
+The route that does not commit must not be stamped. Exits 1 on failure.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal, Base, SessionLocal, engine
+from app.models.email import Email
+from app.services.read_routing import LAST_WRITE_HEADER, mark_write, needs_primary
+
+
+def _email(tag: str) -> Email:
+    return Email(message_id=f"<read-routing-{tag}-{time.time_ns()}@example.com>",
+                 sender_email="customer@example.com", recipient_email="support@slyfone.com",
+                 subject="Read your writes", body="Check", is_reply=False)
+
+
+def build_app(delay: float) -> FastAPI:
+    app = FastAPI()
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    @app.post("/async", dependencies=[Depends(mark_write)])
+    async def async_write(db: AsyncSession = Depends(get_db)):
+        await asyncio.sleep(delay)
+        db.add(_email("async"))
+        started = time.time()
+        await db.commit()
+        return {"commit_started": started}
+
+    @app.post("/sync", dependencies=[Depends(mark_write)])
+    def sync_write():
+        time.sleep(delay)
+        db = SessionLocal()
+        try:
+            db.add(_email("sync"))
+            started = time.time()
+            db.commit()
+        finally:
+            db.close()
+        return {"commit_started": started}
+
+    @app.post("/noop", dependencies=[Depends(mark_write)])
+    async def no_write():
+        await asyncio.sleep(delay)
+        return {}
+
+    return app
+
+
+async def check(delay: float) -> bool:
+    Base.metadata.create_all(engine, tables=[Email.__table__])
+    ok = True
+    async with httpx.AsyncClient(app=build_app(delay), base_url="http://check") as client:
+        for path in ("/async", "/sync"):
+            response = await client.post(path)
+            stamp = response.headers.get(LAST_WRITE_HEADER)
+            committed = response.json()["commit_started"]
+            # The header has millisecond precision
+            passed = stamp is not None and float(stamp) >= committed - 0.001 \
+                and needs_primary(stamp, delay / 2)
+            ok = ok and passed
+            print(f"  {path:<7} commit at {committed:.3f}  {LAST_WRITE_HEADER} {stamp}  "
+                  f"{'ok' if passed else 'FAIL'}")
+        response = await client.post("/noop")
+        passed = LAST_WRITE_HEADER not in response.headers
+        ok = ok and passed
+        print(f"  /noop   {LAST_WRITE_HEADER} {response.headers.get(LAST_WRITE_HEADER)}  "
+              f"{'ok' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds each route waits before committing")
+    args = parser.parse_args()
+    if not asyncio.run(check(args.delay)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
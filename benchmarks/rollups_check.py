@@ -0,0 +1,133 @@
+"""Check that rollups agree with the raw analytics queries.
+
+Usage:
+    DATABASE_URL=sqlite:///rollups_check.db python -m benchmarks.rollups_check
+
+Point ``DATABASE_URL`` at a scratch database: the check drops and
+recreates the app's tables. It stores unclassified emails, then
+classifies them, adds responses and reclassifies some, each step in a
+session of its own as the API would. Last, more emails go through
+``process_email_async`` with a stub model, as ``/emails/process`` and
+the poller send them: stored and committed on an AsyncSession, then
+classified on the same session. After each step the rollup
+``/analytics/summary`` of the window must match the one computed from
+``emails`` and ``responses``. Exits 1 on failure.
+"""
+import asyncio
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+
+from app.api.v1 import analytics
+from app.database import AsyncSessionLocal, Base, SessionLocal, engine
+from app.models.email import Email, Response, UrgencyLevel
+from app.services import rollups
+from app.services.email_processor import EmailProcessor, process_email_async
+
+# Yesterday and today: the async step stores emails received now
+WINDOW_START = rollups.bucket_start(datetime.utcnow(), "day") - timedelta(days=1)
+WINDOW_END = WINDOW_START + timedelta(days=2)
+EMAILS = 30
+CATEGORIES = ("Billing", "Technical", "Account")
+
+
+def summaries(db):
+    rollup = rollups.summary_from_rollups(db, WINDOW_START, WINDOW_END)
+    os.environ["ANALYTICS_ROLLUPS"] = "false"
+    try:
+        raw = analytics._summary(db, WINDOW_START, WINDOW_END, include_archived=True)
+    finally:
+        del os.environ["ANALYTICS_ROLLUPS"]
+    return rollup, raw
+
+
+def agree(rollup, raw) -> bool:
+    hours = rollup["avg_response_time_hours"], raw["avg_response_time_hours"]
+    same_hours = hours[0] is hours[1] is None or (
+        None not in hours and math.isclose(*hours, rel_tol=1e-6)
+    )
+    return same_hours and all(rollup[key] == raw[key] for key in
+                              ("total_emails", "category_distribution", "sentiment_distribution"))
+
+
+def store(db):
+    db.add_all(Email(message_id=f"<rollups-check-{i}@example.com>", sender_email="customer@example.com",
+                     recipient_email="support@slyfone.com", subject="Rollups", body="Check",
+                     received_at=WINDOW_START + timedelta(minutes=90 * i), is_reply=False)
+               for i in range(EMAILS))
+
+
+def classify(db):
+    for i, email in enumerate(db.query(Email).order_by(Email.id)):
+        email.main_category = CATEGORIES[i % len(CATEGORIES)]
+        email.sub_category = "General"
+        email.sentiment_score = (i % 5 - 2) / 2
+        email.urgency = list(UrgencyLevel)[i % len(UrgencyLevel)]
+        db.add(Response(email_id=email.id, content="Thanks",
+                        created_at=email.received_at + timedelta(minutes=20 + i)))
+
+
+def reclassify(db):
+    for email in db.query(Email).filter(Email.main_category == "Billing"):
+        email.main_category = "Technical"
+        email.sentiment_score = None
+
+
+class StubClassifier:
+    async def classify_email(self, email_data):
+        return {"main_category": "Billing", "sub_category": "Refund_Request", "sentiment_score": -0.6,
+                "urgency": "high", "confidence": 0.9, "keywords": ["refund"]}
+
+
+class StubGenerator:
+    model = "stub"
+
+    async def generate_response(self, email, classification, customer):
+        return {"response_text": "Thanks, we are on it."}
+
+
+def process_async(db):
+    # Its own AsyncSessions; the sync session of the step stays unused
+    async def run():
+        processor = EmailProcessor(None, StubClassifier(), StubGenerator())
+        for i in range(EMAILS // 3):
+            async with AsyncSessionLocal() as session:
+                if await process_email_async(session, {
+                    "message_id": f"<rollups-check-async-{i}@example.com>",
+                    "sender_email": "customer@example.com", "recipient_email": "support@slyfone.com",
+                    "subject": "Charged twice", "body": "Please refund the second charge.",
+                }, processor) is None:
+                    raise RuntimeError("process_email_async failed")
+
+    asyncio.run(run())
+
+
+STEPS = [("store", store), ("classify", classify), ("reclassify", reclassify), ("async", process_async)]
+
+
+def check() -> bool:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    ok = True
+    for name, step in STEPS:
+        with SessionLocal() as db:
+            step(db)
+            db.commit()
+        with SessionLocal() as db:
+            rollup, raw = summaries(db)
+        passed = agree(rollup, raw)
+        ok = ok and passed
+        print(f"  {name:<11} {'ok' if passed else 'FAIL'}")
+        if not passed:
+            print(f"    rollups {rollup}\n    raw     {raw}")
+    return ok
+
+
+def main():
+    if not check():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
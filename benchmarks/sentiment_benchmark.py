@@ -0,0 +1,79 @@
+"""Compare sentiment backends for speed and agreement on a ticket CSV.
+
+Usage:
+    python -m benchmarks.sentiment_benchmark tickets.csv [--limit N]
+
+The CSV uses the same columns as the upload path (``body`` or ``content``).
+TextBlob is treated as the reference; every other backend is reported
+against it.
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from app.services.sentiment import available_backends, get_sentiment_backend
+
+# Same cut-offs the analytics summary uses for its sentiment distribution
+BUCKET_THRESHOLD = 0.3
+SIGN_THRESHOLD = 0.05
+
+
+def load_corpus(path: str, limit: int = 0) -> List[str]:
+    df = pd.read_csv(path)
+    column = 'body' if 'body' in df.columns else 'content'
+    texts = df[column].fillna('').astype(str).tolist()
+    return texts[:limit] if limit else texts
+
+
+def bucketize(scores: np.ndarray, threshold: float) -> np.ndarray:
+    return np.where(scores > threshold, 1, np.where(scores < -threshold, -1, 0))
+
+
+def run(texts: List[str], repeat: int = 3) -> None:
+    results = {}
+    for name in available_backends():
+        backend = get_sentiment_backend(name)
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            scores = backend.score_batch(texts)
+            best = min(best, time.perf_counter() - started)
+        results[name] = (scores, best)
+
+    reference, reference_time = results['textblob']
+    print(f"corpus: {len(texts)} texts")
+    print(f"{'backend':<10} {'texts/s':>12} {'speedup':>8} {'pearson':>8} "
+          f"{'sign':>7} {'bucket':>7} {'mae':>7}")
+    for name, (scores, elapsed) in results.items():
+        rate = len(texts) / elapsed if elapsed else float('inf')
+        speedup = reference_time / elapsed if elapsed else float('inf')
+        if np.std(scores) and np.std(reference):
+            pearson = float(np.corrcoef(scores, reference)[0, 1])
+        else:
+            pearson = float('nan')
+        sign = float(np.mean(
+            bucketize(scores, SIGN_THRESHOLD) == bucketize(reference, SIGN_THRESHOLD)
+        ))
+        bucket = float(np.mean(
+            bucketize(scores, BUCKET_THRESHOLD) == bucketize(reference, BUCKET_THRESHOLD)
+        ))
+        mae = float(np.mean(np.abs(scores - reference)))
+        print(f"{name:<10} {rate:>12.0f} {speedup:>7.1f}x {pearson:>8.3f} "
+              f"{sign:>7.1%} {bucket:>7.1%} {mae:>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv', help='Ticket CSV with a body or content column')
+    parser.add_argument('--limit', type=int, default=0, help='Only score the first N rows')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per backend')
+    args = parser.parse_args()
+
+    run(load_corpus(args.csv, args.limit), repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Local stand-ins for the mail provider and the Anthropic API.
+
+``StubServers`` starts three servers in a child process, so their CPU
+and memory do not count against the pipeline being measured:
+
+* an IMAP4rev1 mailbox holding a corpus. It implements the subset the
+  poller uses: LOGIN, SELECT, SEARCH UNSEEN, FETCH RFC822 (which sets
+  \\Seen), STORE, CLOSE and LOGOUT, with an optional per-command
+  latency;
+* an ``aiosmtpd`` sink that accepts any login and counts what it
+  receives;
+* a fake ``POST /v1/messages`` Anthropic endpoint. It returns
+  classification or reply JSON depending on the prompt, and has:
+  - configurable latency with jitter;
+  - a token-bucket rate limit answering 429 with ``retry-after``, as
+    the real API does;
+  - an optional share of 529 "overloaded" errors.
+
+``GET /stats`` on the fake API reports the counters of all three.
+"""
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import time
+import urllib.request
+from dataclasses import asdict, dataclass
+from email import message_from_bytes
+from typing import Dict, List
+
+CATEGORY_HINTS = {
+    "Payment_Billing": ("Refund_Request", ("charged", "refund", "payment", "credit", "card")),
+    "WhatsApp_Related": ("Verification_Issues", ("whatsapp", "otp")),
+    "Technical_Issues": ("App_Not_Working", ("crash", "ring", "sms", "calls")),
+    "Number_Management": ("Port_Number", ("port", "number was cancelled", "second number")),
+    "Account_Issues": ("Login_Problems", ("log in", "password", "delete my account", "email address")),
+    "Service_Questions": ("Features_Inquiry", ("plan", "forwarding", "canada")),
+}
+
+
+@dataclass
+class StubConfig:
+    imap_port: int = 0
+    smtp_port: int = 0
+    llm_port: int = 0
+    imap_latency_ms: float = 0.0
+    llm_latency_ms: float = 50.0
+    llm_jitter_ms: float = 20.0
+    # Requests per second the fake API admits (0: unlimited), and its burst
+    llm_rate_limit: float = 0.0
+    llm_burst: int = 10
+    llm_error_rate: float = 0.0
+
+    def with_free_ports(self) -> "StubConfig":
+        for name in ("imap_port", "smtp_port", "llm_port"):
+            if not getattr(self, name):
+                setattr(self, name, free_port())
+        return self
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Mailbox:
+    def __init__(self, messages: List[bytes]):
+        self.messages = messages
+        self.seen = set()
+
+
+class ImapStub:
+    """Just enough IMAP4rev1 for ``aioimaplib`` and ``EmailPoller``."""
+
+    def __init__(self, mailbox: Mailbox, stats: Dict, latency_ms: float = 0.0):
+        self.mailbox = mailbox
+        self.stats = stats
+        self.latency = latency_ms / 1000
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"* OK [CAPABILITY IMAP4rev1] SLYFONE benchmark IMAP ready\r\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            tag, _, rest = line.decode().strip().partition(" ")
+            command, _, args = rest.partition(" ")
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            writer.write(self.respond(tag, command.upper(), args))
+            await writer.drain()
+            if command.upper() == "LOGOUT":
+                break
+        writer.close()
+
+    def respond(self, tag: str, command: str, args: str) -> bytes:
+        messages = self.mailbox.messages
+        if command == "CAPABILITY":
+            return f"* CAPABILITY IMAP4rev1\r\n{tag} OK CAPABILITY completed\r\n".encode()
+        if command == "LOGIN":
+            return f"{tag} OK [CAPABILITY IMAP4rev1] LOGIN completed\r\n".encode()
+        if command == "SELECT":
+            return (f"* {len(messages)} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen)\r\n"
+                    f"{tag} OK [READ-WRITE] SELECT completed\r\n").encode()
+        if command == "SEARCH":
+            unseen = " ".join(str(i + 1) for i in range(len(messages)) if i not in self.mailbox.seen)
+            return f"* SEARCH {unseen}\r\n{tag} OK SEARCH completed\r\n".encode()
+        if command == "FETCH":
+            number = int(args.split()[0])
+            raw = messages[number - 1]
+            self.mailbox.seen.add(number - 1)
+            self.stats["imap_fetches"] += 1
+            return (f"* {number} FETCH (RFC822 {{{len(raw)}}}\r\n".encode() + raw
+                    + f")\r\n{tag} OK FETCH completed\r\n".encode())
+        if command == "STORE":
+            number = int(args.split()[0])
+            if "\\Seen" in args:
+                self.mailbox.seen.add(number - 1)
+            return f"* {number} FETCH (FLAGS (\\Seen))\r\n{tag} OK STORE completed\r\n".encode()
+        if command == "LOGOUT":
+            return f"* BYE\r\n{tag} OK LOGOUT completed\r\n".encode()
+        if command in ("CLOSE", "NOOP"):
+            return f"{tag} OK {command} completed\r\n".encode()
+        return f"{tag} BAD unsupported command {command}\r\n".encode()
+
+
+class SmtpSink:
+    """aiosmtpd handler that accepts and counts every message."""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    async def handle_DATA(self, server, session, envelope):
+        self.stats["smtp_messages"] += 1
+        self.stats["smtp_bytes"] += len(envelope.content)
+        message = message_from_bytes(envelope.content)
+        if message.get("X-Trace-Id"):
+            self.stats["smtp_traced"] += 1
+        return "250 Message accepted"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 if a request may go ahead, else the seconds until one may."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _classification(prompt: str) -> Dict:
+    # Only the email itself: the instructions below it list every category
+    content = prompt.split("Subject:", 1)[-1].split("Classify this email", 1)[0].lower()
+    main, sub = "Other", "General"
+    for category, (subcategory, words) in CATEGORY_HINTS.items():
+        if any(word in content for word in words):
+            main, sub = category, subcategory
+            break
+    urgent = "today" in content or "work" in content
+    return {"main_category": main, "sub_category": sub,
+            "sentiment_score": -0.6 if "no answer" in content else -0.2,
+            "urgency": "high" if urgent else "medium", "keywords": [main.split("_")[0].lower()],
+            "customer_tone": "frustrated" if urgent else "neutral", "priority": 2 if urgent else 3,
+            "confidence": 0.9, "requires_escalation": False}
+
+
+def _reply() -> Dict:
+    return {"response_text": "Hello,\n\nThanks for reaching out. We have looked into your request and "
+                             "applied a fix on our side; please try again and let us know.\n\n"
+                             "Best regards,\nDee\nSLYFONE Support Team",
+            "suggested_actions": ["Follow up in 24 hours"], "internal_notes": "benchmark",
+            "requires_follow_up": False, "escalation_needed": False, "template_used": None}
+
+
+def llm_app(config: StubConfig, stats: Dict):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    bucket = TokenBucket(config.llm_rate_limit, config.llm_burst) if config.llm_rate_limit else None
+    rng = random.Random(11)
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        stats["llm_requests"] += 1
+        if bucket is not None:
+            wait = bucket.take()
+            if wait:
+                stats["llm_rate_limited"] += 1
+                return JSONResponse(
+                    {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limited"}},
+                    status_code=429, headers={"retry-after": f"{wait:.3f}"},
+                )
+        delay = max(0.0, rng.gauss(config.llm_latency_ms, config.llm_jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if rng.random() < config.llm_error_rate:
+            stats["llm_errors"] += 1
+            return JSONResponse({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+                                status_code=529)
+        prompt = body["messages"][0]["content"]
+        classify = "Classify this email" in prompt
+        text = json.dumps(_classification(prompt) if classify else _reply())
+        return {"id": f"msg_bench_{stats['llm_requests']}", "type": "message", "role": "assistant",
+                "model": body.get("model"), "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def _serve(config: StubConfig, messages: List[bytes]):
+    import logging
+
+    import uvicorn
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+
+    # aiosmtpd logs a warning about its own deprecated attributes on every login
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    stats = {"imap_fetches": 0, "smtp_messages": 0, "smtp_bytes": 0, "smtp_traced": 0,
+             "llm_requests": 0, "llm_rate_limited": 0, "llm_errors": 0}
+    smtp = Controller(SmtpSink(stats), hostname="127.0.0.1", port=config.smtp_port,
+                      authenticator=lambda *args: AuthResult(success=True), auth_require_tls=False)
+    smtp.start()
+
+    async def main():
+        imap = ImapStub(Mailbox(messages), stats, config.imap_latency_ms)
+        await asyncio.start_server(imap.handle, "127.0.0.1", config.imap_port)
+        server = uvicorn.Server(uvicorn.Config(llm_app(config, stats), host="127.0.0.1",
+                                               port=config.llm_port, log_level="warning"))
+        await server.serve()
+
+    try:
+        asyncio.run(main())
+    finally:
+        smtp.stop()
+
+
+class StubServers:
+    """The three stubs in a child process; use as a context manager."""
+
+    def __init__(self, config: StubConfig, messages: List[bytes]):
+        self.config = config.with_free_ports()
+        self.messages = messages
+        self.process = None
+
+    @property
+    def llm_url(self) -> str:
+        return f"http://127.0.0.1:{self.config.llm_port}"
+
+    def stats(self) -> Dict:
+        with urllib.request.urlopen(f"{self.llm_url}/stats", timeout=5) as response:
+            return json.loads(response.read())
+
+    def __enter__(self) -> "StubServers":
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(self.config, self.messages), daemon=True
+        )
+        self.process.start()
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                self.stats()
+                return self
+            except OSError:
+                if time.monotonic() > deadline or not self.process.is_alive():
+                    raise RuntimeError("Stub servers did not start")
+                time.sleep(0.1)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join(5)
+
+    def describe(self) -> Dict:
+        return asdict(self.config)
@@ -0,0 +1,84 @@
+"""Check that work claims refresh cached analytics.
+
+Usage:
+    python -m benchmarks.work_claims_check [--database-url sqlite:///work_claims_check.db]
+
+Claims and expired-lease reclaims are bulk UPDATEs, which skip the ORM
+flush listeners. The script seeds NEW emails, then claims one, lets a
+lease expire and reclaims it, and renews a lease. After each step it
+reads the shared analytics data version and this process's cached copy
+of it. A claim and a reclaim must move both. A renewal, which changes
+nothing analytics read, must not. Exits 1 on failure.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.analytics import AnalyticsDataVersion
+from app.models.email import Email, EmailStatus
+from app.services import work_claims
+from app.services.analytics_cache import data_version
+
+OWNER = "work-claims-check"
+
+
+def stored_version(db) -> int:
+    return db.execute(select(AnalyticsDataVersion.version).where(AnalyticsDataVersion.id == 1)).scalar() or 0
+
+
+def check(database_url: str) -> bool:
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(engine, tables=[Email.__table__, AnalyticsDataVersion.__table__])
+    Base.metadata.create_all(engine, tables=[Email.__table__, AnalyticsDataVersion.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add_all(Email(message_id=f"<work-claims-{i}@example.com>", sender_email="customer@example.com",
+                         recipient_email="support@slyfone.com", subject="Claim me", body="Check",
+                         received_at=datetime(2024, 1, 1) + timedelta(minutes=i),
+                         status=EmailStatus.NEW, is_reply=False) for i in range(3))
+        db.commit()
+
+    ok = True
+
+    def measure(db, name: str, moves: bool, action):
+        nonlocal ok
+        before = stored_version(db)
+        data_version.current(db)
+        action()
+        after = stored_version(db)
+        # The cached copy is re-read after a local bump, whatever its TTL
+        cached = data_version.current(db)
+        passed = (after > before and cached == after) if moves else after == before
+        ok = ok and passed
+        print(f"  {name:<8} version {before} -> {after}  cached {cached}  {'ok' if passed else 'FAIL'}")
+
+    def reclaim(db):
+        work_claims.reclaim_expired(db)
+        db.commit()
+
+    with Session() as db:
+        measure(db, "claim", True, lambda: work_claims.claim_emails(db, OWNER, limit=1))
+        db.query(Email).filter(Email.status == EmailStatus.PROCESSING).update(
+            {Email.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False
+        )
+        db.commit()
+        measure(db, "reclaim", True, lambda: reclaim(db))
+        claimed = work_claims.claim_emails(db, OWNER, limit=1)
+        measure(db, "renew", False, lambda: work_claims.renew_lease(db, claimed[0].id, OWNER))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:///work_claims_check.db")
+    args = parser.parse_args()
+    if not check(args.database_url):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()